@@ -250,6 +250,39 @@ def all_clear():
     print 'All clear!'
     return
 
+@manager.option('-t', '--terms', dest='terms', default='software,paper,vehicle repair,engine')
+@manager.option('-i', '--iterations', dest='iterations', default=10)
+def benchmark_search(terms, iterations=10):
+    '''Compares the latency of the scout search ranking strategies
+    '''
+    from purchasing.scout.benchmarks import benchmark_search as _benchmark_search
+    print '{:<20} {:<30} {:>6} {:>12} {:>10}'.format(
+        'term', 'strategy', 'rows', 'median (ms)', 'min (ms)'
+    )
+    for result in _benchmark_search(terms.split(','), int(iterations)):
+        print '{term:<20} {strategy:<30} {rows:>6} {median_ms:>12.2f} {min_ms:>10.2f}'.format(**result)
+    return
+
+@manager.option('-t', '--terms', dest='terms', default='software,paper,vehicle repair,engine')
+@manager.option('-i', '--iterations', dest='iterations', default=10)
+@manager.option('-l', '--line_items', dest='line_items', default=50000)
+def benchmark_search_layout(terms, iterations=10, line_items=50000):
+    '''Compares the size and latency of the old and new search view layouts
+    on a synthetic dataset. Nothing is saved to the database.
+    '''
+    from purchasing.scout.benchmarks import benchmark_search_layout as _benchmark_search_layout
+    results = _benchmark_search_layout(terms.split(','), int(line_items), int(iterations))
+    print '{:<20} {:>10} {:>14}'.format('layout', 'rows', 'size (bytes)')
+    for layout in ['fanout', 'per_contract']:
+        print '{:<20} {rows:>10} {bytes:>14}'.format(layout, **results['size'][layout])
+    print ''
+    print '{:<20} {:<20} {:>6} {:>12} {:>10}'.format(
+        'term', 'layout', 'rows', 'median (ms)', 'min (ms)'
+    )
+    for result in results['queries']:
+        print '{term:<20} {layout:<20} {rows:>6} {median_ms:>12.2f} {min_ms:>10.2f}'.format(**result)
+    return
+
 
 
 @manager.option('-r', '--s3user', dest='user')
@@ -284,9 +317,17 @@ def reset_conductor():
     db.session.execute(
         '''delete from contract_stage'''
     )
-    db.session.commit()
+    rebuild_conductor_dashboard()
     return
 
+@manager.command
+def rebuild_conductor_dashboard():
+    '''Rebuilds every row of the conductor dashboard from the contracts
+    '''
+    from purchasing.data.dashboard import refresh_conductor_dashboard
+    refresh_conductor_dashboard(db.session)
+    db.session.commit()
+
 @manager.command
 def schedule_work(ignore_time=False):
     from purchasing.jobs import JobBase
@@ -294,16 +335,33 @@ def schedule_work(ignore_time=False):
         job(time_override=ignore_time).schedule_job()
         db.session.commit()
 
+@manager.command
+def run_scheduler():
+    '''Runs the job scheduler, which dispatches each job at the time
+    given by its cron schedule
+    '''
+    from purchasing.jobs.scheduler import Scheduler
+    scheduler = Scheduler()
+    for job in scheduler.jobs:
+        print 'Scheduled {}: {} ({})'.format(job.__name__, job.schedule, job.schedule_timezone)
+    for task, schedule in scheduler.tasks.items():
+        print 'Scheduled {}: {} (UTC)'.format(task.name, schedule.expression)
+    scheduler.run()
+
 @manager.command
 def do_work(ignore_time=False):
-    from purchasing.jobs.job_base import JobStatus
-    turn_off_sqlalchemy_events()
-    jobs = JobStatus.query.filter(JobStatus.status == 'new').all()
-    for job in jobs:
-        task = getattr(nightly_jobs, job.name)(time_override=ignore_time)
-        task.run_job(job)
-    turn_on_sqlalchemy_events()
-    refresh_search_view()
+    from purchasing.jobs.runner import dispatch_ready_jobs
+    dispatched = dispatch_ready_jobs(ignore_time)
+    print 'Dispatched jobs: {}'.format(', '.join(dispatched) if dispatched else 'none')
+
+@manager.option('-b', '--batch_size', dest='batch_size', default=None)
+def dispatch_outbox(batch_size=None):
+    '''Sends pending emails from the email outbox, including any that
+    failed to send and are waiting to be retried
+    '''
+    from purchasing.tasks import dispatch_email_outbox
+    sent, failed = dispatch_email_outbox.run(int(batch_size) if batch_size else None)
+    print 'Sent {} emails, {} failed'.format(sent, failed)
 
 @manager.command
 def update_conductor():
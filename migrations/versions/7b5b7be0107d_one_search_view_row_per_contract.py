@@ -0,0 +1,212 @@
+"""one search view row per contract
+
+Revision ID: 7b5b7be0107d
+Revises: a88f7566e261
+Create Date: 2015-12-17 15:26:08.310547
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7b5b7be0107d'
+down_revision = 'a88f7566e261'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+index_set = [
+    'tsv_contract_description',
+    'tsv_company_name',
+    'tsv_detail_value',
+    'tsv_line_item_description',
+    'weighted_tsv'
+]
+
+def create_indexes():
+    for index in index_set:
+        op.create_index(op.f(
+            'ix_tsv_{}'.format(index)), 'search_view', [index], postgresql_using='gin'
+        )
+
+def upgrade():
+    conn = op.get_bind()
+
+    op.drop_table('search_view')
+
+    op.create_table('search_view',
+    sa.Column('contract_id', sa.Integer(), nullable=False),
+    sa.Column('financial_id', sa.String(length=255), nullable=True),
+    sa.Column('expiration_date', sa.Date(), nullable=True),
+    sa.Column('contract_description', sa.Text(), nullable=True),
+    sa.Column('tsv_contract_description', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('company_ids', postgresql.ARRAY(sa.Integer()), nullable=True),
+    sa.Column('company_names', postgresql.ARRAY(sa.Text()), nullable=True),
+    sa.Column('company_name', sa.Text(), nullable=True),
+    sa.Column('tsv_company_name', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('detail_value', sa.Text(), nullable=True),
+    sa.Column('tsv_detail_value', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('line_item_description', sa.Text(), nullable=True),
+    sa.Column('tsv_line_item_description', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('weighted_tsv', postgresql.TSVECTOR(), nullable=True),
+    sa.PrimaryKeyConstraint('contract_id')
+    )
+    create_indexes()
+
+    # aggregate each related table separately before joining it to
+    # the contract, so the rows don't multiply against each other
+    conn.execute(sa.sql.text('''
+        CREATE OR REPLACE FUNCTION refresh_search_view_contracts(contract_ids INTEGER[]) RETURNS VOID AS
+        $$
+        BEGIN
+            LOCK TABLE search_view IN SHARE ROW EXCLUSIVE MODE;
+
+            IF contract_ids IS NULL THEN
+                DELETE FROM search_view;
+            ELSE
+                DELETE FROM search_view WHERE contract_id = ANY(contract_ids);
+            END IF;
+
+            INSERT INTO search_view (
+                contract_id, financial_id, expiration_date,
+                contract_description, tsv_contract_description,
+                company_ids, company_names, company_name, tsv_company_name,
+                detail_value, tsv_detail_value,
+                line_item_description, tsv_line_item_description,
+                weighted_tsv
+            )
+            SELECT
+                c.id AS contract_id,
+                c.financial_id, c.expiration_date,
+                c.description AS contract_description,
+                to_tsvector(c.description) AS tsv_contract_description,
+                companies.company_ids,
+                companies.company_names,
+                array_to_string(companies.company_names, ', ') AS company_name,
+                to_tsvector(array_to_string(companies.company_names, ' ')) AS tsv_company_name,
+                properties.detail_value,
+                to_tsvector(properties.detail_value) AS tsv_detail_value,
+                line_items.line_item_description,
+                to_tsvector(line_items.line_item_description) AS tsv_line_item_description,
+                setweight(coalesce(to_tsvector(array_to_string(companies.company_names, ' ')), ''), 'A') ||
+                    setweight(coalesce(to_tsvector(c.description), ''), 'A') ||
+                    setweight(coalesce(to_tsvector(line_items.line_item_description), ''), 'B') ||
+                    setweight(coalesce(to_tsvector(properties.detail_value), ''), 'D')
+                    AS weighted_tsv
+            FROM contract c
+            LEFT OUTER JOIN (
+                SELECT
+                    company_contract_association.contract_id,
+                    array_agg(company.id ORDER BY company.id) AS company_ids,
+                    array_agg(company.company_name ORDER BY company.id) AS company_names
+                FROM company_contract_association
+                JOIN company ON company.id = company_contract_association.company_id
+                WHERE contract_ids IS NULL OR company_contract_association.contract_id = ANY(contract_ids)
+                GROUP BY company_contract_association.contract_id
+            ) companies ON c.id = companies.contract_id
+            LEFT OUTER JOIN (
+                SELECT
+                    contract_property.contract_id,
+                    string_agg(contract_property.value, ' ' ORDER BY contract_property.id) AS detail_value
+                FROM contract_property
+                WHERE contract_ids IS NULL OR contract_property.contract_id = ANY(contract_ids)
+                GROUP BY contract_property.contract_id
+            ) properties ON c.id = properties.contract_id
+            LEFT OUTER JOIN (
+                SELECT
+                    line_item.contract_id,
+                    string_agg(line_item.description, ' ' ORDER BY line_item.id) AS line_item_description
+                FROM line_item
+                WHERE contract_ids IS NULL OR line_item.contract_id = ANY(contract_ids)
+                GROUP BY line_item.contract_id
+            ) line_items ON c.id = line_items.contract_id
+            WHERE contract_ids IS NULL OR c.id = ANY(contract_ids);
+        END;
+        $$
+        LANGUAGE plpgsql;
+    '''))
+
+    conn.execute(sa.sql.text('''
+        SELECT refresh_search_view_contracts(NULL)
+    '''))
+
+def downgrade():
+    conn = op.get_bind()
+
+    op.drop_table('search_view')
+
+    op.create_table('search_view',
+    sa.Column('id', sa.Text(), nullable=False),
+    sa.Column('contract_id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.Column('financial_id', sa.String(length=255), nullable=True),
+    sa.Column('expiration_date', sa.Date(), nullable=True),
+    sa.Column('contract_description', sa.Text(), nullable=True),
+    sa.Column('tsv_contract_description', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('company_name', sa.Text(), nullable=True),
+    sa.Column('tsv_company_name', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('detail_key', sa.Text(), nullable=True),
+    sa.Column('detail_value', sa.Text(), nullable=True),
+    sa.Column('tsv_detail_value', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('line_item_description', sa.Text(), nullable=True),
+    sa.Column('tsv_line_item_description', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('weighted_tsv', postgresql.TSVECTOR(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_search_view_id'), 'search_view', ['id'], unique=True)
+    op.create_index(op.f('ix_search_view_contract_id'), 'search_view', ['contract_id'], unique=False)
+    create_indexes()
+
+    conn.execute(sa.sql.text('''
+        CREATE OR REPLACE FUNCTION refresh_search_view_contracts(contract_ids INTEGER[]) RETURNS VOID AS
+        $$
+        BEGIN
+            LOCK TABLE search_view IN SHARE ROW EXCLUSIVE MODE;
+
+            IF contract_ids IS NULL THEN
+                DELETE FROM search_view;
+            ELSE
+                DELETE FROM search_view WHERE contract_id = ANY(contract_ids);
+            END IF;
+
+            INSERT INTO search_view (
+                id, contract_id, company_id, financial_id, expiration_date,
+                contract_description, tsv_contract_description,
+                company_name, tsv_company_name,
+                detail_key, detail_value, tsv_detail_value,
+                line_item_description, tsv_line_item_description,
+                weighted_tsv
+            )
+            SELECT
+                c.id::VARCHAR || '-' || coalesce(contract_property.id::VARCHAR, '') || '-' ||
+                    coalesce(line_item.id::VARCHAR, '') || '-' || coalesce(company.id::VARCHAR, '') AS id,
+                c.id AS contract_id,
+                company.id AS company_id,
+                c.financial_id, c.expiration_date,
+                c.description AS contract_description,
+                to_tsvector(c.description) AS tsv_contract_description,
+                company.company_name AS company_name,
+                to_tsvector(company.company_name) AS tsv_company_name,
+                contract_property.key AS detail_key,
+                contract_property.value AS detail_value,
+                to_tsvector(contract_property.value) AS tsv_detail_value,
+                line_item.description AS line_item_description,
+                to_tsvector(line_item.description) AS tsv_line_item_description,
+                setweight(coalesce(to_tsvector(company.company_name), ''), 'A') ||
+                    setweight(coalesce(to_tsvector(c.description), ''), 'A') ||
+                    setweight(coalesce(to_tsvector(line_item.description), ''), 'B') ||
+                    setweight(coalesce(to_tsvector(contract_property.value), ''), 'D')
+                    AS weighted_tsv
+            FROM contract c
+            LEFT OUTER JOIN contract_property ON c.id = contract_property.contract_id
+            LEFT OUTER JOIN line_item ON c.id = line_item.contract_id
+            LEFT OUTER JOIN company_contract_association ON c.id = company_contract_association.contract_id
+            LEFT OUTER JOIN company ON company.id = company_contract_association.company_id
+            WHERE contract_ids IS NULL OR c.id = ANY(contract_ids);
+        END;
+        $$
+        LANGUAGE plpgsql;
+    '''))
+
+    conn.execute(sa.sql.text('''
+        SELECT refresh_search_view_contracts(NULL)
+    '''))
@@ -0,0 +1,36 @@
+"""trigram search indexes
+
+Revision ID: a83040cb6989
+Revises: 7b5b7be0107d
+Create Date: 2015-12-18 10:47:32.218806
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a83040cb6989'
+down_revision = '7b5b7be0107d'
+
+from alembic import op
+import sqlalchemy as sa
+
+index_set = [
+    ('search_view', 'company_name'),
+    ('search_view', 'contract_description'),
+    ('line_item', 'description'),
+]
+
+def upgrade():
+    conn = op.get_bind()
+
+    conn.execute(sa.sql.text('''
+        CREATE EXTENSION IF NOT EXISTS pg_trgm
+    '''))
+
+    for table, column in index_set:
+        conn.execute(sa.sql.text('''
+            CREATE INDEX ix_trgm_{table}_{column} ON {table} USING gin ({column} gin_trgm_ops)
+        '''.format(table=table, column=column)))
+
+def downgrade():
+    for table, column in index_set:
+        op.drop_index('ix_trgm_{table}_{column}'.format(table=table, column=column), table_name=table)
@@ -0,0 +1,89 @@
+"""weighted search document
+
+Revision ID: a88f7566e261
+Revises: 46b9b3337b37
+Create Date: 2015-12-16 11:02:54.774413
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a88f7566e261'
+down_revision = '46b9b3337b37'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+def refresh_function(weighted):
+    return '''
+        CREATE OR REPLACE FUNCTION refresh_search_view_contracts(contract_ids INTEGER[]) RETURNS VOID AS
+        $$
+        BEGIN
+            LOCK TABLE search_view IN SHARE ROW EXCLUSIVE MODE;
+
+            IF contract_ids IS NULL THEN
+                DELETE FROM search_view;
+            ELSE
+                DELETE FROM search_view WHERE contract_id = ANY(contract_ids);
+            END IF;
+
+            INSERT INTO search_view (
+                id, contract_id, company_id, financial_id, expiration_date,
+                contract_description, tsv_contract_description,
+                company_name, tsv_company_name,
+                detail_key, detail_value, tsv_detail_value,
+                line_item_description, tsv_line_item_description{weighted_column}
+            )
+            SELECT
+                c.id::VARCHAR || '-' || coalesce(contract_property.id::VARCHAR, '') || '-' ||
+                    coalesce(line_item.id::VARCHAR, '') || '-' || coalesce(company.id::VARCHAR, '') AS id,
+                c.id AS contract_id,
+                company.id AS company_id,
+                c.financial_id, c.expiration_date,
+                c.description AS contract_description,
+                to_tsvector(c.description) AS tsv_contract_description,
+                company.company_name AS company_name,
+                to_tsvector(company.company_name) AS tsv_company_name,
+                contract_property.key AS detail_key,
+                contract_property.value AS detail_value,
+                to_tsvector(contract_property.value) AS tsv_detail_value,
+                line_item.description AS line_item_description,
+                to_tsvector(line_item.description) AS tsv_line_item_description{weighted_select}
+            FROM contract c
+            LEFT OUTER JOIN contract_property ON c.id = contract_property.contract_id
+            LEFT OUTER JOIN line_item ON c.id = line_item.contract_id
+            LEFT OUTER JOIN company_contract_association ON c.id = company_contract_association.contract_id
+            LEFT OUTER JOIN company ON company.id = company_contract_association.company_id
+            WHERE contract_ids IS NULL OR c.id = ANY(contract_ids);
+        END;
+        $$
+        LANGUAGE plpgsql;
+    '''.format(
+        weighted_column=',\n                weighted_tsv' if weighted else '',
+        weighted_select=''',
+                setweight(coalesce(to_tsvector(company.company_name), ''), 'A') ||
+                    setweight(coalesce(to_tsvector(c.description), ''), 'A') ||
+                    setweight(coalesce(to_tsvector(line_item.description), ''), 'B') ||
+                    setweight(coalesce(to_tsvector(contract_property.value), ''), 'D')
+                    AS weighted_tsv''' if weighted else ''
+    )
+
+def upgrade():
+    conn = op.get_bind()
+
+    op.add_column('search_view', sa.Column('weighted_tsv', postgresql.TSVECTOR(), nullable=True))
+    op.create_index(
+        op.f('ix_tsv_weighted_tsv'), 'search_view', ['weighted_tsv'], postgresql_using='gin'
+    )
+
+    conn.execute(sa.sql.text(refresh_function(True)))
+    conn.execute(sa.sql.text('''
+        SELECT refresh_search_view_contracts(NULL)
+    '''))
+
+def downgrade():
+    conn = op.get_bind()
+
+    conn.execute(sa.sql.text(refresh_function(False)))
+    op.drop_index(op.f('ix_tsv_weighted_tsv'), table_name='search_view')
+    op.drop_column('search_view', 'weighted_tsv')
@@ -0,0 +1,189 @@
+"""incremental search view
+
+Revision ID: d77faa4c16b5
+Revises: 4775567688de
+Create Date: 2015-12-14 10:12:43.118204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd77faa4c16b5'
+down_revision = '4775567688de'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from purchasing.data.models import TRIGGER_TUPLES
+
+index_set = [
+    'tsv_contract_description',
+    'tsv_company_name',
+    'tsv_detail_value',
+    'tsv_line_item_description'
+]
+
+def upgrade():
+    conn = op.get_bind()
+
+    # drop the old materialized view and anything left over from the
+    # per-row full refresh triggers
+    conn.execute(sa.sql.text('''
+        DROP MATERIALIZED VIEW IF EXISTS search_view
+    '''))
+    for table, column, _ in TRIGGER_TUPLES:
+        conn.execute(sa.sql.text('''
+            DROP TRIGGER IF EXISTS tsv_{table}_{column}_trigger_insert_update ON {table}
+        '''.format(table=table, column=column)))
+        conn.execute(sa.sql.text('''
+            DROP TRIGGER IF EXISTS tsv_{table}_{column}_trigger_delete ON {table}
+        '''.format(table=table, column=column)))
+    conn.execute(sa.sql.text('''
+        DROP FUNCTION IF EXISTS trig_refresh_search_view()
+    '''))
+
+    # the search view is now a regular table keyed by contract
+    op.create_table('search_view',
+    sa.Column('id', sa.Text(), nullable=False),
+    sa.Column('contract_id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.Column('financial_id', sa.String(length=255), nullable=True),
+    sa.Column('expiration_date', sa.Date(), nullable=True),
+    sa.Column('contract_description', sa.Text(), nullable=True),
+    sa.Column('tsv_contract_description', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('company_name', sa.Text(), nullable=True),
+    sa.Column('tsv_company_name', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('detail_key', sa.Text(), nullable=True),
+    sa.Column('detail_value', sa.Text(), nullable=True),
+    sa.Column('tsv_detail_value', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('line_item_description', sa.Text(), nullable=True),
+    sa.Column('tsv_line_item_description', postgresql.TSVECTOR(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_search_view_id'), 'search_view', ['id'], unique=True)
+    op.create_index(op.f('ix_search_view_contract_id'), 'search_view', ['contract_id'], unique=False)
+
+    for index in index_set:
+        op.create_index(op.f(
+            'ix_tsv_{}'.format(index)), 'search_view', [index], postgresql_using='gin'
+        )
+
+    # rebuild the rows for a set of contracts, or every contract if
+    # NULL is passed. The table lock serializes concurrent writers so
+    # two refreshes of the same contract can't collide on the primary
+    # key, but it still allows reads while the refresh is running.
+    conn.execute(sa.sql.text('''
+        CREATE OR REPLACE FUNCTION refresh_search_view_contracts(contract_ids INTEGER[]) RETURNS VOID AS
+        $$
+        BEGIN
+            LOCK TABLE search_view IN SHARE ROW EXCLUSIVE MODE;
+
+            IF contract_ids IS NULL THEN
+                DELETE FROM search_view;
+            ELSE
+                DELETE FROM search_view WHERE contract_id = ANY(contract_ids);
+            END IF;
+
+            INSERT INTO search_view (
+                id, contract_id, company_id, financial_id, expiration_date,
+                contract_description, tsv_contract_description,
+                company_name, tsv_company_name,
+                detail_key, detail_value, tsv_detail_value,
+                line_item_description, tsv_line_item_description
+            )
+            SELECT
+                c.id::VARCHAR || '-' || coalesce(contract_property.id::VARCHAR, '') || '-' ||
+                    coalesce(line_item.id::VARCHAR, '') || '-' || coalesce(company.id::VARCHAR, '') AS id,
+                c.id AS contract_id,
+                company.id AS company_id,
+                c.financial_id, c.expiration_date,
+                c.description AS contract_description,
+                to_tsvector(c.description) AS tsv_contract_description,
+                company.company_name AS company_name,
+                to_tsvector(company.company_name) AS tsv_company_name,
+                contract_property.key AS detail_key,
+                contract_property.value AS detail_value,
+                to_tsvector(contract_property.value) AS tsv_detail_value,
+                line_item.description AS line_item_description,
+                to_tsvector(line_item.description) AS tsv_line_item_description
+            FROM contract c
+            LEFT OUTER JOIN contract_property ON c.id = contract_property.contract_id
+            LEFT OUTER JOIN line_item ON c.id = line_item.contract_id
+            LEFT OUTER JOIN company_contract_association ON c.id = company_contract_association.contract_id
+            LEFT OUTER JOIN company ON company.id = company_contract_association.company_id
+            WHERE contract_ids IS NULL OR c.id = ANY(contract_ids);
+        END;
+        $$
+        LANGUAGE plpgsql;
+    '''))
+
+    # populate the new table
+    conn.execute(sa.sql.text('''
+        SELECT refresh_search_view_contracts(NULL)
+    '''))
+
+def downgrade():
+    conn = op.get_bind()
+
+    conn.execute(sa.sql.text('''
+        DROP FUNCTION IF EXISTS refresh_search_view_contracts(INTEGER[])
+    '''))
+    op.drop_table('search_view')
+
+    conn.execute(sa.sql.text('''
+    CREATE MATERIALIZED VIEW search_view AS (
+        SELECT
+            c.id::VARCHAR || contract_property.id::VARCHAR || line_item.id::VARCHAR || company.id::VARCHAR AS id,
+            c.id AS contract_id,
+            company.id AS company_id,
+            c.expiration_date, c.financial_id,
+            c.description AS contract_description,
+            to_tsvector(c.description) AS tsv_contract_description,
+            company.company_name AS company_name,
+            to_tsvector(company.company_name) AS tsv_company_name,
+            contract_property.key AS detail_key,
+            contract_property.value AS detail_value,
+            to_tsvector(contract_property.value) AS tsv_detail_value,
+            line_item.description AS line_item_description,
+            to_tsvector(line_item.description) AS tsv_line_item_description
+        FROM contract c
+        LEFT OUTER JOIN contract_property ON c.id = contract_property.contract_id
+        LEFT OUTER JOIN line_item ON c.id = line_item.contract_id
+        LEFT OUTER JOIN company_contract_association ON c.id = company_contract_association.contract_id
+        LEFT OUTER JOIN company ON company.id = company_contract_association.company_id
+    )
+    '''))
+    op.create_index(op.f('ix_search_view_id'), 'search_view', ['id'], unique=True)
+
+    for index in index_set:
+        op.create_index(op.f(
+            'ix_tsv_{}'.format(index)), 'search_view', [index], postgresql_using='gin'
+        )
+
+    conn.execute(sa.sql.text('''
+        CREATE OR REPLACE FUNCTION trig_refresh_search_view() RETURNS trigger AS
+        $$
+        BEGIN
+            REFRESH MATERIALIZED VIEW CONCURRENTLY search_view;
+            RETURN NULL;
+        END;
+        $$
+        LANGUAGE plpgsql ;
+    '''))
+
+    # recreate the per-row triggers that refresh the materialized view
+    for table, column, when in TRIGGER_TUPLES:
+        conn.execute(sa.sql.text('''
+            CREATE TRIGGER tsv_{table}_{column}_trigger_insert_update AFTER INSERT OR UPDATE OF {column}
+            ON {table}
+            FOR EACH ROW
+            {when}
+            EXECUTE PROCEDURE trig_refresh_search_view()
+        '''.format(table=table, column=column, when=when)))
+
+        conn.execute(sa.sql.text('''
+            CREATE TRIGGER tsv_{table}_{column}_trigger_delete AFTER DELETE
+            ON {table}
+            FOR EACH ROW
+            EXECUTE PROCEDURE trig_refresh_search_view()
+        '''.format(table=table, column=column)))
@@ -23,6 +23,7 @@ from purchasing.extensions import login_manager
 from purchasing.users.models import User, Role, Department
 from purchasing.public.models import AcceptedEmailDomains
 from purchasing.opportunities.models import Opportunity
+from purchasing.jobs.job_base import JobStatus
 
 GLOBAL_EXCLUDE = [
     'created_at', 'updated_at', 'created_by', 'updated_by'
@@ -356,6 +357,24 @@ class CategoryAdmin(AuthMixin, BaseModelViewAdmin):
         )
     }
 
+class JobStatusAdmin(AuthMixin, BaseModelViewAdmin):
+    can_create = False
+    can_edit = False
+    can_delete = False
+
+    column_list = [
+        'name', 'date', 'status', 'duration', 'query_count', 'query_time',
+        'notifications_built', 'chunks_total', 'chunks_failed', 'messages_sent', 'info'
+    ]
+    column_default_sort = ('date', True)
+    column_filters = ['name', 'status', 'date']
+
+    column_labels = dict(
+        duration='Run time (s)', query_time='Query time (s)',
+        query_count='Queries', notifications_built='Notifications',
+        chunks_total='Chunks', chunks_failed='Failed chunks', messages_sent='Messages sent'
+    )
+
 admin.add_view(ScoutContractAdmin(
     ContractBase, db.session, name='Contracts', endpoint='contract', category='Scout'
 ))
@@ -390,3 +409,5 @@ admin.add_view(UserAdmin(User, db.session, name='User', endpoint='user', categor
 admin.add_view(UserRoleAdmin(User, db.session, name='User w/Roles', endpoint='user-roles', category='Users'))
 admin.add_view(RoleAdmin(Role, db.session, endpoint='role', category='Users'))
 admin.add_view(EmailDomainAdmin(AcceptedEmailDomains, db.session, endpoint='domains', category='Users'))
+
+admin.add_view(JobStatusAdmin(JobStatus, db.session, name='Nightly Jobs', endpoint='job-status', category='Status'))
@@ -10,7 +10,7 @@ from flask_login import current_user
 from wtforms import Form as NoCSRFForm
 from wtforms.fields import (
     TextField, IntegerField, DateField, TextAreaField, HiddenField,
-    FieldList, FormField, SelectField, BooleanField
+    FieldList, FormField, SelectField, BooleanField, SelectMultipleField
 )
 from wtforms.ext.dateutil.fields import DateTimeField
 from wtforms.ext.sqlalchemy.fields import QuerySelectField
@@ -22,6 +22,7 @@ from purchasing.notifications import Notification
 
 from purchasing.users.models import Department, User
 from purchasing.data.flows import Flow
+from purchasing.data.dashboard import ConductorDashboard
 from purchasing.data.companies import Company
 
 from purchasing.opportunities.forms import OpportunityForm, city_domain_email
@@ -114,6 +115,31 @@ class CompleteForm(Form):
         self.started = started.replace(second=0, microsecond=0) if started else None
         self.maximum = datetime.datetime.utcnow()
 
+class BulkTransitionForm(Form):
+    '''Form to transition many contracts forward one stage at once
+
+    Only contracts that are in progress in Conductor, that is assigned,
+    in a flow, and neither visible nor archived, can be chosen.
+
+    Attributes:
+        contract_ids: Ids of the
+            :py:class:`~purchasing.data.contracts.ContractBase` objects
+            to transition
+    '''
+    contract_ids = SelectMultipleField(coerce=int, validators=[DataRequired()])
+
+    def __init__(self, *args, **kwargs):
+        super(BulkTransitionForm, self).__init__(*args, **kwargs)
+        self.contract_ids.choices = [
+            (i.contract_id, i.contract_id) for i in
+            db.session.query(ConductorDashboard.contract_id).filter(
+                ConductorDashboard.assigned_to != None,
+                ConductorDashboard.flow_id != None,
+                ConductorDashboard.is_visible == False,
+                ConductorDashboard.is_archived == False
+            )
+        ]
+
 class NewContractForm(Form):
     '''Form for starting new work on a contract through conductor
 
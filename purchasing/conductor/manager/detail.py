@@ -24,7 +24,8 @@ from purchasing.users.models import User
 
 from purchasing.conductor.forms import (
     NoteForm, SendUpdateForm, PostOpportunityForm,
-    ContractMetadataForm, CompleteForm, NewContractForm
+    ContractMetadataForm, CompleteForm, NewContractForm,
+    BulkTransitionForm
 )
 
 from purchasing.conductor.util import (
@@ -232,6 +233,52 @@ def transition(contract_id, stage_id):
     session['invalid_date-{}'.format(contract_id)] = complete_form.errors['complete'][0]
     return redirect(url_for('conductor.detail', contract_id=contract.id))
 
+@blueprint.route('/contracts/transition', methods=['POST'])
+@requires_roles('conductor', 'admin', 'superadmin')
+def bulk_transition():
+    '''Transition many contracts forward one stage at once
+
+    Every chosen contract moves forward one stage in its flow, or
+    completes the last stage of its flow, in a single transaction.
+
+    .. seealso::
+        For the transition, see the
+        :py:meth:`~purchasing.data.contracts.ContractBase.bulk_transition`
+        method directly
+
+    :status 302: Perform the transitions, and redirect back to the
+        conductor index with the number of contracts transitioned
+    '''
+    form = BulkTransitionForm()
+
+    if form.validate_on_submit():
+        try:
+            transitioned, completed = ContractBase.bulk_transition(
+                form.contract_ids.data, current_user
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        current_app.logger.info(
+            'CONDUCTOR BULK TRANSITION - {} contracts (IDs: {}) transitioned by {}'.format(
+                len(transitioned), ', '.join(str(i.id) for i in transitioned), current_user.email
+            )
+        )
+
+        flash('Successfully transitioned {} contracts!'.format(len(transitioned)), 'alert-success')
+        if len(completed) > 0:
+            flash(
+                '{} contracts finished their last stage and are ready to be completed: {}'.format(
+                    len(completed), ', '.join(i.description for i in completed)
+                ), 'alert-info'
+            )
+    else:
+        flash('Choose one or more contracts in progress to transition.', 'alert-danger')
+
+    return redirect(url_for('conductor.index'))
+
 @blueprint.route('/contract/<int:contract_id>/stage/<int:stage_id>/extend')
 @requires_roles('conductor', 'admin', 'superadmin')
 def extend(contract_id, stage_id):
@@ -8,11 +8,7 @@ from purchasing.database import db
 
 from purchasing.data.stages import Stage
 from purchasing.data.flows import Flow
-from purchasing.data.companies import Company
-from purchasing.data.contracts import ContractBase, ContractProperty, ContractType
-from purchasing.data.contract_stages import ContractStage
-
-from sqlalchemy.orm import aliased
+from purchasing.data.dashboard import ConductorDashboard as D
 
 from purchasing.users.models import User, Role, Department
 
@@ -38,104 +34,54 @@ def index():
     ``managed_by_conductor`` field. Additionally, these are
     filtered by having no ``children``, and ``is_visible`` set to True
 
+    Both tables are read from the precomputed
+    :py:class:`~purchasing.data.dashboard.ConductorDashboard` rows, which
+    are kept up to date as contracts change, so only the assigned user,
+    stage, flow, and department have to be joined in.
+
     .. seealso:: :py:class:`~purchasing.data.contracts.ContractBase`,
+        :py:class:`~purchasing.data.dashboard.ConductorDashboard`,
         :py:class:`~purchasing.data.contract_stages.ContractStage`,
         :py:class:`~purchasing.data.flows.Flow`
 
     :status 200: Render the main conductor index page
     '''
-    parent = aliased(ContractBase)
-
-    parent_specs = db.session.query(
-        ContractBase.id, ContractProperty.value,
-        parent.expiration_date, parent.contract_href,
-        Company.company_name
-    ).join(
-        ContractProperty,
-        ContractBase.parent_id == ContractProperty.contract_id
-    ).join(
-        parent, ContractBase.parent
-    ).outerjoin(
-        Company, parent.companies
-    ).filter(
-        db.func.lower(ContractProperty.key) == 'spec number',
-        ContractType.managed_by_conductor == True
-    ).subquery()
-
     in_progress = db.session.query(
-        db.distinct(ContractBase.id).label('id'),
-        ContractProperty.value.label('spec_number'),
-        parent_specs.c.value.label('parent_spec'),
-        parent_specs.c.expiration_date.label('parent_expiration'),
-        parent_specs.c.contract_href.label('parent_contract_href'),
-        ContractBase.description, Flow.flow_name,
-        Stage.name.label('stage_name'), ContractStage.entered,
+        D.contract_id.label('id'), D.spec_number, D.parent_spec,
+        D.parent_expiration, D.parent_contract_href,
+        D.description, D.financial_id, Flow.flow_name,
+        Stage.name.label('stage_name'), D.stage_entered.label('entered'),
         User.first_name, User.email,
         Department.name.label('department'),
-        db.func.array_remove(
-            db.func.array_agg(parent_specs.c.company_name),
-            None
-        ).label('companies')
-    ).outerjoin(Department).join(
-        ContractStage, db.and_(
-            ContractStage.stage_id == ContractBase.current_stage_id,
-            ContractStage.contract_id == ContractBase.id,
-            ContractStage.flow_id == ContractBase.flow_id
-        )
+        D.parent_companies.label('companies')
     ).join(
-        Stage, Stage.id == ContractBase.current_stage_id
+        Stage, Stage.id == D.current_stage_id
     ).join(
-        Flow, Flow.id == ContractBase.flow_id
-    ).outerjoin(
-        ContractProperty, ContractProperty.contract_id == ContractBase.id
+        Flow, Flow.id == D.flow_id
+    ).join(
+        User, User.id == D.assigned_to
     ).outerjoin(
-        parent_specs, ContractBase.id == parent_specs.c.id
-    ).join(User, User.id == ContractBase.assigned_to).filter(
-        ContractStage.flow_id == ContractBase.flow_id,
-        ContractStage.entered != None,
-        ContractBase.assigned_to != None,
-        ContractBase.is_visible == False,
-        ContractBase.is_archived == False
-    ).group_by(
-        ContractBase.id,
-        ContractProperty.value.label('spec_number'),
-        parent_specs.c.value.label('parent_spec'),
-        parent_specs.c.expiration_date.label('parent_expiration'),
-        parent_specs.c.contract_href.label('parent_contract_href'),
-        ContractBase.description, Flow.flow_name,
-        Stage.name.label('stage_name'), ContractStage.entered,
-        User.first_name, User.email,
-        Department.name.label('department')
+        Department, Department.id == D.department_id
+    ).filter(
+        D.stage_entered != None,
+        D.assigned_to != None,
+        D.is_visible == False,
+        D.is_archived == False
     ).all()
 
     all_contracts = db.session.query(
-        ContractBase.id, ContractBase.description,
-        ContractBase.financial_id, ContractBase.expiration_date,
-        ContractProperty.value.label('spec_number'),
-        ContractBase.contract_href, ContractBase.department,
-        User.first_name, User.email,
-        db.func.array_remove(
-            db.func.array_agg(Company.company_name),
-            None
-        ).label('companies')
-    ).join(ContractType).outerjoin(
-        User, User.id == ContractBase.assigned_to
-    ).outerjoin(Company, ContractBase.companies).outerjoin(
-        Department, Department.id == ContractBase.department_id
+        D.contract_id.label('id'), D.description,
+        D.financial_id, D.expiration_date,
+        D.spec_number, D.contract_href,
+        User.first_name, User.email, D.companies
     ).outerjoin(
-        ContractProperty, ContractProperty.contract_id == ContractBase.id
+        User, User.id == D.assigned_to
     ).filter(
-        ContractType.managed_by_conductor == True,
-        db.func.lower(ContractProperty.key) == 'spec number',
-        ContractBase.children == None,
-        ContractBase.is_visible == True
-    ).group_by(
-        ContractBase.id, ContractBase.description,
-        ContractBase.financial_id, ContractBase.expiration_date,
-        ContractProperty.value.label('spec_number'),
-        ContractBase.contract_href, ContractBase.department,
-        User.first_name, User.email
-    ).order_by(ContractBase.expiration_date).all()
+        D.managed_by_conductor == True,
+        D.spec_number != None,
+        D.has_children == False,
+        D.is_visible == True
+    ).order_by(D.expiration_date).all()
 
     conductors = User.query.join(Role, User.role_id == Role.id).filter(
         Role.name == 'conductor',
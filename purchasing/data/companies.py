@@ -33,6 +33,18 @@ class Company(RefreshSearchViewMixin, Model):
     def __unicode__(self):
         return self.company_name
 
+    def get_search_view_contract_ids(self, connection):
+        '''Companies affect the search view rows of every contract they service
+
+        The contracts are looked up directly on the flushing connection so
+        we don't trigger any relationship loads in the middle of a flush.
+        '''
+        return [i.contract_id for i in connection.execute(
+            db.select([company_contract_association_table.c.contract_id]).where(
+                company_contract_association_table.c.company_id == self.id
+            )
+        )]
+
     @classmethod
     def all_companies_query_factory(cls):
         '''Query factory of all company ids and names ordered by name
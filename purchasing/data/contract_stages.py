@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import operator
 
 from sqlalchemy.schema import Sequence
 from sqlalchemy.orm import backref
@@ -8,6 +9,8 @@ from sqlalchemy.dialects.postgresql import JSON
 
 from purchasing.database import Model, db, Column, ReferenceCol
 
+TRANSITION_ACTION_LABELS = {'entered': 'Started work', 'exited': 'Completed work'}
+
 class ContractStage(Model):
     '''Model for contract stages
 
@@ -122,6 +125,32 @@ class ContractStage(Model):
         enter_time = enter_time if enter_time else datetime.datetime.utcnow()
         self.entered = enter_time
 
+    def transition_action(self, user, action_type, action_time):
+        '''Build the columns of an enter or exit action for this contract stage
+
+        Arguments:
+            user: A :py:class:`~purchasing.users.models.User` object
+                who triggered the event.
+            action_type: Either "entered" or "exited"
+            action_time: A datetime for when the stage was entered or exited
+
+        Returns:
+            A dictionary of
+            :py:class:`~purchasing.data.contract_stages.ContractStageActionItem`
+            column values, which can be used to build the action or to
+            bulk insert many actions at once
+        '''
+        return dict(
+            contract_stage_id=self.id, action_type=action_type,
+            taken_by=user.id, taken_at=datetime.datetime.utcnow(),
+            action_detail={
+                'timestamp': action_time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'date': action_time.strftime('%Y-%m-%d'),
+                'type': action_type, 'label': TRANSITION_ACTION_LABELS[action_type],
+                'stage_name': self.stage.name
+            }
+        )
+
     def log_enter(self, user, enter_time):
         '''Enter the contract stage and log its entry
 
@@ -135,16 +164,13 @@ class ContractStage(Model):
             that represents the log of the action item.
         '''
         self.enter(enter_time=enter_time)
-        return ContractStageActionItem(
-            contract_stage_id=self.id, action_type='entered',
-            taken_by=user.id, taken_at=datetime.datetime.utcnow(),
-            action_detail={
-                'timestamp': self.entered.strftime('%Y-%m-%dT%H:%M:%S'),
-                'date': self.entered.strftime('%Y-%m-%d'),
-                'type': 'entered', 'label': 'Started work',
-                'stage_name': self.stage.name
-            }
-        )
+        return ContractStageActionItem(**self.transition_action(user, 'entered', self.entered))
+
+    def _compare_positions(self, target_stage_id, compare):
+        positions = self.flow.stage_positions
+        if target_stage_id not in positions or self.stage_id not in positions:
+            return False
+        return compare(positions[self.stage_id], positions[target_stage_id])
 
     def happens_before(self, target_stage_id):
         '''Check if this contract stage happens before a target stage
@@ -157,10 +183,7 @@ class ContractStage(Model):
         Arguments:
             target_stage_id: A :py:class:`~purchasing.data.stages.Stage` ID
         '''
-        if target_stage_id not in self.flow.stage_order:
-            return False
-        return self.flow.stage_order.index(self.stage_id) < \
-            self.flow.stage_order.index(target_stage_id)
+        return self._compare_positions(target_stage_id, operator.lt)
 
     def happens_before_or_on(self, target_stage_id):
         '''Check if this contract stage happens before or is a target stage
@@ -175,10 +198,7 @@ class ContractStage(Model):
         Arguments:
             target_stage_id: A :py:class:`purchasing.data.stages.Stage` ID
         '''
-        if target_stage_id not in self.flow.stage_order:
-            return False
-        return self.flow.stage_order.index(self.stage_id) <= \
-            self.flow.stage_order.index(target_stage_id)
+        return self._compare_positions(target_stage_id, operator.le)
 
     def happens_after(self, target_stage_id):
         '''Check if this contract stage happens after a target stage
@@ -191,10 +211,7 @@ class ContractStage(Model):
         Arguments:
             target_stage_id: A :py:class:`purchasing.data.stages.Stage` ID
         '''
-        if target_stage_id not in self.flow.stage_order:
-            return False
-        return self.flow.stage_order.index(self.stage_id) > \
-            self.flow.stage_order.index(target_stage_id)
+        return self._compare_positions(target_stage_id, operator.gt)
 
     def exit(self, exit_time=None):
         '''Set the contract stage's exit time
@@ -219,16 +236,7 @@ class ContractStage(Model):
             that represents the log of the action item.
         '''
         self.exit(exit_time=exit_time)
-        return ContractStageActionItem(
-            contract_stage_id=self.id, action_type='exited',
-            taken_by=user.id, taken_at=datetime.datetime.utcnow(),
-            action_detail={
-                'timestamp': self.exited.strftime('%Y-%m-%dT%H:%M:%S'),
-                'date': self.exited.strftime('%Y-%m-%d'),
-                'type': 'exited', 'label': 'Completed work',
-                'stage_name': self.stage.name
-            }
-        )
+        return ContractStageActionItem(**self.transition_action(user, 'exited', self.exited))
 
     def log_reopen(self, user, reopen_time):
         '''Reopen the contract stage and log that re-opening
@@ -6,9 +6,11 @@ import datetime
 from itertools import groupby, ifilter
 
 from sqlalchemy.schema import Table
-from sqlalchemy.orm import backref
+from sqlalchemy.orm import backref, contains_eager, joinedload
 
-from purchasing.database import db, Model, Column, RefreshSearchViewMixin, ReferenceCol
+from purchasing.database import (
+    db, Model, Column, RefreshSearchViewMixin, ReferenceCol, ReferenceDataMixin
+)
 
 from purchasing.filters import days_from_today
 from purchasing.data.stages import Stage
@@ -119,6 +121,11 @@ class ContractBase(RefreshSearchViewMixin, Model):
     def __unicode__(self):
         return '{} (ID: {})'.format(self.description, self.id)
 
+    def get_search_view_contract_ids(self, connection):
+        '''Contracts only affect their own search view rows
+        '''
+        return [self.id]
+
     @property
     def scout_contract_status(self):
         '''Returns a string with the contract's status.
@@ -202,8 +209,18 @@ class ContractBase(RefreshSearchViewMixin, Model):
 
     def build_complete_action_log(self):
         '''Returns the complete action log for this contract
+
+        Each action's :py:class:`~purchasing.data.contract_stages.ContractStage`
+        and that stage's :py:class:`~purchasing.data.flows.Flow` are loaded
+        in the same query, so walking the log doesn't lazy load them
+        one action at a time.
         '''
-        return ContractStageActionItem.query.join(ContractStage).filter(
+        return ContractStageActionItem.query.join(ContractStage).outerjoin(
+            Flow, Flow.id == ContractStage.flow_id
+        ).options(
+            contains_eager(ContractStageActionItem.contract_stage).
+            contains_eager(ContractStage.flow)
+        ).filter(
             ContractStage.contract_id == self.id
         ).order_by(
             ContractStageActionItem.taken_at,
@@ -449,8 +466,7 @@ class ContractBase(RefreshSearchViewMixin, Model):
         return [contract_stage.log_enter(user, complete_time)]
 
     def _transition_to_next(self, user, complete_time):
-        stages = self.flow.stage_order
-        current_stage_idx = stages.index(self.current_stage.id)
+        current_stage_idx = self.flow.stage_positions[self.current_stage_id]
 
         current_stage = self.current_contract_stage
         next_stage = ContractStage.get_one(
@@ -465,8 +481,8 @@ class ContractBase(RefreshSearchViewMixin, Model):
         return [exit]
 
     def _transition_backwards_to_destination(self, user, destination, complete_time):
-        destination_idx = self.flow.stage_order.index(destination)
-        current_stage_idx = self.flow.stage_order.index(self.current_stage_id)
+        destination_idx = self.flow.stage_positions[destination]
+        current_stage_idx = self.flow.stage_positions[self.current_stage_id]
 
         if destination_idx > current_stage_idx:
             raise Exception('Skipping stages is not currently supported')
@@ -526,6 +542,116 @@ class ContractBase(RefreshSearchViewMixin, Model):
 
         return actions
 
+    @classmethod
+    def bulk_transition(cls, contract_ids, user, complete_time=None):
+        '''Transition many contracts forward one stage at once
+
+        The contracts are locked for the rest of the transaction, and
+        their contract stages and flows are loaded in one query each.
+        Every stage move is worked out in memory, the same way as
+        :py:meth:`~purchasing.data.contracts.ContractBase.transition`
+        moves a single contract forward, and all of the
+        :py:class:`~purchasing.data.contract_stages.ContractStage` updates
+        and :py:class:`~purchasing.data.contract_stages.ContractStageActionItem`
+        rows are then written with one bulk update and one bulk insert.
+
+        Contracts without a flow, that have already completed the last
+        stage of their flow, or that are missing contract stages are skipped.
+        Nothing is committed.
+
+        Arguments:
+            contract_ids: List of ids of the contracts to transition
+            user: The user taking the actions
+
+        Keyword Arguments:
+            complete_time: A time other than the current time to perform
+                the transitions
+
+        Returns:
+            A two-tuple of (the contracts that were transitioned, the
+            contracts among them that completed the last stage of their flow)
+        '''
+        complete_time = complete_time if complete_time else datetime.datetime.utcnow()
+
+        # lock in id order so that two transactions can't deadlock on each other
+        contracts = cls.query.filter(
+            cls.id.in_(contract_ids), cls.flow_id != None
+        ).order_by(cls.id).with_for_update(of=cls).all()
+        if len(contracts) == 0:
+            return [], []
+
+        flows = dict(
+            (flow.id, flow) for flow in
+            Flow.query.filter(Flow.id.in_(set(i.flow_id for i in contracts)))
+        )
+        contract_stages = dict(
+            ((i.contract_id, i.stage_id), i) for i in
+            ContractStage.query.options(joinedload(ContractStage.stage)).filter(
+                db.tuple_(ContractStage.contract_id, ContractStage.flow_id).in_(
+                    [(i.id, i.flow_id) for i in contracts]
+                )
+            )
+        )
+
+        # the bulk writes skip the before_insert and before_update
+        # listeners, so the audit columns are set here instead
+        now, user_id = datetime.datetime.utcnow(), user.id
+
+        stage_updates, actions, transitioned, completed = [], [], [], []
+        for contract in contracts:
+            stage_order = flows[contract.flow_id].stage_order
+            if not stage_order:
+                continue
+
+            if contract.current_stage_id is None:
+                moves = [('entered', stage_order[0])]
+            else:
+                position = flows[contract.flow_id].stage_positions.get(contract.current_stage_id)
+                current = contract_stages.get((contract.id, contract.current_stage_id))
+                if position is None or current is None or current.exited is not None:
+                    continue
+                moves = [('exited', contract.current_stage_id)]
+                if position < len(stage_order) - 1:
+                    moves.append(('entered', stage_order[position + 1]))
+
+            moves = [
+                (action_type, contract_stages.get((contract.id, stage_id)))
+                for action_type, stage_id in moves
+            ]
+            if any(contract_stage is None for _, contract_stage in moves):
+                continue
+
+            for action_type, contract_stage in moves:
+                stage_updates.append({
+                    'contract_id': contract_stage.contract_id,
+                    'stage_id': contract_stage.stage_id,
+                    'flow_id': contract_stage.flow_id,
+                    'updated_at': now,
+                    'updated_by_id': user_id,
+                    action_type: complete_time
+                })
+                action = contract_stage.transition_action(user, action_type, complete_time)
+                action.update(created_at=now, created_by_id=user_id)
+                actions.append(action)
+
+            transitioned.append(contract)
+            if moves[-1][0] == 'entered':
+                contract.current_stage_id = moves[-1][1].stage_id
+            else:
+                completed.append(contract)
+
+        if stage_updates:
+            db.session.bulk_update_mappings(ContractStage, stage_updates)
+            db.session.bulk_insert_mappings(ContractStageActionItem, actions)
+
+        # the bulk update bypasses the loaded contract stages
+        for contract_stage in contract_stages.values():
+            db.session.expire(
+                contract_stage, ['entered', 'exited', 'updated_at', 'updated_by_id']
+            )
+
+        return transitioned, completed
+
     def switch_flow(self, new_flow_id, user):
         '''Switch the contract's progress from one flow to another
 
@@ -617,7 +743,7 @@ class ContractBase(RefreshSearchViewMixin, Model):
         }
         return subscribers, sum([len(i) for i in subscribers.values()])
 
-class ContractType(Model):
+class ContractType(ReferenceDataMixin, Model):
     '''Model for contract types
 
     Attributes:
@@ -651,8 +777,12 @@ class ContractType(Model):
     @classmethod
     def query_factory_all(cls):
         '''Query factory to return all contract types
+
+        Returns:
+            List of all contract types ordered by name, cached in
+            each process until the contract type table changes
         '''
-        return cls.query.order_by(cls.name)
+        return cls.cached_reference_objects('all', lambda: cls.query.order_by(cls.name))
 
     @classmethod
     def get_type(cls, type_name):
@@ -701,6 +831,11 @@ class ContractProperty(RefreshSearchViewMixin, Model):
     def __unicode__(self):
         return '{key}: {value}'.format(key=self.key, value=self.value)
 
+    def get_search_view_contract_ids(self, connection):
+        '''Properties affect the search view rows of their contract
+        '''
+        return [self.contract_id]
+
 class ContractNote(Model):
     '''Model for contract notes
 
@@ -776,3 +911,8 @@ class LineItem(RefreshSearchViewMixin, Model):
 
     def __unicode__(self):
         return self.description
+
+    def get_search_view_contract_ids(self, connection):
+        '''Line items affect the search view rows of their contract
+        '''
+        return [self.contract_id]
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from purchasing.database import db, Model, Column
+
+class ConductorDashboard(Model):
+    '''Denormalized row of everything the Conductor index shows about a contract
+
+    The Conductor index used to aggregate company names, spec numbers, and
+    parent contract details over several joins on every page load. This
+    table stores one precomputed row per contract instead, so the index
+    only has to read it and look up the assigned user, stage, flow, and
+    department by primary key. Rows are rebuilt with
+    :py:func:`~purchasing.data.dashboard.refresh_conductor_dashboard`
+    whenever changes to the contracts they describe are flushed.
+
+    Attributes:
+        contract_id: Primary key, id of the
+            :py:class:`~purchasing.data.contracts.ContractBase`
+        description: Contract description
+        financial_id: Contract controller number
+        expiration_date: Date the contract expires
+        contract_href: Link to the contract document
+        spec_number: Value of the contract's spec number property
+        parent_id: Id of the contract this contract is replacing
+        parent_spec: Spec number of the parent contract
+        parent_expiration: Expiration date of the parent contract
+        parent_contract_href: Link to the parent contract document
+        companies: Names of the companies on the contract
+        parent_companies: Names of the companies on the parent contract
+        has_children: Whether any contract is replacing this one
+        managed_by_conductor: Whether the contract's type is managed by Conductor
+        is_visible: Contract ``is_visible`` flag
+        is_archived: Contract ``is_archived`` flag
+        assigned_to: Id of the user the contract is assigned to
+        department_id: Id of the contract's department
+        flow_id: Id of the contract's flow
+        current_stage_id: Id of the contract's current stage
+        stage_entered: When the contract entered its current stage
+    '''
+    __tablename__ = 'conductor_dashboard'
+    __table_args__ = (
+        db.Index(
+            'ix_conductor_dashboard_in_progress', 'stage_entered',
+            postgresql_where=db.text('assigned_to IS NOT NULL AND NOT is_visible AND NOT is_archived')
+        ),
+        db.Index(
+            'ix_conductor_dashboard_all', 'expiration_date',
+            postgresql_where=db.text('managed_by_conductor AND is_visible AND NOT has_children')
+        ),
+    )
+
+    contract_id = Column(db.Integer, primary_key=True)
+    description = Column(db.Text)
+    financial_id = Column(db.String(255))
+    expiration_date = Column(db.Date)
+    contract_href = Column(db.Text)
+    spec_number = Column(db.Text)
+    parent_id = Column(db.Integer)
+    parent_spec = Column(db.Text)
+    parent_expiration = Column(db.Date)
+    parent_contract_href = Column(db.Text)
+    companies = Column(ARRAY(db.Text))
+    parent_companies = Column(ARRAY(db.Text))
+    has_children = Column(db.Boolean, nullable=False)
+    managed_by_conductor = Column(db.Boolean, nullable=False)
+    is_visible = Column(db.Boolean, nullable=False)
+    is_archived = Column(db.Boolean, nullable=False)
+    assigned_to = Column(db.Integer)
+    department_id = Column(db.Integer)
+    flow_id = Column(db.Integer)
+    current_stage_id = Column(db.Integer)
+    stage_entered = Column(db.DateTime)
+
+# contracts whose rows need rebuilding: the changed contracts themselves,
+# their children (which show their parent's details), and their parents
+# (which may have gained or lost a child)
+EXPAND_CONTRACT_IDS = '''
+    SELECT id FROM contract WHERE id = ANY(:contract_ids) OR parent_id = ANY(:contract_ids)
+    UNION
+    SELECT parent_id FROM contract WHERE id = ANY(:contract_ids) AND parent_id IS NOT NULL
+'''
+
+REFRESH_CONDUCTOR_DASHBOARD = '''
+    INSERT INTO conductor_dashboard (
+        contract_id, description, financial_id, expiration_date, contract_href,
+        spec_number, parent_id, parent_spec, parent_expiration, parent_contract_href,
+        companies, parent_companies, has_children, managed_by_conductor,
+        is_visible, is_archived, assigned_to, department_id, flow_id,
+        current_stage_id, stage_entered
+    )
+    SELECT
+        c.id, c.description, c.financial_id, c.expiration_date, c.contract_href,
+        (
+            SELECT value FROM contract_property
+            WHERE contract_id = c.id AND lower(key) = 'spec number'
+            ORDER BY id LIMIT 1
+        ),
+        c.parent_id,
+        (
+            SELECT value FROM contract_property
+            WHERE contract_id = c.parent_id AND lower(key) = 'spec number'
+            ORDER BY id LIMIT 1
+        ),
+        parent.expiration_date, parent.contract_href,
+        ARRAY(
+            SELECT company.company_name FROM company
+            JOIN company_contract_association a ON a.company_id = company.id
+            WHERE a.contract_id = c.id ORDER BY company.company_name
+        ),
+        ARRAY(
+            SELECT company.company_name FROM company
+            JOIN company_contract_association a ON a.company_id = company.id
+            WHERE a.contract_id = c.parent_id ORDER BY company.company_name
+        ),
+        EXISTS (SELECT 1 FROM contract child WHERE child.parent_id = c.id),
+        coalesce(contract_type.managed_by_conductor, false),
+        c.is_visible, c.is_archived, c.assigned_to, c.department_id,
+        c.flow_id, c.current_stage_id, contract_stage.entered
+    FROM contract c
+    LEFT OUTER JOIN contract parent ON parent.id = c.parent_id
+    LEFT OUTER JOIN contract_type ON contract_type.id = c.contract_type_id
+    LEFT OUTER JOIN contract_stage ON
+        contract_stage.contract_id = c.id AND
+        contract_stage.stage_id = c.current_stage_id AND
+        contract_stage.flow_id = c.flow_id
+    {where}
+'''
+
+def refresh_conductor_dashboard(connection, contract_ids=None):
+    '''Rebuild the Conductor dashboard rows for a set of contracts
+
+    The rows of the passed contracts, their children, and their parents
+    are deleted and inserted again from the current state of the
+    contracts. Each rebuilt contract is locked with a transaction-level
+    advisory lock, so two transactions can't insert the same row. A full
+    rebuild locks the whole table against other writers instead.
+
+    Arguments:
+        connection: Connection or session to run the rebuild on
+        contract_ids: List of contract ids to rebuild, or None to
+            rebuild every row
+
+    Returns:
+        Sorted list of the contract ids whose rows were rebuilt, or None
+        if every row was rebuilt
+    '''
+    if contract_ids is None:
+        connection.execute(db.text('LOCK TABLE conductor_dashboard IN SHARE ROW EXCLUSIVE MODE'))
+        connection.execute(db.text('DELETE FROM conductor_dashboard'))
+        connection.execute(db.text(REFRESH_CONDUCTOR_DASHBOARD.format(where='')))
+        return None
+
+    contract_ids = sorted(set(
+        row[0] for row in connection.execute(
+            db.text(EXPAND_CONTRACT_IDS), {'contract_ids': list(contract_ids)}
+        )
+    ) | set(contract_ids))
+
+    # lock in id order so that two transactions can't deadlock on each other
+    connection.execute(db.text('''
+        SELECT pg_advisory_xact_lock(hashtext('conductor_dashboard'), id)
+        FROM (SELECT unnest(CAST(:contract_ids AS integer[])) AS id ORDER BY 1) ids
+    '''), {'contract_ids': contract_ids})
+
+    connection.execute(
+        db.text('DELETE FROM conductor_dashboard WHERE contract_id = ANY(:contract_ids)'),
+        {'contract_ids': contract_ids}
+    )
+    connection.execute(db.text(REFRESH_CONDUCTOR_DASHBOARD.format(
+        where='WHERE c.id = ANY(:contract_ids)'
+    )), {'contract_ids': contract_ids})
+
+    return contract_ids
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_flush')
+def refresh_flushed_conductor_dashboard_rows(session, flush_context):
+    '''Rebuild the dashboard rows of the contracts changed by a flush
+
+    This runs inside the flush, so the dashboard always agrees with the
+    contracts in the same transaction, including reads that autoflush
+    first. The session's new, dirty, and deleted objects and their
+    attribute history still describe the flush at this point, and new
+    objects already have their ids.
+    '''
+    from purchasing.data.contracts import ContractBase, ContractProperty, ContractType
+    from purchasing.data.contract_stages import ContractStage
+    from purchasing.data.companies import Company, company_contract_association_table
+
+    contract_ids, company_ids, contract_type_ids = set(), set(), set()
+
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, ContractBase):
+            contract_ids.add(obj.id)
+            # the old parent may have lost its only child
+            contract_ids.update(
+                sqlalchemy.orm.attributes.get_history(obj, 'parent_id').deleted
+            )
+        elif isinstance(obj, (ContractProperty, ContractStage)):
+            contract_ids.add(obj.contract_id)
+        elif isinstance(obj, Company):
+            company_ids.add(obj.id)
+        elif isinstance(obj, ContractType) and obj not in session.new:
+            contract_type_ids.add(obj.id)
+
+    connection = session.connection()
+
+    if company_ids:
+        contract_ids.update(row[0] for row in connection.execute(
+            db.select([company_contract_association_table.c.contract_id]).where(
+                company_contract_association_table.c.company_id.in_(company_ids)
+            )
+        ))
+
+    if contract_type_ids:
+        contract_ids.update(row[0] for row in connection.execute(
+            db.select([ContractBase.__table__.c.id]).where(
+                ContractBase.__table__.c.contract_type_id.in_(contract_type_ids)
+            )
+        ))
+
+    contract_ids.discard(None)
+    if contract_ids:
+        refresh_conductor_dashboard(connection, contract_ids)
@@ -3,9 +3,9 @@
 import datetime
 from collections import defaultdict
 
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm.exc import FlushError
+import sqlalchemy
 from sqlalchemy.dialects.postgres import ARRAY
+from flask_login import current_user
 
 from purchasing.database import db, Model, Column
 from purchasing.utils import localize_datetime
@@ -43,6 +43,27 @@ class Flow(Model):
     def __unicode__(self):
         return self.flow_name
 
+    @property
+    def stage_positions(self):
+        '''Map of each stage id in the flow's ``stage_order`` to its position
+
+        The map is built the first time it is used and kept on the flow
+        until ``stage_order`` is set again or the flow is expired, so
+        comparing the order of stages is a dictionary lookup instead of
+        a scan of ``stage_order``. Changing ``stage_order`` in place isn't
+        tracked, so assign a new list instead.
+
+        Returns:
+            Dictionary of stage id to its index in ``stage_order``
+        '''
+        positions = self.__dict__.get('_stage_positions')
+        if positions is None:
+            positions = dict(
+                (stage_id, ix) for ix, stage_id in enumerate(self.stage_order or [])
+            )
+            self.__dict__['_stage_positions'] = positions
+        return positions
+
     @classmethod
     def all_flow_query_factory(cls):
         '''Query factory that returns query of all flows
@@ -68,7 +89,10 @@ class Flow(Model):
         '''Creates new rows in contract_stage table.
 
         Extracts the rows out of the given flow, and creates new rows
-        in the contract_stage table for each of them.
+        in the contract_stage table for each of them. All of the rows are
+        inserted in a single statement that skips the ones that already
+        exist, and then all of the flow's contract stages are selected
+        in one more query.
 
         If the stages already exist, that means that the contract
         is switching back into a flow that it had already been in.
@@ -85,30 +109,40 @@ class Flow(Model):
             whether the we are "reverting")
 
         '''
-        revert = False
-        contract_stages = []
-        for stage_id in self.stage_order:
-            try:
-                contract_stages.append(ContractStage.create(
-                    contract_id=contract.id,
-                    flow_id=self.id,
-                    stage_id=stage_id,
-                ))
-            except (IntegrityError, FlushError):
-                revert = True
-                db.session.rollback()
-                stage = ContractStage.query.filter(
-                    ContractStage.contract_id == contract.id,
-                    ContractStage.flow_id == self.id,
-                    ContractStage.stage_id == stage_id
-                ).first()
-                if stage:
-                    contract_stages.append(stage)
-                else:
-                    raise IntegrityError
-
-            except Exception:
-                raise
+        stage_order = self.stage_order or []
+        if len(stage_order) == 0:
+            contract.flow_id = self.id
+            db.session.commit()
+            return self.stage_order, [], False
+
+        # raw statements don't autoflush, and the contract needs its id
+        db.session.flush()
+
+        # the raw insert skips the before_insert listener, so the
+        # audit columns are set here instead
+        inserted = db.session.execute(db.text('''
+            INSERT INTO contract_stage (
+                id, contract_id, flow_id, stage_id, created_at, created_by_id
+            )
+            SELECT
+                nextval('autoincr_contract_stage_id'), :contract_id, :flow_id,
+                stage_id, :created_at, :created_by_id
+            FROM unnest(CAST(:stage_ids AS integer[])) stage_id
+            ON CONFLICT DO NOTHING
+            RETURNING stage_id
+        '''), {
+            'contract_id': contract.id, 'flow_id': self.id, 'stage_ids': stage_order,
+            'created_at': datetime.datetime.utcnow(),
+            'created_by_id': current_user.id if hasattr(current_user, 'id') and not current_user.is_anonymous() else None
+        }).fetchall()
+        revert = len(inserted) < len(set(stage_order))
+
+        existing = dict((i.stage_id, i) for i in ContractStage.query.filter(
+            ContractStage.contract_id == contract.id,
+            ContractStage.flow_id == self.id,
+            ContractStage.stage_id.in_(stage_order)
+        ))
+        contract_stages = [existing[stage_id] for stage_id in stage_order]
 
         contract.flow_id = self.id
         db.session.commit()
@@ -267,3 +301,12 @@ class Flow(Model):
         ''', {
             'flow_id': self.id
         }).fetchall()
+
+@sqlalchemy.event.listens_for(Flow.stage_order, 'set')
+def reset_stage_positions_on_set(target, value, oldvalue, initiator):
+    target.__dict__.pop('_stage_positions', None)
+
+@sqlalchemy.event.listens_for(Flow, 'expire')
+def reset_stage_positions_on_expire(target, attrs):
+    if attrs is None or 'stage_order' in attrs:
+        target.__dict__.pop('_stage_positions', None)
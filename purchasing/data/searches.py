@@ -1,13 +1,36 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+
+from sqlalchemy.schema import Table
+
 from purchasing.database import db, Model, Column
-from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.dialects.postgresql import TSVECTOR, ARRAY
+
+search_view_refresh_queue_table = Table(
+    'search_view_refresh_queue', Model.metadata,
+    Column('id', db.Integer, primary_key=True),
+    Column('contract_id', db.Integer, nullable=False, index=True),
+    Column('queued_at', db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+)
 
 class SearchView(Model):
-    '''SearchView is a materialized view with all of our text columns
+    '''SearchView is a table with all of our text columns
+
+    The search view was originally a materialized view, but refreshing it
+    rebuilt every row for every contract. It is now a regular table with
+    exactly one row per contract that is maintained incrementally: when a
+    contract or one of its related objects changes, only that contract's
+    row is deleted and re-inserted by the ``refresh_search_view_contracts``
+    database function. Companies, contract properties, and line items are
+    aggregated into the row, so searches never have to collapse duplicate
+    rows back down to one per contract.
 
     See Also:
-        For more detailed information about how this materialized view
+        :py:class:`~purchasing.database.RefreshSearchViewMixin` for how
+        stale contracts are tracked and rebuilt.
+
+        For more detailed information about how the search view
         is set up, please refer to `Multi-Table Full Text Search with Postgres,
         Flask, and Sqlalchemy (Part I)
         <http://bensmithgall.com/blog/full-text-search-flask-sqlalchemy/>`_.
@@ -17,38 +40,43 @@ class SearchView(Model):
         <http://www.postgresql.org/docs/current/static/textsearch-intro.html>`_
 
     Attributes:
-        id: Primary key unique ID for result
-        contract_id: Unique ID for one contract
-        company_id: Unique ID for one company
+        contract_id: Primary key, unique ID for one contract
         financial_id: Financial ID for a contract
         expiration_date: Date a contract expires
         contract_description: Description of the goods or services
             provided by a :py:class:`~purchasing.data.contracts.ContractBase`
         tsv_contract_description: `TSVECTOR`_ of the contract description
-        company_name: Name of the company providing services from the
-            :py:class:`~purchasing.data.companies.Company` model
-        tsv_company_name: `TSVECTOR`_ of the company name
-        detail_key: :py:class:`~purchasing.data.contracts.ContractProperty` key
-        detail_value: :py:class:`~purchasing.data.contracts.ContractProperty` value
+        company_ids: Array of unique IDs for the companies
+            providing services on the contract
+        company_names: Array of names of the companies providing services
+            from the :py:class:`~purchasing.data.companies.Company` model,
+            in the same order as ``company_ids``
+        company_name: Comma-separated string of all of the company names
+        tsv_company_name: `TSVECTOR`_ of the company names
+        detail_value: All :py:class:`~purchasing.data.contracts.ContractProperty`
+            values for the contract
         tsv_detail_value: `TSVECTOR`_ of the detail_value
-        line_item_description: Description of a line item from the
-            :py:class:`~purchasing.data.contracts.LineItem` model
-        tsv_line_item_description: `TSVECTOR`_ of the line item description
+        line_item_description: All line item descriptions from the
+            :py:class:`~purchasing.data.contracts.LineItem` model for the contract
+        tsv_line_item_description: `TSVECTOR`_ of the line item descriptions
+        weighted_tsv: Combined `TSVECTOR`_ used to rank search results.
+            Company names and contract descriptions are weighted A, line
+            item descriptions B, and contract detail values D
 
     '''
     __tablename__ = 'search_view'
 
-    id = Column(db.Text, primary_key=True, index=True)
-    contract_id = Column(db.Integer)
-    company_id = Column(db.Integer)
+    contract_id = Column(db.Integer, primary_key=True)
     financial_id = Column(db.String(255))
     expiration_date = Column(db.Date)
     contract_description = Column(db.Text)
     tsv_contract_description = Column(TSVECTOR)
+    company_ids = Column(ARRAY(db.Integer))
+    company_names = Column(ARRAY(db.Text))
     company_name = Column(db.Text)
     tsv_company_name = Column(TSVECTOR)
-    detail_key = Column(db.Text)
     detail_value = Column(db.Text)
     tsv_detail_value = Column(TSVECTOR)
     line_item_description = Column(db.Text)
     tsv_line_item_description = Column(TSVECTOR)
+    weighted_tsv = Column(TSVECTOR)
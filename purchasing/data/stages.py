@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from purchasing.database import db, Model, Column
+from purchasing.database import db, Model, Column, ReferenceDataMixin
 
-class Stage(Model):
+class Stage(ReferenceDataMixin, Model):
     '''Model for individual conductor stages
 
     Attributes:
@@ -29,4 +29,6 @@ class Stage(Model):
     def choices_factory(cls):
         '''Return a two-tuple of (stage id, stage name) for all stages
         '''
-        return [(i.id, i.name) for i in cls.query.all()]
+        return cls.cached_reference_data(
+            'choices', lambda: [(i.id, i.name) for i in cls.query.all()]
+        )
@@ -2,21 +2,24 @@
 """Database module, including the SQLAlchemy database object and DB-related
 utilities.
 """
+import copy
+import uuid
 import datetime
+import itertools
 
 import sqlalchemy
 
-from purchasing.extensions import cache
+from flask import current_app
 from flask_login import current_user
 
 from sqlalchemy.sql.functions import GenericFunction
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, make_transient_to_detached
 
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.ext.declarative import declared_attr
 
-from .extensions import db
+from .extensions import db, cache
 from .compat import basestring
 
 # Alias common SQLAlchemy names
@@ -137,15 +140,56 @@ def before_update(mapper, connection, instance):
         instance.updated_by_id = current_user.id if hasattr(current_user, 'id') and not current_user.is_anonymous() else None
 
 
+SEARCH_VIEW_DIRTY_KEY = 'search_view_dirty'
+
 def refresh_search_view(mapper, connection, target):
-    # only fire the trigger if the object itself was actually modified
-    if db.session.object_session(target).is_modified(target, include_collections=False):
-        if cache.get('refresh-lock') is None:
-            cache.set('refresh-lock', True)
-            from purchasing.tasks import rebuild_search_view
-            rebuild_search_view.delay()
-        else:
-            return
+    '''Queue the search view rows for a modified object to be rebuilt
+
+    Rather than rebuilding the search view on every write, we add the ids
+    of the contracts whose rows are affected by this change to the
+    ``search_view_refresh_queue`` table. Because the queue is written with
+    the same connection that is flushing the object, queued contracts are
+    committed (or rolled back) together with the change itself, so no
+    update can be lost.
+
+    See Also:
+        :py:func:`~purchasing.tasks.schedule_search_view_refresh`
+    '''
+    session = db.session.object_session(target)
+    if session is None:
+        return
+
+    # only queue rows if the object itself was actually modified
+    if session.is_modified(target, include_collections=False) or target in session.deleted:
+        contract_ids = set(
+            i for i in target.get_search_view_contract_ids(connection) if i is not None
+        )
+        if contract_ids:
+            from purchasing.data.searches import search_view_refresh_queue_table
+            connection.execute(
+                search_view_refresh_queue_table.insert(),
+                [{'contract_id': i} for i in contract_ids]
+            )
+            session.info[SEARCH_VIEW_DIRTY_KEY] = True
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_commit')
+def dispatch_search_view_refresh(session):
+    '''Schedule a rebuild of the queued search view rows after a commit
+    '''
+    if session.info.pop(SEARCH_VIEW_DIRTY_KEY, None):
+        from purchasing.tasks import schedule_search_view_refresh
+        # the queued rows are already committed, so if the broker can't be
+        # reached they are left for the scheduler's periodic refresh
+        try:
+            schedule_search_view_refresh()
+        except Exception, e:
+            current_app.logger.exception(e)
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_rollback')
+def discard_search_view_refresh(session):
+    '''Forget about queued search view rows if the transaction is rolled back
+    '''
+    session.info.pop(SEARCH_VIEW_DIRTY_KEY, None)
 
 class RefreshSearchViewMixin(object):
     '''Mixin to trigger a search view refresh.
@@ -159,7 +203,13 @@ class RefreshSearchViewMixin(object):
     happen when the events are fired by SQLAlchemy, and a ``__declare_last__``
     method, which allows the events to be attached to the models after all
     the SQLAlchemy mappers are declared. In this case, our ``event_handler``
-    is used to trigger a referesh on our materialized search view.
+    is used to queue the rows in our search view that belong to the changed
+    contracts. Queued rows are rebuilt in the background at most once per
+    ``SEARCH_VIEW_REFRESH_WINDOW`` seconds, so a single edit never rebuilds
+    the whole view and a burst of edits only triggers one rebuild.
+
+    Subclasses should implement ``get_search_view_contract_ids`` to return
+    the ids of the contracts whose search view rows they affect.
 
     See Also:
         For a brief discussion on using Model mixins to create event listeners,
@@ -179,11 +229,182 @@ class RefreshSearchViewMixin(object):
     def event_handler(cls, *args, **kwargs):
         return refresh_search_view(*args, **kwargs)
 
+    def get_search_view_contract_ids(self, connection):
+        '''Return the contract ids whose search view rows this object affects
+
+        Arguments:
+            connection: The connection currently being used to flush
+                the object, which can be used to look up related rows
+
+        Returns:
+            List of contract ids, defaults to an empty list
+        '''
+        return []
+
     @classmethod
     def __declare_last__(cls):
         for event_name in LISTEN_FOR_EVENTS:
             sqlalchemy.event.listen(cls, event_name, cls.event_handler, propagate=False)
 
+REFERENCE_DATA_DIRTY_KEY = 'reference_data_dirty'
+
+# per-process cache of reference data, keyed by (tablename, name), with
+# values of (generation, data)
+_reference_data = {}
+
+def reference_data_generation_key(tablename):
+    return 'reference-data-generation-{}'.format(tablename)
+
+def get_reference_data_generation(tablename):
+    '''Get the current generation of a reference data table
+
+    The generation is shared by every process through the cache and is
+    replaced whenever a change to the table is committed. If it has been
+    evicted from the cache, a new one is started, which invalidates any
+    reference data that processes are holding on to.
+
+    Arguments:
+        tablename: Name of the reference data table
+
+    Returns:
+        String generation of the table
+    '''
+    key = reference_data_generation_key(tablename)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, timeout=0)
+        generation = cache.get(key)
+    return generation
+
+def bump_reference_data_generation(tablename):
+    '''Invalidate the reference data of a table in every process
+    '''
+    cache.set(reference_data_generation_key(tablename), uuid.uuid4().hex, timeout=0)
+
+def mark_reference_data_dirty(mapper, connection, target):
+    '''Record that a reference data table was changed in this transaction
+    '''
+    session = db.session.object_session(target)
+    if session is not None:
+        session.info.setdefault(REFERENCE_DATA_DIRTY_KEY, set()).add(target.__tablename__)
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_commit')
+def dispatch_reference_data_invalidation(session):
+    '''Invalidate cached reference data for tables changed in a commit
+    '''
+    for tablename in session.info.pop(REFERENCE_DATA_DIRTY_KEY, set()):
+        bump_reference_data_generation(tablename)
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_rollback')
+def discard_reference_data_invalidation(session):
+    '''Forget about reference data changes if the transaction is rolled back
+    '''
+    session.info.pop(REFERENCE_DATA_DIRTY_KEY, None)
+
+class ReferenceDataMixin(object):
+    '''Mixin to cache small lookup tables in each process
+
+    Lookup tables like departments, stages, and contract types are used to
+    build the choices for dropdowns on almost every page but almost never
+    change. Models that subclass this mixin can use
+    ``cached_reference_data`` and ``cached_reference_objects`` to keep
+    the results of those queries in memory.
+
+    Cached data is tagged with the generation of its table. After any
+    insert, update, or delete of the model is committed, a new generation
+    is stored in the shared cache, so every process reloads the data the
+    next time it is used. Changes made with bulk ``query.update()`` or
+    ``query.delete()`` calls or raw SQL don't fire these events, so the
+    generation has to be bumped manually after them with
+    :py:func:`~purchasing.database.bump_reference_data_generation`.
+
+    See Also:
+        :py:class:`~purchasing.database.RefreshSearchViewMixin`, which
+        uses the same events to keep the search view up to date
+    '''
+
+    @classmethod
+    def _has_pending_reference_changes(cls):
+        session = db.session()
+        return cls.__tablename__ in session.info.get(REFERENCE_DATA_DIRTY_KEY, ()) or any(
+            isinstance(i, cls) for i in itertools.chain(session.new, session.dirty, session.deleted)
+        )
+
+    @classmethod
+    def cached_reference_data(cls, name, loader):
+        '''Return the result of a loader, cached until the table changes
+
+        If the current session has uncommitted changes to the table, the
+        loader is always run so that the session sees its own changes.
+
+        Arguments:
+            name: Name for this piece of reference data, unique per model
+            loader: Callable with no arguments which returns the data.
+                The data must not contain any model instances.
+
+        Returns:
+            The (possibly cached) result of calling ``loader``
+        '''
+        if cls._has_pending_reference_changes():
+            return loader()
+
+        key = (cls.__tablename__, name)
+        generation = get_reference_data_generation(cls.__tablename__)
+        if generation is None:
+            # the cache isn't storing anything, so there is no way to
+            # find out when the table changes
+            return loader()
+
+        cached = _reference_data.get(key)
+        if cached is None or cached[0] != generation:
+            cached = (generation, loader())
+            _reference_data[key] = cached
+        return cached[1]
+
+    @classmethod
+    def cached_reference_objects(cls, name, query_factory):
+        '''Return model instances, cached until the table changes
+
+        Only the column values of each instance are cached. They are
+        rebuilt into instances that are attached to the current session
+        without being loaded from the database, and instances that the
+        session already has are returned as they are.
+
+        Arguments:
+            name: Name for this piece of reference data, unique per model
+            query_factory: Callable with no arguments which returns a
+                query or list of instances of the model
+
+        Returns:
+            List of instances of the model
+        '''
+        mapper = sqlalchemy.inspect(cls)
+        columns = [i.key for i in mapper.column_attrs]
+
+        rows = cls.cached_reference_data(name, lambda: [
+            dict((column, getattr(i, column)) for column in columns)
+            for i in query_factory()
+        ])
+
+        session, instances = db.session(), []
+        for row in rows:
+            instance = mapper.class_manager.new_instance()
+            for column, value in row.items():
+                setattr(instance, column, copy.copy(value))
+
+            identity_key = mapper.identity_key_from_instance(instance)
+            if identity_key in session.identity_map:
+                instances.append(session.identity_map[identity_key])
+            else:
+                make_transient_to_detached(instance)
+                instances.append(session.merge(instance, load=False))
+        return instances
+
+    @classmethod
+    def __declare_last__(cls):
+        for event_name in LISTEN_FOR_EVENTS:
+            sqlalchemy.event.listen(cls, event_name, mark_reference_data_dirty, propagate=False)
+
 # From Mike Bayer's "Building the app" talk
 # https://speakerdeck.com/zzzeek/building-the-app
 class SurrogatePK(object):
@@ -236,6 +457,10 @@ class TSRank(GenericFunction):
     package = 'full_text'
     name = 'ts_rank'
 
+class TSRankCD(GenericFunction):
+    package = 'full_text'
+    name = 'ts_rank_cd'
+
 class SplitPart(GenericFunction):
     package = 'string'
     name = 'split_part'
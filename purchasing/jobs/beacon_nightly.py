@@ -1,13 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import datetime
-from flask import current_app
+import hashlib
+from flask import current_app, render_template
 
-from purchasing.extensions import db
+from purchasing.extensions import db, cache
 from purchasing.notifications import Notification
 from purchasing.jobs.job_base import JobBase, EmailJobBase
 
-from purchasing.opportunities.models import Opportunity, Vendor, Category
+from purchasing.opportunities.models import Opportunity, Vendor
 from purchasing.public.models import AppStatus
 
 @JobBase.register
@@ -23,18 +24,19 @@ class BeaconNewOppotunityOpenJob(EmailJobBase):
             for each new Opportunity. For each Opportunity, the ``to_email`` field
             is the union of all followers of the opportunity and any followers of
             any categories that the Opportunity has
+
+        See Also:
+            :py:meth:`~purchasing.opportunities.models.Vendor.opportunity_subscribers`,
+            which finds the followers of every opportunity in one query
         '''
         notifications = []
-        for opportunity in self.get_opportunities():
-            opp_categories = [i.id for i in opportunity.categories]
-
-            category_vendors = Vendor.query.filter(
-                Vendor.categories.any(Category.id.in_(opp_categories))
-            ).all()
+        opportunities = self.get_opportunities()
+        subscribers = Vendor.opportunity_subscribers([i.id for i in opportunities])
 
+        for opportunity in opportunities:
             notifications.append(
                 Notification(
-                    to_email=set([i.email for i in category_vendors] + [i.email for i in opportunity.vendors]),
+                    to_email=subscribers[opportunity.id],
                     cc_email=list(),
                     from_email=current_app.config['BEACON_SENDER'],
                     subject='A new City of Pittsburgh opportunity from Beacon!',
@@ -62,17 +64,27 @@ class BeaconNewOppotunityOpenJob(EmailJobBase):
             Opportunity.is_public == True
         ).all()
 
+BEACON_DIGEST_KEY = 'beacon-biweekly-digest-{}'
+
 @JobBase.register
 class BeaconBiweeklyDigestJob(EmailJobBase):
     '''Send a biweekly update of all non-expired Opportunities posted to Beacon
     '''
-    def run_job(self, job):
-        '''Runs the biweekly update job and updates the app status as necessary
+    schedule = '0 7 1,15 * *'
+
+    def on_finish(self, job):
+        '''Advance the app status once the digest has been sent
+
+        This runs once every chunk of the digest has been sent or has
+        failed, not when ``run_job`` returns, because the digest is still
+        sending then. The newsletter date is set to when the job started,
+        so opportunities published while it was sending go in the next one.
         '''
-        did_run = super(BeaconBiweeklyDigestJob, self).run_job(job)
-        if did_run.status == 'success':
+        if job.status in ['success', 'partial']:
             current_status = AppStatus.query.first()
-            current_status.update(last_beacon_newsletter=datetime.datetime.utcnow())
+            current_status.update(
+                last_beacon_newsletter=job.started_at or datetime.datetime.utcnow()
+            )
 
     def should_run(self):
         '''Returns true only if we are on the first or fifteenth of the month or time_override is True
@@ -83,25 +95,69 @@ class BeaconBiweeklyDigestJob(EmailJobBase):
         '''Implements EmailJobBase build_notifications method
 
         Returns:
-            list of :py:class:`~purchasing.notifications.Notification` objects, one
-            for each non-expired opportunity that has been published since the last
-            Beacon newsletter was sent out
+            list with a single :py:class:`~purchasing.notifications.Notification`
+            of the digest built by
+            :py:meth:`~purchasing.jobs.beacon_nightly.BeaconBiweeklyDigestJob.build_digest`,
+            sent to every newsletter subscriber
         '''
-        notifications = []
+        digest = self.build_digest()
 
-        opportunities = self.get_opportunities()
-
-        notifications.append(
+        return [
             Notification(
-                to_email=set([i.email for i in Vendor.newsletter_subscribers()]),
+                to_email=Vendor.newsletter_subscriber_emails(),
                 from_email=current_app.config['BEACON_SENDER'],
                 subject='Your biweekly Beacon opportunity summary',
-                html_template='opportunities/emails/biweeklydigest.html',
-                txt_template='opportunities/emails/biweeklydigest.txt',
-                opportunities=opportunities
+                html_body=digest['html'], txt_body=digest['txt']
             )
-        )
-        return notifications
+        ]
+
+    def digest_key(self):
+        '''Build the cache key of the digest for the current opportunities
+
+        The key is a hash of the id and last update time of each opportunity
+        in the digest, so it changes whenever an opportunity is added,
+        removed, or edited. Only those two columns are queried.
+
+        Returns:
+            Cache key of the rendered digest
+        '''
+        versions = self.get_opportunities_query().with_entities(
+            Opportunity.id, Opportunity.updated_at
+        ).order_by(Opportunity.id).all()
+
+        return BEACON_DIGEST_KEY.format(hashlib.sha1(
+            ','.join('{}:{}'.format(id, updated_at) for id, updated_at in versions)
+        ).hexdigest())
+
+    def build_digest(self):
+        '''Render the digest of all opportunities, or get it from the cache
+
+        The rendered digest is cached by its set of opportunities, so running
+        the job again (for example to resend after a partial failure) neither
+        reloads the opportunities nor renders the templates again.
+
+        Returns:
+            Dictionary with the rendered ``html`` and ``txt`` bodies
+        '''
+        key = self.digest_key()
+        digest = cache.get(key)
+
+        if digest is None:
+            opportunities = self.get_opportunities()
+            digest = {
+                'html': render_template(
+                    'opportunities/emails/biweeklydigest.html', opportunities=opportunities
+                ),
+                'txt': render_template(
+                    'opportunities/emails/biweeklydigest.txt', opportunities=opportunities
+                )
+            }
+            cache.set(
+                key, digest,
+                timeout=current_app.config.get('BEACON_DIGEST_CACHE_TIMEOUT', 60 * 60 * 24 * 14)
+            )
+
+        return digest
 
     def get_opportunities(self):
         '''Get bulk opportunities to send to businesses
@@ -111,10 +167,18 @@ class BeaconBiweeklyDigestJob(EmailJobBase):
             that have a ``published_at`` date after the last newsletter was sent out
             and expire on or after today
         '''
+        return self.get_opportunities_query().all()
+
+    def get_opportunities_query(self):
+        '''Build the query for :py:meth:`~purchasing.jobs.beacon_nightly.BeaconBiweeklyDigestJob.get_opportunities`
+
+        Returns:
+            Sqlalchemy query of the opportunities in the digest
+        '''
         current_status = AppStatus.query.first()
         return Opportunity.query.filter(
             Opportunity.published_at > db.func.coalesce(
                 current_status.last_beacon_newsletter, datetime.date(2010, 1, 1)
             ), Opportunity.is_public == True,
             Opportunity.planned_submission_end >= datetime.date.today()
-        ).all()
+        )
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+import pytz
+
+# (name, lowest value, highest value) of each field of a cron expression
+CRON_FIELDS = [
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    # sunday is both 0 and 7
+    ('weekday', 0, 7),
+]
+
+# how far ahead to look for the next run before giving up on a schedule
+# that can never match, such as the 31st of February
+MAX_LOOKAHEAD_DAYS = 366 * 5
+
+class CronParseError(ValueError):
+    pass
+
+def parse_field(field, low, high):
+    '''Parse one field of a cron expression into the values it matches
+
+    Supports ``*``, single values, ranges (``1-5``), steps (``*/15``,
+    ``0-30/10``) and comma separated lists of any of them.
+
+    Arguments:
+        field: The field to parse
+        low: Lowest value the field can have
+        high: Highest value the field can have
+
+    Returns:
+        Sorted list of the values that the field matches
+
+    Raises:
+        CronParseError: If the field isn't valid
+    '''
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            if not step.isdigit() or int(step) == 0:
+                raise CronParseError('Invalid step in cron field: {}'.format(field))
+            step = int(step)
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = part.split('-', 1)
+            if not (start.isdigit() and end.isdigit()):
+                raise CronParseError('Invalid range in cron field: {}'.format(field))
+            start, end = int(start), int(end)
+        elif part.isdigit():
+            start = end = int(part)
+            if step != 1:
+                end = high
+        else:
+            raise CronParseError('Invalid cron field: {}'.format(field))
+
+        if start < low or end > high or start > end:
+            raise CronParseError('Cron field out of range: {}'.format(field))
+
+        values.update(range(start, end + 1, step))
+
+    return sorted(values)
+
+class CronSchedule(object):
+    '''A schedule from a standard five field cron expression
+
+    The fields are minute, hour, day of the month, month, and day of the
+    week, with Sunday as 0. As in cron, if both the day of the month and
+    the day of the week are restricted, a day matches if either of them do.
+
+    Arguments:
+        expression: Cron expression, for example ``0 7 * * 1-5``
+        timezone: pytz timezone that the expression's times are in
+
+    Raises:
+        CronParseError: If the expression isn't valid
+    '''
+    def __init__(self, expression, timezone=pytz.UTC):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise CronParseError('Cron expressions need five fields: {}'.format(expression))
+
+        self.expression = expression
+        self.timezone = timezone
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            parse_field(field, low, high) for field, (_, low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.weekdays = sorted(set(i % 7 for i in weekdays))
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def matches_date(self, date):
+        '''Check if the schedule runs on a date
+
+        Arguments:
+            date: datetime.date to check
+
+        Returns:
+            True if the schedule runs on the date, False otherwise
+        '''
+        if date.month not in self.months:
+            return False
+
+        # python counts weekdays from monday, cron from sunday
+        day = date.day in self.days
+        weekday = (date.weekday() + 1) % 7 in self.weekdays
+
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, after):
+        '''Find the next time the schedule runs
+
+        Times are matched in the schedule's timezone. Runs during a
+        daylight savings gap happen at the same wall time in standard time,
+        and runs during an overlap happen once.
+
+        Arguments:
+            after: timezone aware datetime.datetime
+
+        Returns:
+            Timezone aware datetime.datetime in UTC of the first run
+            strictly after ``after``, or None if the schedule never runs
+        '''
+        date = after.astimezone(self.timezone).date()
+
+        for _ in range(MAX_LOOKAHEAD_DAYS):
+            if self.matches_date(date):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = self.timezone.localize(
+                            datetime.datetime.combine(date, datetime.time(hour, minute))
+                        ).astimezone(pytz.UTC)
+                        if candidate > after:
+                            return candidate
+            date += datetime.timedelta(days=1)
+
+        return None
@@ -1,13 +1,25 @@
 # -*- coding: utf-8 -*-
 
+import time
 import datetime
+import threading
 from purchasing.database import Model, db, get_or_create
 
 import pytz
+import sqlalchemy
 
 EASTERN = pytz.timezone('US/Eastern')
 UTC = pytz.UTC
 
+# the final status of a job once all of its email chunks have been sent
+CHUNKED_JOB_STATUS = '''
+    CASE
+        WHEN chunks_failed = 0 THEN 'success'
+        WHEN chunks_sent = 0 THEN 'failed'
+        ELSE 'partial'
+    END
+'''
+
 class JobStatus(Model):
     '''Model to track nightly job status and reporting
 
@@ -17,9 +29,24 @@ class JobStatus(Model):
         name: Name of the job
         date: Date the job is scheduled for
         status: String of the job status, defaults to 'new',
-            set to 'started', 'success', 'failure', or 'skipped'
+            set to 'queued', 'started', 'sending', 'success', 'partial',
+            'failed', or 'skipped'
         info: Any additional reporting about the job status,
             such as an error message if the job fails
+        chunks_total: Number of email chunks sent by the job
+        chunks_sent: Number of email chunks that were sent successfully
+        chunks_failed: Number of email chunks that failed after all retries
+        started_at: Timestamp for when the job started running
+        finished_at: Timestamp for when the job got its final status, which
+            for email jobs is once every chunk has reported back
+        duration: Number of seconds from the job starting to it finishing
+        claimed_by: Token of the task that has claimed the job
+        lease_expires_at: Timestamp for when the claim on the job expires,
+            after which it can be claimed again
+        query_count: Number of database queries the job ran
+        query_time: Number of seconds the job spent running database queries
+        notifications_built: Number of notifications the job built
+        messages_sent: Number of email messages the job sent
     '''
     __tablename__ = 'job_status'
 
@@ -27,12 +54,187 @@ class JobStatus(Model):
     date = db.Column(db.DateTime, primary_key=True)
     status = db.Column(db.String, default='new')
     info = db.Column(db.Text)
+    chunks_total = db.Column(db.Integer, default=0, nullable=False)
+    chunks_sent = db.Column(db.Integer, default=0, nullable=False)
+    chunks_failed = db.Column(db.Integer, default=0, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)
+    claimed_by = db.Column(db.String(255))
+    lease_expires_at = db.Column(db.DateTime)
+    query_count = db.Column(db.Integer)
+    query_time = db.Column(db.Float)
+    notifications_built = db.Column(db.Integer)
+    messages_sent = db.Column(db.Integer, default=0, nullable=False)
+
+    def add_chunks(self, count):
+        '''Add to the number of email chunks the job is sending
+
+        Arguments:
+            count: Number of new chunks
+        '''
+        self.update(chunks_total=JobStatus.chunks_total + count)
+
+    def finish_sending(self):
+        '''Mark that all of the job's email chunks have been dispatched
+
+        If every chunk has already reported back, the job gets its final
+        status right away. Otherwise its status is set to 'sending', and the
+        last chunk to report back sets the final status in
+        :py:meth:`~purchasing.jobs.job_base.JobStatus.record_chunk`.
+        '''
+        db.session.execute(db.text('''
+            UPDATE job_status SET status = CASE
+                WHEN chunks_sent + chunks_failed >= chunks_total THEN {final}
+                ELSE 'sending'
+            END
+            WHERE name = :name AND date = :date
+        '''.format(final=CHUNKED_JOB_STATUS)), {'name': self.name, 'date': self.date})
+        db.session.commit()
+
+    @classmethod
+    def record_messages(cls, name, date, count):
+        '''Add to the number of email messages a job has sent
+
+        Arguments:
+            name: Name of the job
+            date: Date of the job
+            count: Number of messages that were sent
+        '''
+        db.session.execute(db.text('''
+            UPDATE job_status SET messages_sent = messages_sent + :count
+            WHERE name = :name AND date = :date
+        '''), {'name': name, 'date': date, 'count': count})
+        db.session.commit()
+
+    @classmethod
+    def record_chunk(cls, name, date, sent, info=None, messages=0):
+        '''Record the outcome of one of a job's email chunks
+
+        The counters are incremented in the database, so chunks running
+        in parallel can't overwrite each other's outcomes.
+
+        Arguments:
+            name: Name of the job
+            date: Date of the job
+            sent: True if the chunk was sent, False if it failed
+            info: Error message to append to the job's ``info`` if the chunk failed
+            messages: Number of messages the chunk sent
+        '''
+        params = {'name': name, 'date': date, 'info': info, 'messages': messages}
+        column = 'chunks_sent' if sent else 'chunks_failed'
+
+        db.session.execute(db.text('''
+            UPDATE job_status SET
+                {column} = {column} + 1,
+                messages_sent = messages_sent + :messages,
+                info = CASE
+                    WHEN CAST(:info AS TEXT) IS NULL THEN info
+                    ELSE coalesce(info || E'\\n', '') || :info
+                END
+            WHERE name = :name AND date = :date
+        '''.format(column=column)), params)
+
+        db.session.execute(db.text('''
+            UPDATE job_status SET status = {final}
+            WHERE name = :name AND date = :date AND status = 'sending'
+            AND chunks_sent + chunks_failed >= chunks_total
+        '''.format(final=CHUNKED_JOB_STATUS)), params)
+        finished = cls.mark_finished(name, date, commit=False)
+
+        db.session.commit()
+
+        if finished:
+            from purchasing.jobs.runner import job_finished
+            job_finished(name, date)
+
+    @classmethod
+    def mark_finished(cls, name, date, commit=True):
+        '''Stamp when a job finished, once it has its final status
+
+        A job that is still running, or still sending its email chunks,
+        hasn't finished yet. Email chunks can report back while the job is
+        still dispatching them, so only a job with one of the final
+        statuses is finished. The job is only ever marked as finished once,
+        so whichever of the job's runner and its last chunk gets its final
+        status in first is the one that finishes it.
+
+        Arguments:
+            name: Name of the job
+            date: Date of the job
+            commit: Whether to commit
+
+        Returns:
+            True if the job was marked as finished by this call, False
+            if it doesn't have its final status yet or had already finished
+        '''
+        result = db.session.execute(db.text('''
+            UPDATE job_status SET
+                finished_at = :now, lease_expires_at = NULL,
+                duration = EXTRACT(EPOCH FROM CAST(:now AS TIMESTAMP) - started_at)
+            WHERE name = :name AND date = :date
+            AND finished_at IS NULL AND status IN ('success', 'partial', 'failed', 'skipped')
+            RETURNING name
+        '''), {'name': name, 'date': date, 'now': datetime.datetime.utcnow()}).fetchall()
+        if commit:
+            db.session.commit()
+        return len(result) == 1
+
+class QueryCounter(object):
+    '''Count the database queries run by the current thread
+
+    Used as a context manager, it listens to the engine's cursor events
+    while the block runs. Queries run by other threads on the same engine,
+    such as a :py:class:`~purchasing.jobs.runner.LeaseHeartbeat`, are
+    not counted.
+
+    Arguments:
+        engine: Sqlalchemy engine to count the queries on
+
+    Attributes:
+        count: Number of queries run
+        time: Number of seconds spent running queries
+    '''
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.time = 0.0
+        self.thread = None
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.current_thread() is self.thread:
+            conn.info.setdefault('query_counter_start', []).append(time.time())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.current_thread() is self.thread and conn.info.get('query_counter_start'):
+            self.count += 1
+            self.time += time.time() - conn.info['query_counter_start'].pop()
+
+    def __enter__(self):
+        self.thread = threading.current_thread()
+        sqlalchemy.event.listen(self.engine, 'before_cursor_execute', self.before_cursor_execute)
+        sqlalchemy.event.listen(self.engine, 'after_cursor_execute', self.after_cursor_execute)
+        return self
+
+    def __exit__(self, *args):
+        sqlalchemy.event.remove(self.engine, 'before_cursor_execute', self.before_cursor_execute)
+        sqlalchemy.event.remove(self.engine, 'after_cursor_execute', self.after_cursor_execute)
 
 class JobBase(object):
     '''Base model for nightly jobs
 
     Attributes:
         jobs: jobs is a list of all jobs currently registered against the JobBase.
+        depends_on: List of the names of jobs that have to finish before
+            this job can run, if they are scheduled for the same day
+        time_limit: Number of seconds the job can run for before it is
+            stopped, defaults to the ``JOB_TIME_LIMIT`` config value
+        schedule: Cron expression of when the
+            :py:class:`~purchasing.jobs.scheduler.Scheduler` dispatches the
+            job, or None to only run it from the management commands.
+            Defaults to 7AM every day.
+        schedule_timezone: Timezone the ``schedule`` is in, defaults to
+            US/Eastern
 
     Arguments:
         name: the name instance variable is just the class name of the job.
@@ -46,6 +248,10 @@ class JobBase(object):
         self.time_override = time_override
 
     jobs = []
+    depends_on = []
+    time_limit = None
+    schedule = '0 7 * * *'
+    schedule_timezone = EASTERN
 
     @classmethod
     def register(cls, subcl):
@@ -141,6 +347,19 @@ class JobBase(object):
 
                 return model, exists
 
+    def on_finish(self, job):
+        '''Called once the job has its final status
+
+        For email jobs this is after every email chunk has been sent or
+        has failed, which can be well after ``run_job`` returns. Does
+        nothing by default.
+
+        Arguments:
+            job: :py:class:`~purchasing.jobs.job_base.JobStatus` object
+                with the job's final status
+        '''
+        pass
+
     def run_job(self, job):
         '''Run a job. Must be implemented by subclasses
 
@@ -173,11 +392,18 @@ class EmailJobBase(JobBase):
 
         1. Set the job status to "started"
         2. Call the :py:func:`~purchasing.jobs.job_base.EmailJobBase.build_notifications`
-           method to get a list of notification batches to send
-        3. For each batches of notifications to send, try to send them
+           method to get a list of notification batches to send, and
+           record how many were built
+        3. For each batches of notifications to send, try to send them with
+           :py:meth:`~purchasing.notifications.Notification.send_batch`,
+           which splits them into chunks that are sent in parallel
         4. If at any point we fail, update the status to 'failed',
            and provide additional information
-        5. If all notifications send successfully, update the status to 'success'
+        5. If all notifications are dispatched successfully, each chunk
+           reports back once it is sent or has failed all of its retries.
+           When they have all reported back, the status is set to 'success'
+           if every chunk was sent, 'partial' if only some were, or 'failed'
+           if none of them were.
 
         Arguments:
             job: :py:class:`~purchasing.jobs.job_base.JobStatus` object
@@ -189,16 +415,17 @@ class EmailJobBase(JobBase):
         if self.should_run():
             if job:
                 success = True
-                job.update(status='started')
+                job.update(status='started', chunks_total=0, chunks_sent=0, chunks_failed=0)
                 notifications = self.build_notifications()
+                job.update(notifications_built=len(notifications))
                 for notification in notifications:
                     try:
-                        notification.send(multi=True)
+                        notification.send_batch(job=job)
                     except Exception, e:
                         job.update(status='failed', info=str(e))
                         success = False
                 if success:
-                    job.update(status='success')
+                    job.finish_sending()
 
             return job
         else:
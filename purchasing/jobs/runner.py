@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+import uuid
+import logging
+import datetime
+import threading
+
+from flask import current_app
+from celery.exceptions import SoftTimeLimitExceeded
+
+from purchasing.database import db
+from purchasing.jobs.job_base import JobBase, JobStatus, QueryCounter
+
+# the lease heartbeat runs outside of the app context, so it can't use
+# the app's logger
+logger = logging.getLogger(__name__)
+
+def get_job_class(name):
+    '''Look up a registered job by name
+
+    Arguments:
+        name: Class name of the job, as stored on :py:class:`~purchasing.jobs.job_base.JobStatus`
+
+    Returns:
+        The registered :py:class:`~purchasing.jobs.job_base.JobBase` subclass,
+        or None if there is no job with that name
+    '''
+    for job in JobBase.jobs:
+        if job.__name__ == name:
+            return job
+    return None
+
+UTC_NOW = "(now() AT TIME ZONE 'utc')"
+
+def lease_timeout():
+    return current_app.config.get('JOB_LEASE_TIMEOUT', 5 * 60)
+
+def claimable_jobs():
+    '''Query for jobs that can be claimed
+
+    A job can be claimed if it is new, or if it was claimed but the lease
+    on it expired before it finished, which means that whatever was
+    running it has died.
+
+    Returns:
+        Sqlalchemy query of :py:class:`~purchasing.jobs.job_base.JobStatus` objects
+    '''
+    return JobStatus.query.filter(db.or_(
+        JobStatus.status == 'new',
+        db.and_(
+            JobStatus.status.in_(['queued', 'started']),
+            JobStatus.finished_at == None,
+            JobStatus.lease_expires_at < db.func.timezone('utc', db.func.now())
+        )
+    ))
+
+def claim_job(name, date, status, token=None):
+    '''Atomically claim a job if no one else holds it
+
+    Arguments:
+        name: Name of the job
+        date: Date of the job
+        status: Status to set on the job
+        token: Unique token identifying the claim. If one is passed, the
+            claim is leased for ``JOB_LEASE_TIMEOUT`` seconds, and has to be
+            renewed with :py:func:`~purchasing.jobs.runner.renew_lease`
+            to keep holding it.
+
+    Returns:
+        True if the job was claimed, False if someone else holds it
+    '''
+    result = db.session.execute(db.text('''
+        UPDATE job_status SET
+            status = :status, claimed_by = :token,
+            lease_expires_at = CASE
+                WHEN CAST(:token AS TEXT) IS NULL THEN NULL
+                ELSE {now} + :lease * interval '1 second'
+            END
+        WHERE name = :name AND date = :date AND (
+            status = 'new' OR (
+                status IN ('queued', 'started') AND finished_at IS NULL
+                AND lease_expires_at < {now}
+            )
+        )
+        RETURNING name
+    '''.format(now=UTC_NOW)), {
+        'name': name, 'date': date, 'status': status,
+        'token': token, 'lease': lease_timeout()
+    }).fetchall()
+    db.session.commit()
+    return len(result) == 1
+
+RENEW_LEASE = db.text('''
+    UPDATE job_status SET lease_expires_at = {now} + :lease * interval '1 second'
+    WHERE name = :name AND date = :date AND claimed_by = :token
+    AND finished_at IS NULL
+    RETURNING name
+'''.format(now=UTC_NOW))
+
+def renew_lease(name, date, token, connection=None):
+    '''Extend the lease on a claimed job
+
+    Arguments:
+        name: Name of the job
+        date: Date of the job
+        token: Token the job was claimed with
+        connection: Optional connection to use instead of the session
+
+    Returns:
+        True if the claim is still held, False if the job has been
+        claimed by someone else since
+    '''
+    params = {'name': name, 'date': date, 'token': token, 'lease': lease_timeout()}
+    if connection is not None:
+        return len(connection.execute(RENEW_LEASE, params).fetchall()) == 1
+
+    result = db.session.execute(RENEW_LEASE, params).fetchall()
+    db.session.commit()
+    return len(result) == 1
+
+class LeaseHeartbeat(threading.Thread):
+    '''Background thread that keeps renewing the lease on a running job
+
+    Arguments:
+        engine: Sqlalchemy engine to renew the lease with
+        name: Name of the job
+        date: Date of the job
+        token: Token the job was claimed with
+        lease: Length of the lease in seconds, the lease is renewed
+            three times per lease
+    '''
+    def __init__(self, engine, name, date, token, lease):
+        super(LeaseHeartbeat, self).__init__()
+        self.daemon = True
+        self.engine = engine
+        self.name, self.date, self.token = name, date, token
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.lease / 3.0):
+            try:
+                with self.engine.begin() as conn:
+                    renewed = conn.execute(RENEW_LEASE, {
+                        'name': self.name, 'date': self.date,
+                        'token': self.token, 'lease': self.lease
+                    }).fetchall()
+                if not renewed:
+                    logger.warning(
+                        'JOBLEASE | {} is no longer claimed by this task'.format(self.name)
+                    )
+            except Exception:
+                # try again on the next beat, the lease is long enough to
+                # survive a missed renewal
+                logger.exception(
+                    'JOBLEASE | Could not renew the lease on {}'.format(self.name)
+                )
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def dispatch_ready_jobs(ignore_time=False):
+    '''Dispatch every new job whose dependencies have finished to Celery
+
+    Each job runs in its own :py:func:`~purchasing.tasks.run_nightly_job`
+    task, so independent jobs run in parallel across workers. Jobs that
+    declare ``depends_on`` wait until every job they depend on that is
+    scheduled for the same day has finished. When a job finishes, it calls
+    this function again to dispatch the jobs that were waiting on it. If a
+    dependency fails, the jobs that depend on it are marked as failed
+    without being run.
+
+    Jobs are claimed with an atomic update before they are dispatched, so
+    each job is only ever dispatched once, even with several schedulers
+    running at the same time. The claim is a lease that the running job
+    keeps renewing. If the worker running a job dies, its lease expires
+    and the job can be claimed and dispatched again.
+
+    Arguments:
+        ignore_time: Passed to each job as its ``time_override``
+
+    Returns:
+        List of the names of the dispatched jobs
+    '''
+    from purchasing.tasks import run_nightly_job
+
+    dispatched = []
+
+    jobs = claimable_jobs().all()
+    for job in jobs:
+        job_class = get_job_class(job.name)
+        if job_class is None:
+            continue
+
+        dependencies = JobStatus.query.filter(
+            JobStatus.date == job.date,
+            JobStatus.name.in_(job_class.depends_on)
+        ).all() if job_class.depends_on else []
+
+        failed = [i.name for i in dependencies if i.status == 'failed' and i.finished_at]
+        if failed:
+            if claim_job(job.name, job.date, 'failed'):
+                JobStatus.query.get((job.name, job.date)).update(
+                    info='Dependencies failed: {}'.format(', '.join(failed))
+                )
+            continue
+
+        if any(i.finished_at is None for i in dependencies):
+            continue
+
+        token = uuid.uuid4().hex
+        if claim_job(job.name, job.date, 'queued', token):
+            time_limit = job_class.time_limit or current_app.config.get('JOB_TIME_LIMIT', 60 * 60)
+            run_nightly_job.apply_async(
+                args=(job.name, job.date, ignore_time, token),
+                soft_time_limit=time_limit, time_limit=time_limit + 60
+            )
+            dispatched.append(job.name)
+
+    return dispatched
+
+def run_job(name, date, ignore_time=False, token=None):
+    '''Run a single job, recording when it started and finished
+
+    The job is only run if the claim it was dispatched with is still
+    held, so a task that is delivered twice, or that was queued for so
+    long that its lease expired and the job was dispatched again, does
+    nothing. While the job runs, a :py:class:`~purchasing.jobs.runner.LeaseHeartbeat`
+    keeps its lease from expiring.
+
+    The number of queries the job runs and the time spent running them
+    are recorded with a :py:class:`~purchasing.jobs.job_base.QueryCounter`.
+
+    Any error, including the job going over its soft time limit, marks
+    the job as failed. Once the job has its final status, it is marked as
+    finished and any jobs that were waiting on it are dispatched. Email
+    jobs that are still sending get their final status, and are finished,
+    when their last chunk reports back.
+
+    Arguments:
+        name: Name of the job
+        date: Date of the job
+        ignore_time: Passed to the job as its ``time_override``
+        token: Token the job was claimed with
+    '''
+    job = JobStatus.query.get((name, date))
+    job_class = get_job_class(name)
+    if job is None or job_class is None:
+        return
+
+    if token is not None and not renew_lease(name, date, token):
+        current_app.logger.info(
+            'JOBSKIP | {} is no longer claimed by this task, skipping'.format(name)
+        )
+        return
+
+    heartbeat = None
+    if token is not None:
+        heartbeat = LeaseHeartbeat(db.engine, name, date, token, lease_timeout())
+        heartbeat.start()
+
+    job.update(started_at=datetime.datetime.utcnow())
+    queries = QueryCounter(db.engine)
+    try:
+        with queries:
+            job_class(time_override=ignore_time).run_job(job)
+    except SoftTimeLimitExceeded:
+        db.session.rollback()
+        job.update(status='failed', info='Job went over its time limit')
+    except Exception, e:
+        db.session.rollback()
+        current_app.logger.exception(e)
+        job.update(status='failed', info=str(e))
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+
+        job.update(query_count=queries.count, query_time=queries.time)
+
+    # email jobs that are still sending are finished by their last chunk
+    if JobStatus.mark_finished(name, date):
+        job_finished(name, date, ignore_time)
+
+def job_finished(name, date, ignore_time=False):
+    '''Run a job's on_finish hook and dispatch the jobs waiting on it
+
+    Called once a job has its final status and has been marked as
+    finished with :py:meth:`~purchasing.jobs.job_base.JobStatus.mark_finished`.
+
+    Arguments:
+        name: Name of the job
+        date: Date of the job
+        ignore_time: Passed to the jobs that are dispatched as their ``time_override``
+    '''
+    job = JobStatus.query.get((name, date))
+    job_class = get_job_class(name)
+
+    if job is not None and job_class is not None:
+        try:
+            job_class(time_override=ignore_time).on_finish(job)
+        except Exception, e:
+            db.session.rollback()
+            current_app.logger.exception(e)
+
+    dispatch_ready_jobs(ignore_time)
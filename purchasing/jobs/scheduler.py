@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import time
+import datetime
+
+import pytz
+from flask import current_app
+
+from purchasing.database import db
+from purchasing.jobs.job_base import JobBase
+from purchasing.jobs.cron import CronSchedule
+from purchasing.jobs.runner import dispatch_ready_jobs
+from purchasing.tasks import dispatch_email_outbox, refresh_search_view_queue
+
+# Celery tasks that are sent on a schedule without being tracked as jobs,
+# as two-tuples of (cron expression in UTC, task)
+PERIODIC_TASKS = [
+    # retries failed outbox emails, and sends any whose dispatch was lost
+    ('*/5 * * * *', dispatch_email_outbox),
+    # rebuilds queued search view rows whose refresh was never scheduled
+    ('*/5 * * * *', refresh_search_view_queue),
+]
+
+def utc_now():
+    return pytz.UTC.localize(datetime.datetime.utcnow())
+
+class Scheduler(object):
+    '''Long-running process that dispatches jobs at their scheduled times
+
+    Every registered job with a ``schedule`` is scheduled and dispatched
+    to Celery as soon as its next run time comes up, instead of waiting
+    for ``schedule_work`` and ``do_work`` to be called. Jobs are scheduled
+    with :py:meth:`~purchasing.jobs.job_base.JobBase.schedule_job` and
+    dispatched with :py:func:`~purchasing.jobs.runner.dispatch_ready_jobs`,
+    so dependencies between jobs are still honored, and running more than
+    one scheduler never runs a job twice.
+
+    Runs that are missed while the scheduler isn't running are not made
+    up. ``manage.py schedule_work`` and ``do_work`` still work for that.
+
+    The scheduler also sends periodic Celery tasks, such as the email
+    outbox dispatch, which run many times a day and so can't be tracked
+    with a :py:class:`~purchasing.jobs.job_base.JobStatus`.
+
+    Arguments:
+        jobs: List of :py:class:`~purchasing.jobs.job_base.JobBase`
+            subclasses, defaults to all registered jobs
+        max_sleep: Maximum number of seconds to sleep at a time, so that
+            changes to the system clock are picked up
+        tasks: List of two-tuples of (cron expression, Celery task),
+            defaults to ``PERIODIC_TASKS``
+    '''
+    def __init__(self, jobs=None, max_sleep=60, tasks=None):
+        self.jobs = [
+            job for job in (jobs if jobs is not None else JobBase.jobs)
+            if job.schedule is not None
+        ]
+        self.schedules = dict(
+            (job, CronSchedule(job.schedule, job.schedule_timezone)) for job in self.jobs
+        )
+        self.tasks = dict(
+            (task, CronSchedule(schedule))
+            for schedule, task in (tasks if tasks is not None else PERIODIC_TASKS)
+        )
+        self.max_sleep = max_sleep
+        self.next_runs = {}
+        self.next_task_runs = {}
+
+    def reset(self, now):
+        '''Compute the next run of every job and task after a point in time
+
+        Arguments:
+            now: Timezone aware datetime.datetime
+        '''
+        self.next_runs = dict(
+            (job, self.schedules[job].next_after(now)) for job in self.jobs
+        )
+        self.next_task_runs = dict(
+            (task, schedule.next_after(now)) for task, schedule in self.tasks.items()
+        )
+
+    def next_wakeup(self):
+        '''Returns the earliest next run of any job or task, or None if there are none
+        '''
+        runs = [
+            i for i in self.next_runs.values() + self.next_task_runs.values()
+            if i is not None
+        ]
+        return min(runs) if runs else None
+
+    def tick(self, now):
+        '''Schedule and dispatch every job and send every task that is due
+
+        Arguments:
+            now: Timezone aware datetime.datetime
+
+        Returns:
+            List of the names of the jobs and tasks that were due
+        '''
+        due_tasks = [
+            task for task, next_run in self.next_task_runs.items()
+            if next_run is not None and next_run <= now
+        ]
+
+        for task in due_tasks:
+            current_app.logger.info('SCHEDULER | {} is due, sending'.format(task.name))
+            self.next_task_runs[task] = self.tasks[task].next_after(now)
+            try:
+                task.delay()
+            except Exception, e:
+                current_app.logger.exception(e)
+
+        due = [
+            job for job, next_run in self.next_runs.items()
+            if next_run is not None and next_run <= now
+        ]
+
+        for job in due:
+            current_app.logger.info('SCHEDULER | {} is due, scheduling'.format(job.__name__))
+            job(time_override=True).schedule_job()
+            db.session.commit()
+            self.next_runs[job] = self.schedules[job].next_after(now)
+
+        if due:
+            dispatch_ready_jobs()
+            db.session.remove()
+
+        return [job.__name__ for job in due] + [task.name for task in due_tasks]
+
+    def run(self, sleep=time.sleep, now=utc_now):
+        '''Run the scheduler forever
+
+        Arguments:
+            sleep: Function to sleep for a number of seconds
+            now: Function that returns the current timezone aware time
+        '''
+        self.reset(now())
+        while True:
+            wakeup = self.next_wakeup()
+            if wakeup is None:
+                current_app.logger.info('SCHEDULER | No jobs or tasks have a schedule, stopping')
+                return
+
+            wait = (wakeup - now()).total_seconds()
+            if wait > 0:
+                sleep(min(wait, self.max_sleep))
+                continue
+
+            try:
+                self.tick(now())
+            except Exception, e:
+                db.session.rollback()
+                current_app.logger.exception(e)
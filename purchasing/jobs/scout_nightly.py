@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+from collections import OrderedDict
 
 from purchasing.jobs.job_base import EmailJobBase, JobBase
 from purchasing.notifications import Notification
 from purchasing.tasks import scrape_county_task
 
-from purchasing.data.contracts import ContractBase
+from purchasing.users.models import User
+from purchasing.data.contracts import ContractBase, contract_user_association_table
 
 @JobBase.register
 class CountyScrapeJob(JobBase):
@@ -16,9 +18,12 @@ class CountyScrapeJob(JobBase):
         * :py:func:`purchasing.data.importer.scrape_county.main`
         * :py:func:`purchasing.tasks.scrape_county_task`
     '''
+    schedule = '0 2 * * *'
+
     @property
     def start_time(self):
         '''Override default start time, kick scrape task off immediately
+        when scheduled from the management commands
         '''
         return None
 
@@ -31,32 +36,123 @@ class CountyScrapeJob(JobBase):
 class ScoutJobBase(EmailJobBase):
     '''Base class for Scout email notifications
 
+    Attributes:
+        digest: If True, each follower gets a single email about all of
+            their expiring contracts. If False, one email is sent for
+            each expiring contract to all of its followers.
+
     See Also:
         :py:class:`~purchasing.notifications.Notification`
     '''
+    digest = True
+
     @property
     def notification_props(self):
         '''Placeholder for properties to be assigned to the Notification class.
 
         Based on the implementation, this dictionary should include at least a
-        'subjct' and 'html_template' key.
+        'subjct' and 'html_template' key, and 'digest_subject' and
+        'digest_html_template' keys for digests of more than one contract.
 
         Raises:
             NotImplementedError
         '''
         raise NotImplementedError
 
-    def get_expiring_contracts(self):
-        '''Get expiring contracts. Must be implemented in subclasses
+    def expiring_contracts_query(self):
+        '''Query for expiring contracts. Must be implemented in subclasses
 
         Raises:
             NotImplementedError
         '''
         raise NotImplementedError
 
-    def build_notifications(self):
+    def get_expiring_contracts(self):
+        '''Get expiring contracts
+
+        Returns:
+            List of :py:class:`~purchasing.data.contracts.ContractBase` objects
+            from :py:meth:`~purchasing.jobs.scout_nightly.ScoutJobBase.expiring_contracts_query`
         '''
+        return self.expiring_contracts_query().all()
+
+    def get_followed_contracts(self):
+        '''Group expiring contracts by the followers who should hear about them
+
+        The contracts and the emails of their followers are fetched in a
+        single joined query. Followers who follow exactly the same set of
+        expiring contracts are grouped together, so they can share one
+        rendered email.
+
+        Returns:
+            List of two-tuples of (list of follower emails, list of
+            :py:class:`~purchasing.data.contracts.ContractBase` objects)
+        '''
+        follows = self.expiring_contracts_query().join(
+            contract_user_association_table,
+            contract_user_association_table.c.contract_id == ContractBase.id
+        ).join(
+            User, User.id == contract_user_association_table.c.user_id
+        ).add_columns(User.email).order_by(
+            User.email, ContractBase.expiration_date, ContractBase.id
+        )
+
+        by_follower = OrderedDict()
+        for contract, email in follows:
+            by_follower.setdefault(email, []).append(contract)
+
+        by_contracts = OrderedDict()
+        for email, contracts in by_follower.items():
+            key = tuple(i.id for i in contracts)
+            by_contracts.setdefault(key, ([], contracts))[0].append(email)
+
+        return by_contracts.values()
+
+    def build_digest_notifications(self):
+        '''Build one notification for each group of followers
+
+        Returns:
+            List of :py:class:`~purchasing.notifications.Notification` objects.
+            Followers of a single expiring contract get the same email as
+            they would without a digest, and followers of several get one
+            email listing all of them.
+
+        See Also:
+            :py:meth:`~purchasing.jobs.scout_nightly.ScoutJobBase.get_followed_contracts`
         '''
+        notifications = []
+        for emails, contracts in self.get_followed_contracts():
+            if len(contracts) == 1:
+                notifications.append(
+                    Notification(
+                        to_email=emails,
+                        subject=self.notification_props['subject'],
+                        html_template=self.notification_props['html_template'],
+                        contract=contracts[0]
+                    )
+                )
+            else:
+                notifications.append(
+                    Notification(
+                        to_email=emails,
+                        subject=self.notification_props['digest_subject'],
+                        html_template=self.notification_props['digest_html_template'],
+                        contracts=contracts
+                    )
+                )
+        return notifications
+
+    def build_notifications(self):
+        '''Implements EmailJobBase build_notifications method
+
+        Returns:
+            list of :py:class:`~purchasing.notifications.Notification` objects,
+            one for each group of followers if ``digest`` is True, otherwise
+            one for each expiring contract
+        '''
+        if self.digest:
+            return self.build_digest_notifications()
+
         notifications = []
         for contract in self.get_expiring_contracts():
             notifications.append(
@@ -77,19 +173,21 @@ class ScoutContractsExpireTodayJob(ScoutJobBase):
     def notification_props(self):
         return {
             'html_template': '/scout/emails/expired_contract.html',
-            'subject': 'A contract that you follow has expired'
+            'subject': 'A contract that you follow has expired',
+            'digest_html_template': '/scout/emails/expired_contracts_digest.html',
+            'digest_subject': 'Contracts that you follow have expired'
         }
 
-    def get_expiring_contracts(self):
-        '''Get all contracts expiring today
+    def expiring_contracts_query(self):
+        '''Query for all contracts expiring today
 
         Returns:
-            List of :py:class:`~purchasing.data.contracts.ContractBase` objects
+            Query of :py:class:`~purchasing.data.contracts.ContractBase` objects
             that expire today
         '''
         return ContractBase.query.filter(
             ContractBase.expiration_date == datetime.date.today(),
-        ).all()
+        )
 
 @JobBase.register
 class ScoutContractsExpireSoonJob(ScoutJobBase):
@@ -99,17 +197,19 @@ class ScoutContractsExpireSoonJob(ScoutJobBase):
     def notification_props(self):
         return {
             'html_template': '/scout/emails/expiring_soon_contract.html',
-            'subject': 'A contract that you follow will expire soon'
+            'subject': 'A contract that you follow will expire soon',
+            'digest_html_template': '/scout/emails/expiring_soon_contracts_digest.html',
+            'digest_subject': 'Contracts that you follow will expire soon'
         }
 
-    def get_expiring_contracts(self):
-        '''Get all contracts expiring today
+    def expiring_contracts_query(self):
+        '''Query for all contracts expiring in 30 days
 
         Returns:
-            List of :py:class:`~purchasing.data.contracts.ContractBase` objects
+            Query of :py:class:`~purchasing.data.contracts.ContractBase` objects
             that expire in 30 days
         '''
         return ContractBase.query.filter(
             ContractBase.expiration_date ==
             datetime.date.today() + datetime.timedelta(days=30),
-        ).all()
+        )
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import uuid
 import collections
 
+import sqlalchemy
+
 from werkzeug import secure_filename
 from werkzeug.datastructures import FileStorage
 
@@ -9,7 +12,12 @@ from flask import render_template, current_app
 from flask_mail import Message
 
 from purchasing.compat import basestring
-from purchasing.tasks import send_email
+from purchasing.extensions import cache, db
+from purchasing.public.models import EmailOutbox
+from purchasing.tasks import send_email, send_email_batch, schedule_email_outbox_dispatch
+
+NOTIFICATION_PAYLOAD_KEY = 'notification-payload-{}'
+EMAIL_OUTBOX_DIRTY_KEY = 'email_outbox_dirty'
 
 class Notification(object):
     '''Build a new notification object
@@ -28,6 +36,10 @@ class Notification(object):
         txt_template: path to a jinja text template to be compiled
         attachments: list of `FileStorage`_ objects
         reply_to: valid email that will be used and reply-to
+        html_body: Already rendered html body. If passed, the
+            ``html_template`` is not rendered
+        txt_body: Already rendered text body. If passed, the
+            ``txt_template`` is not rendered
         convert_args: Flag as to whether to convert all additional \**kwargs
             passed to the Notification as a dictionary to the html/txt
             templates
@@ -40,19 +52,25 @@ class Notification(object):
         cc_email=[], subject='',
         html_template='/public/emails/email_admins.html',
         txt_template=None, attachments=[], reply_to=None,
-        convert_args=False, *args, **kwargs
+        html_body=None, txt_body=None, convert_args=False, *args, **kwargs
     ):
         self.to_email = self.handle_recipients(to_email)
         self.from_email = from_email if from_email else current_app.config['MAIL_DEFAULT_SENDER']
         self.reply_to = reply_to
         self.cc_email = self.handle_recipients(cc_email)
         self.subject = subject
-        self.html_body = self.build_msg_body(html_template, convert_args, *args, **kwargs)
-        if txt_template:
+        if html_body is not None:
+            self.html_body = html_body
+        else:
+            self.html_body = self.build_msg_body(html_template, convert_args, *args, **kwargs)
+        if txt_body is not None:
+            self.txt_body = txt_body
+        elif txt_template:
             self.txt_body = self.build_msg_body(txt_template, convert_args, *args, **kwargs)
         else:
             self.txt_body = ''
         self.attachments = attachments
+        self._attachment_data = None
 
     def build_msg_body(self, template, convert_args, *args, **kwargs):
         '''Build an HTML or text message body for an email
@@ -153,6 +171,38 @@ class Notification(object):
             raise Exception('Unsupported recipient type: {}'.format(type(recipient)))
         return recipient
 
+    def read_attachments(self):
+        '''Read the data of the notification's attachments
+
+        Attachment streams can only be read once, so the data is stored
+        on the notification and reused for every message that is built.
+
+        Returns:
+            List of three-tuples of (filename, content type, data)
+        '''
+        if self._attachment_data is None:
+            self._attachment_data = [
+                (secure_filename(attachment.filename), attachment.content_type, attachment.stream.read())
+                for attachment in self.attachments
+                if isinstance(attachment, FileStorage) and secure_filename(attachment.filename) != ''
+            ]
+        return self._attachment_data
+
+    def build_payload(self):
+        '''Build everything needed to send the notification except the recipients
+
+        Returns:
+            Dictionary of keyword arguments for a `Message`_ and a list of
+            ``attachments``, as returned by
+            :py:meth:`~purchasing.notifications.Notification.read_attachments`
+        '''
+        return dict(
+            subject='[Pittsburgh Purchasing] {}'.format(self.subject),
+            html=self.html_body, body=self.txt_body,
+            sender=self.from_email, reply_to=self.reply_to,
+            cc=self.cc_email, attachments=self.read_attachments()
+        )
+
     def build_msg(self, recipient):
         '''Builds a `Message`_ object with body, attachments
 
@@ -176,16 +226,8 @@ class Notification(object):
                 recipients=self.handle_recipients(recipient), cc=self.cc_email
             )
 
-            for attachment in self.attachments:
-                if (
-                    isinstance(attachment, FileStorage) and
-                    secure_filename(attachment.filename) != ''
-                ):
-                        msg.attach(
-                            filename=secure_filename(attachment.filename),
-                            content_type=attachment.content_type,
-                            data=attachment.stream.read()
-                        )
+            for filename, content_type, data in self.read_attachments():
+                msg.attach(filename=filename, content_type=content_type, data=data)
 
             return msg
 
@@ -234,3 +276,110 @@ class Notification(object):
         else:
             send_email.run(msgs)
         return True
+
+    def queue(self, multi=False):
+        '''Add the notification to the email outbox
+
+        The email is added to the current database session, so it is only
+        sent if the session is committed. Once it is, a
+        :py:func:`~purchasing.tasks.dispatch_email_outbox` task is scheduled
+        to send it. This keeps sending out of the request, and an email that
+        fails to send is retried instead of lost.
+
+        Keyword Arguments:
+            multi: If True, multi will build an individual Notification for each
+                recipient. If False, a single Notification will be created with
+                all of the recipients visible in the ``to`` line.
+
+        Returns:
+            The new :py:class:`~purchasing.public.models.EmailOutbox` row
+        '''
+        current_app.logger.info(
+            'EMAILQUEUE | Queueing message:\nTo: {}\n:From: {}\nSubject: {}'.format(
+                self.to_email, self.from_email, self.subject
+            )
+        )
+
+        email = EmailOutbox(
+            multi=multi, recipients=self.to_email, payload=self.build_payload()
+        )
+        session = db.session()
+        session.add(email)
+        session.info[EMAIL_OUTBOX_DIRTY_KEY] = True
+        return email
+
+    def send_batch(self, async=True, job=None):
+        '''Send an individual message to each recipient in batches
+
+        This is equivalent to ``send(multi=True)``, but it scales to large
+        numbers of recipients. Instead of building a `Message`_ for every
+        recipient up front, the rendered bodies and attachments are stored
+        once in the cache, and each batch of ``NOTIFICATION_BATCH_SIZE``
+        recipients is sent by a
+        :py:func:`~purchasing.tasks.send_email_batch` task which is only
+        passed the recipients' addresses and the payload's cache key.
+
+        If the cache isn't able to store the payload, it is passed to
+        each task directly. Batches are never larger than ``MAIL_MAX_EMAILS``,
+        so each one can be sent over a single connection.
+
+        Keyword Arguments:
+            async: If True, the sending will be kicked out to Celery worker
+                processes. If False, the sending will occur on the main request thread
+            job: Optional :py:class:`~purchasing.jobs.job_base.JobStatus`, which
+                each batch updates with its outcome
+
+        Returns:
+            List of the recipient batches
+        '''
+        payload = self.build_payload()
+        payload_key = NOTIFICATION_PAYLOAD_KEY.format(uuid.uuid4().hex)
+        cache.set(
+            payload_key, payload,
+            timeout=current_app.config.get('NOTIFICATION_PAYLOAD_TIMEOUT', 60 * 60 * 24)
+        )
+        if cache.get(payload_key) is None:
+            payload_key = payload
+
+        batch_size = current_app.config.get('NOTIFICATION_BATCH_SIZE', 100)
+        if current_app.config.get('MAIL_MAX_EMAILS'):
+            batch_size = min(batch_size, current_app.config['MAIL_MAX_EMAILS'])
+        batches = [
+            self.to_email[i:i + batch_size] for i in range(0, len(self.to_email), batch_size)
+        ]
+
+        current_app.logger.info(
+            'EMAILTRY | Sending message in {} batches:\nTo: {} recipients\n:From: {}\nSubject: {}'.format(
+                len(batches), len(self.to_email), self.from_email, self.subject
+            )
+        )
+
+        job_key = None
+        if job is not None:
+            job.add_chunks(len(batches))
+            job_key = (job.name, job.date)
+
+        for batch in batches:
+            if async:
+                send_email_batch.delay(payload_key, batch, job_key)
+            else:
+                send_email_batch.apply(args=(payload_key, batch, job_key))
+        return batches
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_commit')
+def dispatch_queued_notifications(session):
+    '''Schedule a dispatch of the email outbox after queued emails are committed
+    '''
+    if session.info.pop(EMAIL_OUTBOX_DIRTY_KEY, None):
+        # the emails are already committed, so if the broker can't be reached
+        # they are left for the scheduler's periodic outbox dispatch
+        try:
+            schedule_email_outbox_dispatch()
+        except Exception, e:
+            current_app.logger.exception(e)
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_rollback')
+def discard_queued_notifications(session):
+    '''Forget about queued emails if the transaction is rolled back
+    '''
+    session.info.pop(EMAIL_OUTBOX_DIRTY_KEY, None)
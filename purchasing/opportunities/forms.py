@@ -174,7 +174,7 @@ class CategoryForm(Form):
             all_categories: A list of :py:class:`~purchasing.opportunities.models.Category` objects,
             or None. If None, defaults to all Categories.
         '''
-        all_categories = all_categories if all_categories else Category.query.all()
+        all_categories = all_categories if all_categories else Category.all_categories()
         subcategories = self.build_categories(all_categories)
         self._subcategories = json.dumps(subcategories)
         display_categories = subcategories.keys()
@@ -5,7 +5,7 @@ import datetime
 
 from flask import current_app
 
-from purchasing.database import Column, Model, db, ReferenceCol
+from purchasing.database import Column, Model, db, ReferenceCol, ReferenceDataMixin
 from purchasing.utils import localize_today, localize_now
 
 from sqlalchemy.schema import Table
@@ -35,7 +35,7 @@ opportunity_vendor_association_table = Table(
     Column('vendor_id', db.Integer, db.ForeignKey('vendor.id', ondelete='SET NULL'), index=True)
 )
 
-class Category(Model):
+class Category(ReferenceDataMixin, Model):
     '''Category model for opportunities and Vendor signups
 
     Categories are based on the codes created by the `National Institute
@@ -69,6 +69,16 @@ class Category(Model):
     def __unicode__(self):
         return '{sub} (in {main})'.format(sub=self.category_friendly_name, main=self.category)
 
+    @classmethod
+    def all_categories(cls):
+        '''Get all categories
+
+        Returns:
+            List of all categories, cached in each process until the
+            category table changes
+        '''
+        return cls.cached_reference_objects('all', lambda: cls.query.order_by(cls.id))
+
     @classmethod
     def parent_category_query_factory(cls):
         '''Query factory to return a query of all of the distinct top-level categories
@@ -430,6 +440,9 @@ class Opportunity(Model):
     def notify_approvals(self, user):
         '''Send the approval notifications to everyone with approval rights
 
+        The notifications are added to the email outbox, and are sent
+        once the opportunity is committed.
+
         Arguments:
             user: A :py:class:`~purchasing.users.models.User` object
         '''
@@ -439,7 +452,7 @@ class Opportunity(Model):
             html_template='opportunities/emails/staff_postsubmitted.html',
             txt_template='opportunities/emails/staff_postsubmitted.txt',
             opportunity=self
-        ).send(multi=True)
+        ).queue(multi=True)
 
         Notification(
             to_email=db.session.query(User.email).join(Role, User.role_id == Role.id).filter(
@@ -449,7 +462,7 @@ class Opportunity(Model):
             html_template='opportunities/emails/admin_postforapproval.html',
             txt_template='opportunities/emails/admin_postforapproval.txt',
             opportunity=self
-        ).send(multi=True)
+        ).queue(multi=True)
 
     def send_publish_email(self):
         '''Sends the "new opportunity available" email to subscribed vendors
@@ -531,7 +544,7 @@ class OpportunityDocument(Model):
         '''
         return self.name.replace('_', ' ')
 
-class RequiredBidDocument(Model):
+class RequiredBidDocument(ReferenceDataMixin, Model):
     '''Model for documents that a vendor would be required to provide
 
     There are two types of documents associated with an opportunity -- documents
@@ -574,9 +587,11 @@ class RequiredBidDocument(Model):
         Returns:
             List of two-tuples described in the
             :py:meth:`RequiredBidDocument.get_choices`
-            method
+            method, cached in each process until the document table changes
         '''
-        return [i.get_choices() for i in cls.query.all()]
+        return cls.cached_reference_data(
+            'choices', lambda: [i.get_choices() for i in cls.query.all()]
+        )
 
 class Vendor(Model):
     '''Base Vendor model for businesses interested in Beacon
@@ -642,6 +657,73 @@ class Vendor(Model):
         '''
         return cls.query.filter(cls.subscribed_to_newsletter == True).all()
 
+    @classmethod
+    def newsletter_subscriber_emails(cls, batch_size=1000):
+        '''Get the emails of all vendors signed up to the newsletter
+
+        Only the email column is selected, and rows are fetched from a
+        server-side cursor ``batch_size`` rows at a time, so no Vendor
+        objects are built. The emails themselves are collected into a list
+        in memory: a :py:class:`~purchasing.notifications.Notification`
+        flattens its recipients into a list anyway, and the cursor can't
+        stay open across the commits made while the chunks are sent.
+
+        Arguments:
+            batch_size: Number of rows to fetch from the cursor at a time
+
+        Returns:
+            List of each distinct subscriber email
+        '''
+        query = db.session.query(cls.email).filter(
+            cls.subscribed_to_newsletter == True
+        ).distinct().yield_per(batch_size)
+
+        return [email for (email, ) in query]
+
+    @classmethod
+    def opportunity_subscribers(cls, opportunity_ids):
+        '''Get the emails of the vendors to notify about a set of opportunities
+
+        Vendors are notified about an opportunity if they follow it directly
+        or follow any of its categories. Both are resolved for every
+        opportunity at once with a single query over the association tables.
+
+        Arguments:
+            opportunity_ids: List of :py:class:`~purchasing.opportunities.models.Opportunity` ids
+
+        Returns:
+            Dictionary of opportunity ids to sets of vendor emails. Every
+            passed opportunity id is in the dictionary, even if it has no
+            subscribers.
+        '''
+        subscribers = dict((i, set()) for i in opportunity_ids)
+        if not subscribers:
+            return subscribers
+
+        category_subscribers = db.session.query(
+            category_opportunity_association_table.c.opportunity_id, cls.email
+        ).join(
+            category_vendor_association_table,
+            category_vendor_association_table.c.category_id == category_opportunity_association_table.c.category_id
+        ).join(
+            cls, cls.id == category_vendor_association_table.c.vendor_id
+        ).filter(
+            category_opportunity_association_table.c.opportunity_id.in_(subscribers.keys())
+        )
+
+        opportunity_subscribers = db.session.query(
+            opportunity_vendor_association_table.c.opportunity_id, cls.email
+        ).join(
+            cls, cls.id == opportunity_vendor_association_table.c.vendor_id
+        ).filter(
+            opportunity_vendor_association_table.c.opportunity_id.in_(subscribers.keys())
+        )
+
+        for opportunity_id, email in category_subscribers.union(opportunity_subscribers):
+            subscribers[opportunity_id].add(email)
+
+        return subscribers
+
     def build_downloadable_row(self):
         '''Take a Vendor object and build a list for a .tsv download
 
@@ -169,6 +169,16 @@ def signup_for_opp(form, opportunity, multi=False):
         # TODO -- add support for categories
         pass
 
+    if send_email:
+        Notification(
+            to_email=vendor.email,
+            from_email=current_app.config['BEACON_SENDER'],
+            subject='Subscription confirmation from Beacon',
+            html_template='opportunities/emails/oppselected.html',
+            txt_template='opportunities/emails/oppselected.txt',
+            opportunities=email_opportunities
+        ).queue()
+
     db.session.commit()
 
     current_app.logger.info(
@@ -180,14 +190,4 @@ def signup_for_opp(form, opportunity, multi=False):
         )
     )
 
-    if send_email:
-        Notification(
-            to_email=vendor.email,
-            from_email=current_app.config['BEACON_SENDER'],
-            subject='Subscription confirmation from Beacon',
-            html_template='opportunities/emails/oppselected.html',
-            txt_template='opportunities/emails/oppselected.txt',
-            opportunities=email_opportunities
-        ).send()
-
     return True
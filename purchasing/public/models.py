@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+
+from sqlalchemy.dialects.postgres import ARRAY
+
 from purchasing.database import Column, Model, db
 
 class AppStatus(Model):
@@ -15,6 +19,8 @@ class AppStatus(Model):
             information about the nature of the error
         last_beacon_newsletter: Datetime of the last time a beacon
             newsletter was sent
+        last_search_view_refresh: Datetime of the last time queued
+            rows in the search view were rebuilt
     '''
     __tablename__ = 'app_status'
 
@@ -24,6 +30,81 @@ class AppStatus(Model):
     county_max_deadline = Column(db.DateTime)
     message = Column(db.Text)
     last_beacon_newsletter = Column(db.DateTime)
+    last_search_view_refresh = Column(db.DateTime)
+
+class EmailOutbox(Model):
+    '''Model of an email waiting to be sent
+
+    Emails are added to the outbox in the same transaction as the changes
+    that triggered them, and sent afterwards by
+    :py:func:`~purchasing.tasks.dispatch_email_outbox`. This way an email is
+    only sent if the transaction commits, and is never lost if sending fails.
+
+    Attributes:
+        id: Primary key
+        status: One of 'pending', 'sending', 'sent' or 'failed'
+        created_at: Datetime the email was added to the outbox
+        multi: If True, each recipient gets their own message,
+            otherwise one message is sent to all of the recipients
+        recipients: List of email addresses to send the email to
+        payload: Message payload, as built by
+            :py:meth:`~purchasing.notifications.Notification.build_payload`
+        attempts: Number of times sending the email has been attempted
+        last_error: Error from the last failed attempt
+        locked_until: Datetime the dispatcher that claimed the
+            email gives up its claim
+        sent_at: Datetime the email was sent
+    '''
+    __tablename__ = 'email_outbox'
+
+    id = Column(db.Integer, primary_key=True)
+    status = Column(db.String(255), default='pending', nullable=False, index=True)
+    created_at = Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    multi = Column(db.Boolean, default=False, nullable=False)
+    recipients = Column(ARRAY(db.Text), nullable=False)
+    payload = Column(db.PickleType, nullable=False)
+    attempts = Column(db.Integer, default=0, nullable=False)
+    last_error = Column(db.Text)
+    locked_until = Column(db.DateTime)
+    sent_at = Column(db.DateTime)
+
+    def build_messages(self):
+        '''Build the messages to send for this email
+
+        Returns:
+            List of `Message`_ objects
+        '''
+        from purchasing.tasks import build_message
+
+        if self.multi:
+            return [build_message(self.payload, [i]) for i in self.recipients]
+        return [build_message(self.payload, self.recipients)]
+
+    @classmethod
+    def stats(cls):
+        '''Summarize the outbox backlog and throughput
+
+        Returns:
+            Dictionary with the number of ``pending`` emails, the age in
+            seconds of the ``oldest_pending`` email, the number of emails
+            ``sent_last_hour``, and the number of ``failed`` emails
+        '''
+        now = datetime.datetime.utcnow()
+        pending, oldest, sent, failed = db.session.query(
+            db.func.count(cls.id).filter(cls.status.in_(['pending', 'sending'])),
+            db.func.min(cls.created_at).filter(cls.status.in_(['pending', 'sending'])),
+            db.func.count(cls.id).filter(db.and_(
+                cls.status == 'sent', cls.sent_at > now - datetime.timedelta(hours=1)
+            )),
+            db.func.count(cls.id).filter(cls.status == 'failed'),
+        ).first()
+
+        return {
+            'pending': pending,
+            'oldest_pending': (now - oldest).total_seconds() if oldest else 0,
+            'sent_last_hour': sent,
+            'failed': failed
+        }
 
 class AcceptedEmailDomains(Model):
     '''Model of permitted email domains for new user creation
@@ -9,9 +9,10 @@ import json
 from flask import (
     render_template, jsonify, current_app, send_from_directory, request
 )
-from purchasing.extensions import login_manager, cache
+from purchasing.extensions import login_manager, cache, db
 from purchasing.users.models import User
-from purchasing.public.models import AppStatus
+from purchasing.public.models import AppStatus, EmailOutbox
+from purchasing.scout.util import search_cache_stats
 
 from purchasing.public import blueprint
 
@@ -72,6 +73,22 @@ def status():
     except Exception, e:
         response['status'] = 'Redis is down or unavailable'
 
+    try:
+        search_cache = search_cache_stats()
+        response['resources']['Scout search cache'] = '{:.1f}% hit rate ({} hits, {} misses)'.format(
+            100 * search_cache['hit_ratio'], search_cache['hits'], search_cache['misses']
+        )
+    except Exception, e:
+        pass
+
+    try:
+        outbox = EmailOutbox.stats()
+        response['resources']['Email outbox'] = '{} pending (oldest {:.0f}s), {} sent in the last hour, {} failed'.format(
+            outbox['pending'], outbox['oldest_pending'], outbox['sent_last_hour'], outbox['failed']
+        )
+    except Exception, e:
+        db.session.rollback()
+
     try:
         status = AppStatus.query.first()
         if status.status != 'ok':
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+
+from purchasing.database import db
+from purchasing.data.searches import SearchView
+from purchasing.scout.util import (
+    build_filter, build_cases, build_rank, find_contract_metadata,
+    FILTER_FIELDS
+)
+from purchasing.scout.views import CRAZY_CHARS
+
+def legacy_rank_document():
+    '''Build the ranking document the way scout search used to
+
+    Before the search view stored a precomputed weighted document, each
+    search concatenated and weighted the four tsvector columns at query time.
+
+    Returns:
+        Sqlalchemy expression of the combined weighted tsvector
+    '''
+    return db.func.setweight(db.func.coalesce(SearchView.tsv_company_name, ''), 'A').concat(
+        db.func.setweight(db.func.coalesce(SearchView.tsv_contract_description, ''), 'A')
+    ).concat(
+        db.func.setweight(db.func.coalesce(SearchView.tsv_detail_value, ''), 'D')
+    ).concat(
+        db.func.setweight(db.func.coalesce(SearchView.tsv_line_item_description, ''), 'B')
+    )
+
+def rank_strategies(search_for):
+    '''Build the ranking expressions to compare against each other
+
+    Arguments:
+        search_for: Cleaned search term
+
+    Returns:
+        List of two-tuples of (strategy name, ranking expression)
+    '''
+    return [
+        ('setweight/concat + ts_rank', build_rank(search_for, legacy_rank_document(), 'ts_rank')),
+        ('weighted_tsv + ts_rank', build_rank(search_for, rank_function='ts_rank')),
+        ('weighted_tsv + ts_rank_cd', build_rank(search_for, rank_function='ts_rank_cd')),
+    ]
+
+def time_query(run, iterations):
+    '''Run a query a number of times and time each run
+
+    Arguments:
+        run: Callable that executes the query and returns its rows
+        iterations: Number of times to run the query
+
+    Returns:
+        Dictionary with the number of rows returned and the median
+        and minimum runtime in milliseconds
+    '''
+    # run once to warm up caches before timing
+    run()
+
+    timings, rows = [], 0
+    for _ in range(iterations):
+        start = time.time()
+        rows = len(run())
+        timings.append((time.time() - start) * 1000)
+
+    timings.sort()
+    return {
+        'rows': rows, 'median_ms': timings[len(timings) / 2], 'min_ms': timings[0]
+    }
+
+def clean_term(term):
+    return ' | '.join(re.sub(CRAZY_CHARS, '', term).split())
+
+def benchmark_search(terms, iterations=10):
+    '''Compare the latency of the scout search ranking strategies
+
+    Each term is searched across all fields, the same way an unfiltered
+    search from the scout search bar is run.
+
+    Arguments:
+        terms: List of raw search terms
+        iterations: Number of times to run each query
+
+    Returns:
+        List of dictionaries with the term, strategy, number of rows,
+        and the median and minimum runtime in milliseconds
+    '''
+    results = []
+    for term in terms:
+        search_for = clean_term(term)
+        if search_for == '':
+            continue
+
+        filter_or = build_filter({}, FILTER_FIELDS, search_for, None, True)
+        found_in_case = build_cases({}, FILTER_FIELDS, search_for, True)
+
+        for name, rank in rank_strategies(search_for):
+            query = find_contract_metadata(
+                search_for, found_in_case, filter_or, [], rank=rank
+            )
+            result = time_query(query.all, iterations)
+            result.update({'term': term, 'strategy': name})
+            results.append(result)
+
+    return results
+
+SYNTHETIC_WORDS = [
+    'asphalt', 'battery', 'cable', 'concrete', 'copier', 'diesel', 'engine',
+    'fence', 'filter', 'furniture', 'generator', 'glove', 'hose', 'janitorial',
+    'lamp', 'lumber', 'mower', 'paint', 'paper', 'pipe', 'printer', 'pump',
+    'radio', 'salt', 'software', 'tire', 'toner', 'uniform', 'valve', 'vehicle'
+]
+
+TSV_COLUMNS = [
+    'tsv_contract_description', 'tsv_company_name',
+    'tsv_detail_value', 'tsv_line_item_description'
+]
+
+def _random_words(count):
+    return " || ' ' || ".join(
+        ['(:words)[1 + floor(random() * array_length(:words, 1))::INTEGER]'] * count
+    )
+
+def build_synthetic_contracts(conn, line_items, line_items_per_contract=40,
+                              properties_per_contract=5, companies_per_contract=3):
+    '''Insert a synthetic set of contracts for benchmarking
+
+    Arguments:
+        conn: Connection with an open transaction to insert into
+        line_items: Total number of line items to create
+        line_items_per_contract: Number of line items on each contract
+        properties_per_contract: Number of contract properties on each contract
+        companies_per_contract: Number of companies on each contract
+
+    Returns:
+        List of the new contract ids
+    '''
+    num_contracts = max(line_items / line_items_per_contract, 1)
+    params = {'words': SYNTHETIC_WORDS, 'num_contracts': num_contracts}
+
+    contract_ids = conn.execute(db.text('''
+        WITH new_contracts AS (
+            INSERT INTO contract (description, financial_id, expiration_date, is_archived, is_visible)
+            SELECT
+                {description}, 'benchmark-' || i, current_date + 365, false, true
+            FROM generate_series(1, :num_contracts) i
+            RETURNING id
+        ) SELECT array_agg(id ORDER BY id) FROM new_contracts
+    '''.format(description=_random_words(3))), params).scalar()
+
+    company_ids = conn.execute(db.text('''
+        WITH new_companies AS (
+            INSERT INTO company (company_name)
+            SELECT 'benchmark ' || {name} || ' company ' || i
+            FROM generate_series(1, :num_contracts) i
+            RETURNING id
+        ) SELECT array_agg(id ORDER BY id) FROM new_companies
+    '''.format(name=_random_words(1))), params).scalar()
+
+    params.update({'contract_ids': contract_ids, 'company_ids': company_ids})
+
+    conn.execute(db.text('''
+        INSERT INTO company_contract_association (contract_id, company_id)
+        SELECT c.id, (:company_ids)[1 + (c.n * :per_contract + i) % array_length(:company_ids, 1)]
+        FROM unnest(:contract_ids) WITH ORDINALITY c(id, n), generate_series(1, :per_contract) i
+    '''), dict(params, per_contract=companies_per_contract))
+
+    conn.execute(db.text('''
+        INSERT INTO contract_property (contract_id, key, value)
+        SELECT c.id, 'detail ' || i, {value}
+        FROM unnest(:contract_ids) c(id), generate_series(1, :per_contract) i
+    '''.format(value=_random_words(2))), dict(params, per_contract=properties_per_contract))
+
+    conn.execute(db.text('''
+        INSERT INTO line_item (contract_id, description)
+        SELECT c.id, {description}
+        FROM unnest(:contract_ids) c(id), generate_series(1, :per_contract) i
+    '''.format(description=_random_words(4))), dict(params, per_contract=line_items_per_contract))
+
+    return contract_ids
+
+def build_layout_tables(conn, contract_ids):
+    '''Build the old and new search view layouts for a set of contracts
+
+    The old layout has one row for every combination of contract property,
+    line item, and company on a contract. The new layout is copied from
+    the search view, which has one row per contract. Both are indexed
+    the way the real search view is.
+
+    Arguments:
+        conn: Connection with an open transaction
+        contract_ids: Contracts to build the layouts for
+    '''
+    conn.execute(
+        db.text('SELECT refresh_search_view_contracts(:contract_ids)'),
+        contract_ids=contract_ids
+    )
+
+    conn.execute(db.text('''
+        CREATE TEMP TABLE benchmark_fanout_view ON COMMIT DROP AS
+        SELECT
+            c.id AS contract_id,
+            company.id AS company_id,
+            c.financial_id, c.expiration_date,
+            c.description AS contract_description,
+            to_tsvector(c.description) AS tsv_contract_description,
+            company.company_name AS company_name,
+            to_tsvector(company.company_name) AS tsv_company_name,
+            contract_property.key AS detail_key,
+            contract_property.value AS detail_value,
+            to_tsvector(contract_property.value) AS tsv_detail_value,
+            line_item.description AS line_item_description,
+            to_tsvector(line_item.description) AS tsv_line_item_description,
+            setweight(coalesce(to_tsvector(company.company_name), ''), 'A') ||
+                setweight(coalesce(to_tsvector(c.description), ''), 'A') ||
+                setweight(coalesce(to_tsvector(line_item.description), ''), 'B') ||
+                setweight(coalesce(to_tsvector(contract_property.value), ''), 'D')
+                AS weighted_tsv
+        FROM contract c
+        LEFT OUTER JOIN contract_property ON c.id = contract_property.contract_id
+        LEFT OUTER JOIN line_item ON c.id = line_item.contract_id
+        LEFT OUTER JOIN company_contract_association ON c.id = company_contract_association.contract_id
+        LEFT OUTER JOIN company ON company.id = company_contract_association.company_id
+        WHERE c.id = ANY(:contract_ids)
+    '''), contract_ids=contract_ids)
+
+    conn.execute(db.text('''
+        CREATE TEMP TABLE benchmark_per_contract_view ON COMMIT DROP AS
+        SELECT * FROM search_view WHERE contract_id = ANY(:contract_ids)
+    '''), contract_ids=contract_ids)
+
+    for table in ['benchmark_fanout_view', 'benchmark_per_contract_view']:
+        for column in TSV_COLUMNS:
+            conn.execute('CREATE INDEX ON {} USING gin ({})'.format(table, column))
+        conn.execute('ANALYZE {}'.format(table))
+
+def layout_size(conn, table):
+    '''Return the number of rows and the total size in bytes of a table
+    '''
+    rows, size = conn.execute(
+        'SELECT count(*), pg_total_relation_size(\'{0}\') FROM {0}'.format(table)
+    ).first()
+    return {'rows': rows, 'bytes': size}
+
+FANOUT_QUERY = '''
+    SELECT DISTINCT
+        contract_id, company_id, contract_description, financial_id,
+        expiration_date, company_name, max(ts_rank(weighted_tsv, query)) AS rank
+    FROM benchmark_fanout_view, to_tsquery('english', :search_for) query
+    WHERE {match}
+    GROUP BY contract_id, company_id, contract_description, financial_id,
+        expiration_date, company_name
+    ORDER BY rank DESC
+    LIMIT :limit
+'''.format(match=' OR '.join('{} @@ query'.format(column) for column in TSV_COLUMNS))
+
+PER_CONTRACT_QUERY = '''
+    SELECT
+        contract_id, company_ids, company_names, contract_description, financial_id,
+        expiration_date, company_name, ts_rank(weighted_tsv, query) AS rank
+    FROM benchmark_per_contract_view, to_tsquery('english', :search_for) query
+    WHERE {match}
+    ORDER BY rank DESC, contract_id
+    LIMIT :limit
+'''.format(match=' OR '.join('{} @@ query'.format(column) for column in TSV_COLUMNS))
+
+def benchmark_search_layout(terms, line_items=50000, iterations=10, per_page=50):
+    '''Compare the old per-combination search view with the per-contract one
+
+    A synthetic dataset is inserted inside a transaction that is always
+    rolled back, so this can be run against a development database
+    without leaving anything behind. Note that the search view is locked
+    against writes while the benchmark runs.
+
+    Arguments:
+        terms: List of raw search terms
+        line_items: Total number of synthetic line items to create
+        iterations: Number of times to run each query
+        per_page: The ``LIMIT`` for each search query
+
+    Returns:
+        Dictionary with the ``size`` of each layout and a list of
+        ``queries`` with the term, layout, number of rows, and the
+        median and minimum runtime in milliseconds
+    '''
+    conn = db.engine.connect()
+    transaction = conn.begin()
+    try:
+        contract_ids = build_synthetic_contracts(conn, line_items)
+        build_layout_tables(conn, contract_ids)
+
+        results = {
+            'size': {
+                'fanout': layout_size(conn, 'benchmark_fanout_view'),
+                'per_contract': layout_size(conn, 'benchmark_per_contract_view')
+            },
+            'queries': []
+        }
+
+        for term in terms:
+            search_for = clean_term(term)
+            if search_for == '':
+                continue
+
+            for layout, sql in [('fanout', FANOUT_QUERY), ('per_contract', PER_CONTRACT_QUERY)]:
+                result = time_query(
+                    lambda: conn.execute(
+                        db.text(sql), search_for=search_for, limit=per_page
+                    ).fetchall(),
+                    iterations
+                )
+                result.update({'term': term, 'layout': layout})
+                results['queries'].append(result)
+
+        return results
+    finally:
+        transaction.rollback()
+        conn.close()
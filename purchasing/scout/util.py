@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import time
+import json
+import base64
+import hashlib
 import datetime
 
 from flask import current_app, flash, redirect, url_for, render_template
-from purchasing.extensions import db
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from purchasing.extensions import db, cache
 
 from purchasing.notifications import Notification
 
 from purchasing.scout.forms import FeedbackForm, SearchForm
 from purchasing.users.models import Department, User, Role
-from purchasing.data.contracts import ContractBase
+from purchasing.data.contracts import ContractBase, LineItem, contract_user_association_table
 from purchasing.data.searches import SearchView
 
 from flask_login import current_user
@@ -41,7 +46,7 @@ def build_filter(req_args, fields, search_for, filter_form, _all):
             For build_filter, only the column name and Model property are used. For :func:`build_cases`, all are used.
 
         search_for: string search term
-        filter_form:
+        filter_form: :py:class:`~purchasing.scout.forms.SearchForm` to update, or None
         _all: Boolean -- true if we are searching across all fields, false otherwise
 
     Returns:
@@ -50,7 +55,7 @@ def build_filter(req_args, fields, search_for, filter_form, _all):
     clauses = []
     for arg_name, _, filter_column in fields:
         if _all or req_args.get(arg_name) == 'y':
-            if not _all:
+            if not _all and filter_form is not None:
                 filter_form[arg_name].checked = True
             clauses.append(filter_column.match(
                 search_for,
@@ -122,7 +127,8 @@ def feedback_handler(contract, search_for=None):
             ), html_template='scout/feedback_email.html',
             contract=contract, sender=form.data.get('sender'),
             body=form.data.get('body')
-        ).send()
+        ).queue()
+        db.session.commit()
 
         if feedback_sent:
             flash('Thank you for your feedback!', 'alert-success')
@@ -171,7 +177,35 @@ def add_archived_filter(query, archived):
 
     return query
 
-def find_contract_metadata(search_for, case_statements, filter_or, filter_and, archived=False):
+RANK_FUNCTIONS = {
+    'ts_rank': db.func.full_text.ts_rank,
+    'ts_rank_cd': db.func.full_text.ts_rank_cd,
+}
+
+def build_rank(search_for, document=None, rank_function=None):
+    '''Build the ranking expression for scout search
+
+    Arguments:
+        search_for: User's search term
+        document: The tsvector to rank against. Defaults to the
+            precomputed :py:attr:`~purchasing.data.searches.SearchView.weighted_tsv`
+        rank_function: Name of the Postgres ranking function to use, one of
+            ``ts_rank`` or ``ts_rank_cd``. Defaults to the ``SEARCH_RANK_FUNCTION``
+            config value.
+
+    Returns:
+        Sqlalchemy expression with the rank of each search result. The
+        ranking functions return a ``real``, which is cast to ``double
+        precision`` so that it survives the round trip through a cursor.
+    '''
+    document = document if document is not None else SearchView.weighted_tsv
+    rank_function = rank_function or current_app.config.get('SEARCH_RANK_FUNCTION', 'ts_rank')
+
+    return db.cast(RANK_FUNCTIONS[rank_function](
+        document, db.func.to_tsquery(search_for, postgresql_regconfig='english')
+    ), DOUBLE_PRECISION)
+
+def find_contract_metadata(search_for, case_statements, filter_or, filter_and, archived=False, rank=None, tsquery=None):
     '''
     Takes a search term, case statements, and filter clauses and
     returns out a list of search results objects to be rendered into
@@ -183,28 +217,25 @@ def find_contract_metadata(search_for, case_statements, filter_or, filter_and, a
         filter_or: An iterable of `Sqlalchemy query filters`_, used for non-exclusionary filtering
         filter_and: An iterable of `Sqlalchemy query filters`_, used for exclusionary filtering
         archived: Boolean of whether or not to add the ``is_archived`` filter
+        rank: Optional ranking expression, defaults to
+            :py:func:`~purchasing.scout.util.build_rank`
+        tsquery: Optional tsquery string to rank with, such as the one
+            built by :py:func:`~purchasing.scout.util.prefix_tsquery`.
+            Defaults to the search term.
 
     Returns:
-        A Sqlalchemy resultset that contains the fields to render the
-        search results view.
+        A Sqlalchemy query that contains the fields to render the
+        search results view, ordered by rank. The query is not
+        executed, so it can be paginated with
+        :py:func:`~purchasing.scout.util.paginate_contracts`.
     '''
-
-    rank = db.func.max(db.func.full_text.ts_rank(
-        db.func.setweight(db.func.coalesce(SearchView.tsv_company_name, ''), 'A').concat(
-            db.func.setweight(db.func.coalesce(SearchView.tsv_contract_description, ''), 'A')
-        ).concat(
-            db.func.setweight(db.func.coalesce(SearchView.tsv_detail_value, ''), 'D')
-        ).concat(
-            db.func.setweight(db.func.coalesce(SearchView.tsv_line_item_description, ''), 'B')
-        ), db.func.to_tsquery(search_for, postgresql_regconfig='english')
-    ))
+    rank = rank if rank is not None else build_rank(tsquery or search_for)
 
     contracts = db.session.query(
-        db.distinct(SearchView.contract_id).label('contract_id'),
-        SearchView.company_id, SearchView.contract_description,
-        SearchView.financial_id, SearchView.expiration_date,
-        SearchView.company_name, db.case(case_statements).label('found_in'),
-        rank.label('rank')
+        SearchView.contract_id, SearchView.company_ids, SearchView.company_names,
+        SearchView.contract_description, SearchView.financial_id,
+        SearchView.expiration_date, SearchView.company_name,
+        db.case(case_statements).label('found_in'), rank.label('rank')
     ).join(
         ContractBase, ContractBase.id == SearchView.contract_id
     ).filter(
@@ -213,21 +244,101 @@ def find_contract_metadata(search_for, case_statements, filter_or, filter_and, a
             *filter_or
         ),
         *filter_and
-    ).group_by(
-        SearchView.contract_id,
-        SearchView.company_id,
-        SearchView.contract_description,
-        SearchView.financial_id,
-        SearchView.expiration_date,
-        SearchView.company_name,
-        db.case(case_statements)
     ).order_by(
-        db.text('rank DESC')
+        db.text('rank DESC'), SearchView.contract_id
+    )
+
+    contracts = add_archived_filter(contracts, archived)
+
+    return contracts
+
+def prefix_tsquery(search_terms):
+    '''Build a tsquery string that matches the start of each search term
+
+    Arguments:
+        search_terms: List of cleaned search words
+
+    Returns:
+        tsquery string where each word is a prefix match, so that
+        "asph" will match "asphalt"
+    '''
+    return ' | '.join('{}:*'.format(term) for term in search_terms)
+
+# build trigram similarity conditions
+SIMILARITY_FIELDS = [
+    ('company_name', 'Company Name', 'search_view.company_name'),
+    ('contract_description', 'Contract Description', 'search_view.contract_description'),
+]
+
+def find_similar_contracts(term, req_args, filter_and, archived=False):
+    '''Find contracts with names or descriptions similar to the search term
+
+    Used as a fallback when a full-text search has no results, so that
+    searches with misspelled words still return something. Similarity is
+    measured with Postgres `trigrams
+    <http://www.postgresql.org/docs/current/static/pgtrgm.html>`_. Line items
+    are matched against the ``line_item`` table instead of the search view
+    so that a short line item description isn't drowned out by all of the
+    other line items on its contract.
+
+    Arguments:
+        term: Cleaned search term, with words separated by spaces
+        req_args: request.args from Flask.request, used to determine which
+            fields to search in the same way as :func:`build_filter`
+        filter_and: An iterable of `Sqlalchemy query filters`_, used for exclusionary filtering
+        archived: Boolean of whether or not to add the ``is_archived`` filter
+
+    Returns:
+        A Sqlalchemy query ordered by similarity with the same fields as
+        :py:func:`~purchasing.scout.util.find_contract_metadata`, or None if
+        none of the requested fields support similarity searches
+    '''
+    _all = not any([req_args.get(name) for name, _, _ in FILTER_FIELDS])
+    term = db.bindparam('similar_term', term)
+
+    matches, similarities, cases = [], [], []
+    for arg_name, arg_description, column in SIMILARITY_FIELDS:
+        if _all or req_args.get(arg_name) == 'y':
+            match = db.text('{} % :similar_term'.format(column)).bindparams(term)
+            matches.append(match)
+            similarities.append(db.func.similarity(db.literal_column(column), term))
+            cases.append((match, '{} (similar)'.format(arg_description)))
+
+    if _all or req_args.get('line_item') == 'y':
+        line_item_match = db.text('line_item.description % :similar_term').bindparams(term)
+        matches.append(SearchView.contract_id.in_(
+            db.session.query(LineItem.contract_id).filter(line_item_match)
+        ))
+        similarities.append(db.func.coalesce(
+            db.session.query(
+                db.func.max(db.func.similarity(LineItem.description, term))
+            ).filter(
+                LineItem.contract_id == SearchView.contract_id, line_item_match
+            ).correlate(SearchView).as_scalar(), 0
+        ))
+
+    if len(matches) == 0:
+        return None
+
+    found_in = db.case(cases, else_='Line Item (similar)') if cases else \
+        db.literal('Line Item (similar)')
+
+    contracts = db.session.query(
+        SearchView.contract_id, SearchView.company_ids, SearchView.company_names,
+        SearchView.contract_description, SearchView.financial_id,
+        SearchView.expiration_date, SearchView.company_name,
+        found_in.label('found_in'), db.func.greatest(*similarities).label('rank')
+    ).join(
+        ContractBase, ContractBase.id == SearchView.contract_id
+    ).filter(
+        db.or_(*matches), *filter_and
+    ).order_by(
+        db.text('rank DESC'), SearchView.contract_id
     )
 
     contracts = add_archived_filter(contracts, archived)
 
-    return contracts.all()
+    return contracts
 
 def return_all_contracts(filter_and, archived=False):
     '''Return all contracts in the event of an empty search
@@ -237,17 +348,340 @@ def return_all_contracts(filter_and, archived=False):
         archived: Boolean of whether or not to add the ``is_archived`` filter
 
     Returns:
-        A Sqlalchemy resultset that contains the fields to render the
-        search results view.
+        A Sqlalchemy query that contains the fields to render the
+        search results view. The query is not executed, so it can
+        be paginated with :py:func:`~purchasing.scout.util.paginate_contracts`.
     '''
     contracts = db.session.query(
-        db.distinct(SearchView.contract_id).label('contract_id'), SearchView.company_id,
+        SearchView.contract_id, SearchView.company_ids, SearchView.company_names,
         SearchView.contract_description, SearchView.financial_id,
         SearchView.expiration_date, SearchView.company_name
     ).join(ContractBase, ContractBase.id == SearchView.contract_id).filter(
         *filter_and
-    )
+    ).order_by(SearchView.contract_id)
 
     contracts = add_archived_filter(contracts, archived)
 
-    return contracts.all()
+    return contracts
+
+def find_department_follows(department_id):
+    '''Find the contracts followed by members of a department
+
+    The query starts from the department's users, so it only touches the
+    ``contract_user_association`` rows of those users, using the indexes
+    on ``users.department_id`` and ``contract_user_association.user_id``.
+
+    Arguments:
+        department_id: Unique ID of a :py:class:`~purchasing.users.models.Department`
+
+    Returns:
+        A Sqlalchemy query of the contract ``id``, ``description`` and
+        number of ``follows`` from the department, ordered by the number
+        of follows. The query is not executed, so it can be paginated with
+        :py:func:`~purchasing.scout.util.paginate_contracts`.
+    '''
+    return db.session.query(
+        ContractBase.id, ContractBase.description,
+        db.func.count(contract_user_association_table.c.user_id).label('follows')
+    ).join(
+        contract_user_association_table,
+        contract_user_association_table.c.contract_id == ContractBase.id
+    ).join(
+        User, User.id == contract_user_association_table.c.user_id
+    ).filter(
+        User.department_id == department_id
+    ).group_by(
+        ContractBase.id, ContractBase.description
+    ).order_by(db.text('follows DESC'), ContractBase.id)
+
+def count_department_follows(department_id):
+    '''Count the contracts followed by members of a department
+
+    Arguments:
+        department_id: Unique ID of a :py:class:`~purchasing.users.models.Department`
+
+    Returns:
+        Integer count of the rows
+        :py:func:`~purchasing.scout.util.find_department_follows` would return
+    '''
+    return db.session.query(
+        db.func.count(db.distinct(contract_user_association_table.c.contract_id))
+    ).select_from(contract_user_association_table).join(
+        User, User.id == contract_user_association_table.c.user_id
+    ).filter(User.department_id == department_id).scalar()
+
+def count_contracts(contracts):
+    '''Count the results of a contract search query
+
+    The search view has exactly one row per contract, so the count only
+    selects the contract id, without the ordering or the ``rank`` and
+    ``found_in`` columns. This keeps Postgres from scoring every match
+    just to count them.
+
+    Arguments:
+        contracts: Sqlalchemy query built by
+            :py:func:`~purchasing.scout.util.find_contract_metadata`
+            or :py:func:`~purchasing.scout.util.return_all_contracts`
+
+    Returns:
+        Integer count of the rows the query would return
+    '''
+    return contracts.order_by(None).with_entities(SearchView.contract_id).count()
+
+def paginate_contracts(contracts, page, per_page, count=None):
+    '''Fetch a single page of results from a contract search query
+
+    Arguments:
+        contracts: Sqlalchemy query built by
+            :py:func:`~purchasing.scout.util.find_contract_metadata`
+            or :py:func:`~purchasing.scout.util.return_all_contracts`
+        page: One-indexed page number to fetch
+        per_page: Number of results per page
+        count: Callable with no arguments that returns the total number
+            of results, defaults to
+            :py:func:`~purchasing.scout.util.count_contracts`
+
+    Returns:
+        Two-tuple of (list of results for the page, total number of results)
+    '''
+    results = contracts.limit(per_page).offset((page - 1) * per_page).all()
+
+    # a short first page already tells us the total, so skip the count
+    if page == 1 and len(results) < per_page:
+        return results, len(results)
+
+    return results, count() if count else count_contracts(contracts)
+
+def paginate_with_fallback(contracts, fallback, page, per_page):
+    '''Paginate a search query, switching to a fallback query if it has no results
+
+    Arguments:
+        contracts: Sqlalchemy query to paginate first
+        fallback: Sqlalchemy query to paginate if ``contracts`` has no
+            results, such as :py:func:`~purchasing.scout.util.find_similar_contracts`,
+            or None
+        page: One-indexed page number to fetch
+        per_page: Number of results per page
+
+    Returns:
+        Three-tuple of (list of results for the page, total number of results,
+        Boolean of whether the fallback query was used)
+    '''
+    results, total_count = paginate_contracts(contracts, page, per_page)
+    if total_count == 0 and fallback is not None:
+        results, total_count = paginate_contracts(fallback, page, per_page)
+        return results, total_count, True
+    return results, total_count, False
+
+SEARCH_VIEW_GENERATION_KEY = 'scout-search-generation'
+SEARCH_CACHE_HITS_KEY = 'scout-search-cache-hits'
+SEARCH_CACHE_MISSES_KEY = 'scout-search-cache-misses'
+# change this whenever the shape of the cached search results changes
+SEARCH_CACHE_VERSION = 2
+
+class SearchResult(dict):
+    '''A cacheable scout search result
+
+    Query result rows can't be stored in the cache directly, so they are
+    converted to dictionaries. Values can still be accessed as attributes,
+    so cached results can be used in place of the original rows.
+    '''
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+def get_search_view_generation():
+    '''Get the current generation of the search view
+
+    The generation is changed every time the search view is refreshed,
+    and is part of every cached search key, so refreshing the search view
+    invalidates all cached searches. If the generation has been evicted from
+    the cache, it is started again from the current time in milliseconds,
+    which is always larger than the evicted value.
+
+    Returns:
+        Integer generation of the search view
+    '''
+    generation = cache.get(SEARCH_VIEW_GENERATION_KEY)
+    if generation is None:
+        cache.add(SEARCH_VIEW_GENERATION_KEY, int(time.time() * 1000), timeout=0)
+        generation = cache.get(SEARCH_VIEW_GENERATION_KEY)
+    return generation
+
+def bump_search_view_generation():
+    '''Invalidate all cached searches after the search view is refreshed
+    '''
+    try:
+        if cache.cache.inc(SEARCH_VIEW_GENERATION_KEY) is None:
+            cache.delete(SEARCH_VIEW_GENERATION_KEY)
+    except Exception, e:
+        current_app.logger.exception(e)
+        cache.delete(SEARCH_VIEW_GENERATION_KEY)
+
+def search_cache_key(search_for, filters, contract_type, archived, page, per_page):
+    '''Build the cache key for a page of scout search results
+
+    Arguments:
+        search_for: Cleaned search term
+        filters: Dictionary of the ``FILTER_FIELDS`` names to their
+            request argument values
+        contract_type: Contract type id to filter by, or None
+        archived: Boolean of whether archived contracts are included
+        page: One-indexed page number
+        per_page: Number of results per page
+
+    Returns:
+        Cache key string
+    '''
+    key = repr((
+        search_for.strip(), sorted((k, v) for k, v in filters.items() if v),
+        contract_type, archived, page, per_page,
+        current_app.config.get('SEARCH_RANK_FUNCTION'), get_search_view_generation()
+    ))
+    return 'scout-search-{}-{}'.format(SEARCH_CACHE_VERSION, hashlib.sha1(key).hexdigest())
+
+def _count_search_cache(key):
+    try:
+        cache.cache.inc(key)
+    except Exception, e:
+        current_app.logger.exception(e)
+
+def cached_search(cache_key, run_search):
+    '''Return a page of search results from the cache, running the search on a miss
+
+    Arguments:
+        cache_key: Key built with :py:func:`~purchasing.scout.util.search_cache_key`
+        run_search: Callable that returns a tuple whose first item is the list
+            of results, such as :py:func:`~purchasing.scout.util.paginate_contracts`
+
+    Returns:
+        The tuple returned by ``run_search``, with the results converted
+        to :py:class:`~purchasing.scout.util.SearchResult` objects
+    '''
+    cached = cache.get(cache_key)
+    if cached is not None:
+        _count_search_cache(SEARCH_CACHE_HITS_KEY)
+        return cached
+
+    _count_search_cache(SEARCH_CACHE_MISSES_KEY)
+    search = run_search()
+    cached = ([SearchResult(result._asdict()) for result in search[0]],) + tuple(search[1:])
+
+    cache.set(
+        cache_key, cached,
+        timeout=current_app.config.get('SEARCH_CACHE_TIMEOUT', 300)
+    )
+    return cached
+
+def search_cache_stats():
+    '''Report the scout search cache hit ratio
+
+    Returns:
+        Dictionary with the number of ``hits`` and ``misses``, and the
+        ``hit_ratio`` as a float between 0 and 1
+    '''
+    hits = int(cache.get(SEARCH_CACHE_HITS_KEY) or 0)
+    misses = int(cache.get(SEARCH_CACHE_MISSES_KEY) or 0)
+    return {
+        'hits': hits, 'misses': misses,
+        'hit_ratio': float(hits) / (hits + misses) if hits + misses else 0.0
+    }
+
+# columns that can be requested from the search api
+API_FIELDS = [
+    'contract_id', 'contract_description', 'financial_id', 'expiration_date',
+    'company_ids', 'company_names', 'company_name', 'found_in', 'rank'
+]
+
+def select_api_fields(contracts, fields):
+    '''Limit a contract search query to the requested columns
+
+    The ``contract_id`` and ``rank`` columns are always selected,
+    because they are needed to order the results and build cursors.
+
+    Arguments:
+        contracts: Sqlalchemy query built by
+            :py:func:`~purchasing.scout.util.find_contract_metadata`
+            or :py:func:`~purchasing.scout.util.return_all_contracts`
+        fields: List of column names from ``API_FIELDS``
+
+    Returns:
+        Sqlalchemy query with only the requested columns
+    '''
+    columns = dict((column['name'], column['expr']) for column in contracts.column_descriptions)
+    return contracts.with_entities(*[
+        columns[name] for name in API_FIELDS
+        if name in columns and (name in fields or name in ('contract_id', 'rank'))
+    ])
+
+def encode_cursor(result):
+    '''Build an opaque cursor pointing just past a search result
+
+    Arguments:
+        result: Search result row with a ``contract_id`` and optionally a ``rank``
+
+    Returns:
+        URL-safe cursor string
+    '''
+    return base64.urlsafe_b64encode(json.dumps([
+        getattr(result, 'rank', None), result.contract_id
+    ]))
+
+def decode_cursor(cursor):
+    '''Decode a cursor built by :py:func:`~purchasing.scout.util.encode_cursor`
+
+    Arguments:
+        cursor: URL-safe cursor string
+
+    Returns:
+        Two-tuple of (rank, contract id)
+
+    Raises:
+        ValueError: If the cursor can't be decoded
+    '''
+    try:
+        rank, contract_id = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        return (float(rank) if rank is not None else None), int(contract_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def filter_after_cursor(contracts, cursor, rank=None):
+    '''Filter a contract search query to the results after a cursor
+
+    Results are ordered by rank and then contract id, so the results after
+    a cursor either have a lower rank, or the same rank and a higher
+    contract id. Unlike an ``OFFSET``, Postgres never has to build and throw
+    away the earlier pages.
+
+    Arguments:
+        contracts: Sqlalchemy query ordered by rank and contract id
+        cursor: Two-tuple of (rank, contract id) from
+            :py:func:`~purchasing.scout.util.decode_cursor`
+        rank: The ranking expression the query is ordered by, or None
+            if the query is only ordered by contract id
+
+    Returns:
+        Filtered Sqlalchemy query
+    '''
+    cursor_rank, cursor_contract_id = cursor
+    if rank is None or cursor_rank is None:
+        return contracts.filter(SearchView.contract_id > cursor_contract_id)
+
+    # compare as double precision on both sides, otherwise a ``real`` rank
+    # never equals the cursor's rank and tied results are skipped
+    rank = db.cast(rank, DOUBLE_PRECISION)
+    cursor_rank = db.cast(cursor_rank, DOUBLE_PRECISION)
+    return contracts.filter(db.or_(
+        rank < cursor_rank,
+        db.and_(rank == cursor_rank, SearchView.contract_id > cursor_contract_id)
+    ))
+
+def serialize_search_result(result):
+    '''Convert a search result row into a JSON-serializable dictionary
+    '''
+    return dict(
+        (key, value.isoformat() if isinstance(value, datetime.date) else value)
+        for key, value in result._asdict().items()
+    )
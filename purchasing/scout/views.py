@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import re
+import json
 
 from flask import (
-    render_template, current_app,
+    render_template, current_app, jsonify, Response, stream_with_context,
     request, abort, flash, redirect, url_for
 )
 from flask_login import current_user
@@ -19,7 +20,11 @@ from purchasing.data.contracts import ContractBase, ContractNote, ContractType
 
 from purchasing.scout.util import (
     build_filter, build_cases, feedback_handler,
-    find_contract_metadata, return_all_contracts, FILTER_FIELDS
+    find_contract_metadata, return_all_contracts, find_similar_contracts,
+    prefix_tsquery, paginate_with_fallback, search_cache_key, cached_search,
+    find_department_follows, count_department_follows, paginate_contracts,
+    build_rank, select_api_fields, decode_cursor, encode_cursor,
+    filter_after_cursor, serialize_search_result, FILTER_FIELDS, API_FIELDS
 )
 
 from purchasing.scout import blueprint
@@ -63,35 +68,17 @@ def filter(department_id):
 
     if department:
         pagination_per_page = current_app.config.get('PER_PAGE', 50)
-        page = int(request.args.get('page', 1))
-        lower_bound_result = (page - 1) * pagination_per_page
-        upper_bound_result = lower_bound_result + pagination_per_page
-
-        contracts = db.session.execute(
-            '''
-            SELECT
-                contract.id, description,
-                count(contract_user_association.user_id) AS follows
-            FROM contract
-            LEFT OUTER JOIN contract_user_association
-                ON contract.id = contract_user_association.contract_id
-            FULL OUTER JOIN users
-                ON contract_user_association.user_id = users.id
-            JOIN department
-                ON users.department_id = department.id
-            WHERE department.id = :department
-            GROUP BY 1,2
-            HAVING count(contract_user_association.user_id) > 0
-            ORDER BY 3 DESC, 1 ASC
-            ''', {'department': int(department_id)}
-        ).fetchall()
-
-        if len(contracts) > 0:
-            pagination = SimplePagination(page, pagination_per_page, len(contracts))
-            results = contracts[lower_bound_result:upper_bound_result]
+        page = max(int(request.args.get('page', 1)), 1)
+
+        results, total_count = paginate_contracts(
+            find_department_follows(department.id), page, pagination_per_page,
+            count=lambda: count_department_follows(department.id)
+        )
+
+        if total_count > 0:
+            pagination = SimplePagination(page, pagination_per_page, total_count)
         else:
             pagination = None
-            results = []
 
         current_app.logger.info('WEXFILTER - {department}: Filter by {department}'.format(
             department=department.name
@@ -144,16 +131,15 @@ def search():
     search_form.q.data = search_for
 
     # strip out "crazy" characters
-    search_for = re.sub(CRAZY_CHARS, '', search_for)
-    search_for = ' | '.join(search_for.split())
+    search_terms = re.sub(CRAZY_CHARS, '', search_for).split()
+    search_for = ' | '.join(search_terms)
+    search_query = prefix_tsquery(search_terms)
 
     pagination_per_page = current_app.config.get('PER_PAGE', 50)
-    page = int(request.args.get('page', 1))
-    lower_bound_result = (page - 1) * pagination_per_page
-    upper_bound_result = lower_bound_result + pagination_per_page
+    page = max(int(request.args.get('page', 1)), 1)
 
     filter_or = build_filter(
-        request.args, FILTER_FIELDS, search_for, search_form,
+        request.args, FILTER_FIELDS, search_query, search_form,
         not any([request.args.get(name) for name, _, _ in FILTER_FIELDS])
     )
 
@@ -165,7 +151,7 @@ def search():
         search_form.contract_type.data = ContractType.query.get(int(request.args.get('contract_type')))
 
     found_in_case = build_cases(
-        request.args, FILTER_FIELDS, search_for,
+        request.args, FILTER_FIELDS, search_query,
         not any([request.args.get(name) for name, _, _ in FILTER_FIELDS])
     )
 
@@ -179,14 +165,28 @@ def search():
     if search_for != '':
         contracts = find_contract_metadata(
             search_for, found_in_case, filter_or, filter_and,
-            archived
+            archived, tsquery=search_query
+        )
+        # if nothing matches, look for misspellings
+        similar_contracts = find_similar_contracts(
+            ' '.join(search_terms), request.args, filter_and, archived
         )
     else:
         contracts = return_all_contracts(
             filter_and, archived
         )
+        similar_contracts = None
 
-    pagination = SimplePagination(page, pagination_per_page, len(contracts))
+    cache_key = search_cache_key(
+        search_for, dict((name, request.args.get(name)) for name, _, _ in FILTER_FIELDS),
+        request.args.get('contract_type'), archived, page, pagination_per_page
+    )
+    results, total_count, similar = cached_search(
+        cache_key, lambda: paginate_with_fallback(
+            contracts, similar_contracts, page, pagination_per_page
+        )
+    )
+    pagination = SimplePagination(page, pagination_per_page, total_count)
 
     current_app.logger.info('WEXSEARCH - {search_for}: {user} searched for "{search_for}"'.format(
         search_for=search_for,
@@ -200,7 +200,8 @@ def search():
         current_user=current_user,
         user_follows=user_follows,
         search_for=search_for,
-        results=contracts[lower_bound_result:upper_bound_result],
+        results=results,
+        similar=similar,
         pagination=pagination,
         search_form=search_form,
         choices=Department.choices(),
@@ -209,6 +210,97 @@ def search():
         )
     )
 
+@blueprint.route('/api/search', methods=['GET'])
+def search_api():
+    '''JSON search results for scout
+
+    Takes the same search and filter arguments as
+    :py:func:`~purchasing.scout.views.search`, along with:
+
+    :query fields: Comma-separated list of the columns to return,
+        defaults to all of :py:data:`~purchasing.scout.util.API_FIELDS`
+    :query limit: Maximum number of results to return, up to the
+        ``SEARCH_API_MAX_LIMIT`` config value
+    :query cursor: The ``next_cursor`` from a previous response, to fetch
+        the next page of results
+    :query stream: If "y", stream every result as newline-delimited JSON
+        instead of returning a single page
+
+    :status 200: JSON object with a list of ``results`` and a ``next_cursor``,
+        which is null on the last page, or a stream of newline-delimited JSON results
+    :status 400: Unknown fields, a bad limit, or an invalid cursor
+    '''
+    search_terms = re.sub(CRAZY_CHARS, '', request.args.get('q') or '').split()
+    search_for = ' | '.join(search_terms)
+    search_query = prefix_tsquery(search_terms)
+    _all = not any([request.args.get(name) for name, _, _ in FILTER_FIELDS])
+
+    fields = request.args.get('fields').split(',') if request.args.get('fields') else API_FIELDS
+    if len(set(fields) - set(API_FIELDS)) > 0:
+        abort(400)
+
+    try:
+        limit = min(
+            int(request.args.get('limit', current_app.config.get('PER_PAGE', 50))),
+            current_app.config.get('SEARCH_API_MAX_LIMIT', 500)
+        )
+        cursor = decode_cursor(request.args.get('cursor')) if request.args.get('cursor') else None
+    except ValueError:
+        abort(400)
+
+    if limit < 1:
+        abort(400)
+
+    filter_and = []
+    if request.args.get('contract_type') is not None:
+        filter_and = [
+            ContractBase.contract_type_id == int(request.args.get('contract_type'))
+        ]
+
+    archived = request.args.get('archived') == 'y'
+
+    if search_for != '':
+        # before Postgres 12, doubles are sent rounded to 15 digits, which
+        # isn't enough for the ranks in cursors to compare equal on the next page
+        db.session.execute('SET LOCAL extra_float_digits = 3')
+        rank = build_rank(search_query)
+        contracts = find_contract_metadata(
+            search_for,
+            build_cases(request.args, FILTER_FIELDS, search_query, _all),
+            build_filter(request.args, FILTER_FIELDS, search_query, None, _all),
+            filter_and, archived, rank=rank
+        )
+    else:
+        rank = None
+        contracts = return_all_contracts(filter_and, archived)
+
+    contracts = select_api_fields(contracts, fields)
+    if cursor:
+        contracts = filter_after_cursor(contracts, cursor, rank)
+
+    current_app.logger.info('WEXAPISEARCH - {search_for}: {user} searched for "{search_for}"'.format(
+        search_for=search_for,
+        user=current_user.email if not current_user.is_anonymous() else 'anonymous'
+    ))
+
+    if request.args.get('stream') == 'y':
+        def stream():
+            for result in contracts.yield_per(500):
+                yield json.dumps(serialize_search_result(result)) + '\n'
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype='application/x-ndjson'
+        )
+
+    # fetch one extra result to find out if there is another page
+    results = contracts.limit(limit + 1).all()
+
+    return jsonify({
+        'results': [serialize_search_result(result) for result in results[:limit]],
+        'next_cursor': encode_cursor(results[limit - 1]) if len(results) > limit else None
+    })
+
 @blueprint.route('/companies/<int:company_id>')
 @wrap_form(SearchForm, 'search_form', 'scout/company.html')
 def company(company_id):
@@ -37,6 +37,26 @@ class Config(object):
     CONDUCTOR_TYPE = 'County'
     CONDUCTOR_DEPARTMENT = 'Multiple Departments'
     EXTERNAL_LINK_WARNING = os_env.get('EXTERNAL_LINK_WARNING', None)
+    SEARCH_VIEW_REFRESH_WINDOW = int(os_env.get('SEARCH_VIEW_REFRESH_WINDOW', 10))
+    SEARCH_RANK_FUNCTION = os_env.get('SEARCH_RANK_FUNCTION', 'ts_rank')
+    SEARCH_CACHE_TIMEOUT = int(os_env.get('SEARCH_CACHE_TIMEOUT', 300))
+    SEARCH_API_MAX_LIMIT = int(os_env.get('SEARCH_API_MAX_LIMIT', 500))
+    NOTIFICATION_BATCH_SIZE = int(os_env.get('NOTIFICATION_BATCH_SIZE', 100))
+    NOTIFICATION_PAYLOAD_TIMEOUT = int(os_env.get('NOTIFICATION_PAYLOAD_TIMEOUT', 60 * 60 * 24))
+    # maximum number of emails sent per minute across all workers, 0 for no limit
+    MAIL_RATE_LIMIT = int(os_env.get('MAIL_RATE_LIMIT', 0))
+    # default number of seconds a nightly job can run for
+    JOB_TIME_LIMIT = int(os_env.get('JOB_TIME_LIMIT', 60 * 60))
+    # number of seconds a claim on a job lasts without being renewed
+    JOB_LEASE_TIMEOUT = int(os_env.get('JOB_LEASE_TIMEOUT', 5 * 60))
+    # number of emails the outbox dispatcher sends at a time
+    EMAIL_OUTBOX_BATCH_SIZE = int(os_env.get('EMAIL_OUTBOX_BATCH_SIZE', 100))
+    # number of seconds an outbox dispatcher has to send the emails it claimed
+    EMAIL_OUTBOX_LOCK_TIMEOUT = int(os_env.get('EMAIL_OUTBOX_LOCK_TIMEOUT', 10 * 60))
+    # number of times sending an outbox email is attempted before giving up
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os_env.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+    # number of seconds a rendered beacon biweekly digest is cached
+    BEACON_DIGEST_CACHE_TIMEOUT = int(os_env.get('BEACON_DIGEST_CACHE_TIMEOUT', 60 * 60 * 24 * 14))
 
 
 class ProdConfig(Config):
@@ -51,6 +71,8 @@ class ProdConfig(Config):
     UGLIFYJS_EXTRA_ARGS = ['-m']
     MAIL_SERVER = 'smtp.sendgrid.net'
     MAIL_MAX_EMAILS = 100
+    # by default, send at most one full connection's worth of emails a minute
+    MAIL_RATE_LIMIT = int(os_env.get('MAIL_RATE_LIMIT', MAIL_MAX_EMAILS))
     CELERY_BROKER_URL = os_env.get('REDIS_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os_env.get('REDIS_URL', 'redis://localhost:6379/0')
     CACHE_TYPE = 'redis'
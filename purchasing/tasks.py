@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import time
+import datetime
+
+from flask import current_app
+from flask_mail import Message
+
 from purchasing.app import celery
+from purchasing.compat import basestring
 from purchasing.extensions import mail, db, cache
+from purchasing.public.models import AppStatus, EmailOutbox
 
 @celery.task
 def send_email(messages):
@@ -9,25 +17,372 @@ def send_email(messages):
         for message in messages:
             conn.send(message)
 
+def build_message(payload, recipients):
+    '''Build a `Message`_ from a notification payload
+
+    Arguments:
+        payload: Message payload, as built by
+            :py:meth:`~purchasing.notifications.Notification.build_payload`
+        recipients: List of email addresses to send the message to
+
+    Returns:
+        `Message`_ object
+    '''
+    payload = dict(payload)
+    attachments = payload.pop('attachments', [])
+
+    msg = Message(recipients=recipients, **payload)
+    for filename, content_type, data in attachments:
+        msg.attach(filename=filename, content_type=content_type, data=data)
+    return msg
+
+EMAIL_RATE_LIMIT_KEY = 'email-rate-limit-{}'
+
+def reserve_email_sends(count):
+    '''Reserve room to send emails under the global rate limit
+
+    Every process shares a counter in the cache of how many emails have
+    been sent in the current minute. If sending ``count`` more emails would
+    go over ``MAIL_RATE_LIMIT`` the reservation is given back, unless
+    nothing has been sent yet this minute.
+
+    Arguments:
+        count: Number of emails that are about to be sent
+
+    Returns:
+        Number of seconds to wait until trying again, or 0 if the emails
+        can be sent right away
+    '''
+    limit = current_app.config.get('MAIL_RATE_LIMIT')
+    if not limit:
+        return 0
+
+    now = time.time()
+    key = EMAIL_RATE_LIMIT_KEY.format(int(now / 60))
+    cache.add(key, 0, timeout=120)
+    sent = cache.cache.inc(key, count)
+    # if the counter can't be stored, don't hold up the emails
+    if sent is None or sent <= limit or sent == count:
+        return 0
+
+    cache.cache.dec(key, count)
+    return 60 - int(now % 60)
+
+def record_email_batch(job_key, sent, info=None, messages=0):
+    if job_key is not None:
+        from purchasing.jobs.job_base import JobStatus
+        JobStatus.record_chunk(job_key[0], job_key[1], sent, info, messages)
+
+def record_email_messages(job_key, messages):
+    if job_key is not None and messages:
+        from purchasing.jobs.job_base import JobStatus
+        JobStatus.record_messages(job_key[0], job_key[1], messages)
+
+@celery.task(bind=True, max_retries=5, default_retry_delay=30)
+def send_email_batch(self, payload, recipients, job_key=None):
+    '''Send the same message to each of a batch of recipients
+
+    All of the messages are sent over a single connection. If sending
+    fails, the task is retried with exponential backoff for only the
+    recipients that haven't been sent to yet. Batches are held back while
+    the global ``MAIL_RATE_LIMIT`` has been reached, see
+    :py:func:`~purchasing.tasks.reserve_email_sends`.
+
+    Arguments:
+        payload: Cache key of the message payload, or the payload itself, as
+            built by :py:meth:`~purchasing.notifications.Notification.build_payload`
+        recipients: List of email addresses, each of which gets its own message
+        job_key: Optional two-tuple of the (name, date) of the
+            :py:class:`~purchasing.jobs.job_base.JobStatus` that the batch
+            belongs to, which is updated with the outcome of the batch
+
+    See Also:
+        :py:meth:`~purchasing.notifications.Notification.send_batch`
+    '''
+    payload_ref = payload
+    if isinstance(payload, basestring):
+        payload = cache.get(payload_ref)
+        if payload is None:
+            current_app.logger.error(
+                'EMAILFAIL | Message payload {} expired before it was sent to: {}'.format(
+                    payload_ref, recipients
+                )
+            )
+            record_email_batch(job_key, False, 'Message payload expired')
+            return
+
+    wait = reserve_email_sends(len(recipients))
+    if wait:
+        if self.request.is_eager:
+            time.sleep(wait)
+        else:
+            send_email_batch.apply_async(args=(payload_ref, recipients, job_key), countdown=wait)
+            return
+
+    sent = 0
+    try:
+        with mail.connect() as conn:
+            for recipient in recipients:
+                conn.send(build_message(payload, [recipient]))
+                sent += 1
+    except Exception, e:
+        remaining = recipients[sent:]
+        if self.request.retries < self.max_retries:
+            record_email_messages(job_key, sent)
+            current_app.logger.warning(
+                'EMAILRETRY | Error: {}\nRetrying {} recipients'.format(e, len(remaining))
+            )
+            raise self.retry(
+                args=(payload_ref, remaining, job_key), exc=e,
+                countdown=self.default_retry_delay * 2 ** self.request.retries
+            )
+
+        current_app.logger.error(
+            'EMAILFAIL | Error: {}\nTo: {}'.format(e, remaining)
+        )
+        record_email_batch(job_key, False, str(e), sent)
+        return
+
+    record_email_batch(job_key, True, messages=sent)
+
+EMAIL_OUTBOX_SCHEDULED_KEY = 'email-outbox-dispatch-scheduled'
+
+def schedule_email_outbox_dispatch():
+    '''Schedule a dispatch of pending emails in the outbox
+
+    Only one dispatch is scheduled at a time, every email queued before
+    it starts is picked up by it.
+
+    Returns:
+        True if a new dispatch was scheduled, False if one was already pending
+    '''
+    if cache.add(EMAIL_OUTBOX_SCHEDULED_KEY, True, timeout=60):
+        try:
+            dispatch_email_outbox.delay()
+        except Exception:
+            # let the next commit try again
+            cache.delete(EMAIL_OUTBOX_SCHEDULED_KEY)
+            raise
+        return True
+    return False
+
+@celery.task
+def dispatch_email_outbox(batch_size=None):
+    '''Send a batch of pending emails from the outbox
+
+    Emails are claimed by marking them as sending and locking them for
+    ``EMAIL_OUTBOX_LOCK_TIMEOUT`` seconds, so concurrent dispatchers never
+    send the same email. Rows another dispatcher is claiming are skipped
+    rather than waited on. Emails that are claimed but never marked as sent,
+    for example because the worker died, are claimed again once their lock
+    expires, so every email is delivered at least once. Emails that fail
+    are retried until they have been attempted ``EMAIL_OUTBOX_MAX_ATTEMPTS``
+    times. If more emails are pending after the batch, another dispatch is
+    scheduled. The :py:class:`~purchasing.jobs.scheduler.Scheduler` also
+    sends this task every few minutes, which picks up failed emails and
+    any whose dispatch was never scheduled.
+
+    Arguments:
+        batch_size: Number of emails to claim, defaults to
+            ``EMAIL_OUTBOX_BATCH_SIZE``
+
+    Returns:
+        Two-tuple of (number of emails sent, number of emails that failed)
+
+    See Also:
+        :py:meth:`~purchasing.notifications.Notification.queue`
+    '''
+    cache.delete(EMAIL_OUTBOX_SCHEDULED_KEY)
+
+    batch_size = batch_size or current_app.config.get('EMAIL_OUTBOX_BATCH_SIZE', 100)
+    max_attempts = current_app.config.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    sent, failed = 0, 0
+
+    session = db.create_scoped_session()
+    try:
+        outbox_ids = [row[0] for row in session.execute(db.text('''
+            UPDATE email_outbox SET
+                status = 'sending', attempts = attempts + 1,
+                locked_until = (now() AT TIME ZONE 'utc') + :lock_timeout * interval '1 second'
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE status = 'pending' OR (
+                    status = 'sending' AND locked_until < (now() AT TIME ZONE 'utc')
+                )
+                ORDER BY id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        '''), {
+            'batch_size': batch_size,
+            'lock_timeout': current_app.config.get('EMAIL_OUTBOX_LOCK_TIMEOUT', 10 * 60)
+        })]
+        session.commit()
+
+        if outbox_ids:
+            emails = session.query(EmailOutbox).filter(
+                EmailOutbox.id.in_(outbox_ids)
+            ).order_by(EmailOutbox.id).all()
+
+            with mail.connect() as conn:
+                for email in emails:
+                    try:
+                        for msg in email.build_messages():
+                            conn.send(msg)
+                        email.status = 'sent'
+                        email.sent_at = datetime.datetime.utcnow()
+                        email.locked_until = None
+                        sent += 1
+                    except Exception, e:
+                        current_app.logger.error(
+                            'EMAILFAIL | Outbox email {} failed: {}'.format(email.id, e)
+                        )
+                        email.status = 'failed' if email.attempts >= max_attempts else 'pending'
+                        email.last_error = str(e)
+                        email.locked_until = None
+                        failed += 1
+                    session.commit()
+
+        remaining = session.query(
+            session.query(EmailOutbox).filter(EmailOutbox.status == 'pending').exists()
+        ).scalar()
+    except Exception, e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+        db.engine.dispose()
+
+    # failed emails are left for the scheduler's periodic dispatch, so a
+    # broken mail server doesn't keep rescheduling the same batch
+    if remaining and sent:
+        schedule_email_outbox_dispatch()
+
+    return sent, failed
+
+SEARCH_VIEW_REFRESH_SCHEDULED_KEY = 'search-view-refresh-scheduled'
+
+def schedule_search_view_refresh():
+    '''Schedule a rebuild of the queued search view rows
+
+    Refreshes are debounced: the first write in a window schedules a
+    rebuild ``SEARCH_VIEW_REFRESH_WINDOW`` seconds in the future, and
+    every other write made before that rebuild starts is picked up by it.
+    Because the scheduled flag is cleared when the rebuild starts rather
+    than when it finishes, writes that land while a rebuild is running
+    always schedule one trailing rebuild.
+
+    Returns:
+        True if a new rebuild was scheduled, False if one was already pending
+    '''
+    window = current_app.config.get('SEARCH_VIEW_REFRESH_WINDOW', 10)
+    # give the flag a generous timeout so that a lost task can't
+    # stop the search view from ever being refreshed again
+    if cache.add(SEARCH_VIEW_REFRESH_SCHEDULED_KEY, True, timeout=max(window * 6, 60)):
+        try:
+            refresh_search_view_queue.apply_async(countdown=window)
+        except Exception:
+            # let the next write try again
+            cache.delete(SEARCH_VIEW_REFRESH_SCHEDULED_KEY)
+            raise
+        return True
+    return False
+
+@celery.task
+def refresh_search_view_queue():
+    '''Rebuild the search view rows for every queued contract
+
+    Drains the ``search_view_refresh_queue`` table, rebuilds the rows for
+    the contracts that were in it, and records the time of the refresh
+    on the :py:class:`~purchasing.public.models.AppStatus`. The
+    :py:class:`~purchasing.jobs.scheduler.Scheduler` also sends this task
+    every few minutes, which picks up rows whose refresh was never scheduled.
+
+    See Also:
+        :py:func:`~purchasing.tasks.schedule_search_view_refresh`
+    '''
+    cache.delete(SEARCH_VIEW_REFRESH_SCHEDULED_KEY)
+
+    session = db.create_scoped_session()
+    try:
+        contract_ids = set(row[0] for row in session.execute(
+            db.text('DELETE FROM search_view_refresh_queue RETURNING contract_id')
+        ))
+
+        if contract_ids:
+            session.execute(
+                db.text('SELECT refresh_search_view_contracts(:contract_ids)'),
+                {'contract_ids': sorted(contract_ids)}
+            )
+
+            status = session.query(AppStatus).first()
+            if status:
+                status.last_search_view_refresh = datetime.datetime.utcnow()
+
+        session.commit()
+
+        if contract_ids:
+            from purchasing.scout.util import bump_search_view_generation
+            bump_search_view_generation()
+
+        # if anything was queued but never scheduled (for example if
+        # the cache was unavailable), make sure it gets picked up
+        remaining = session.execute(
+            db.text('SELECT EXISTS (SELECT 1 FROM search_view_refresh_queue)')
+        ).scalar()
+    except Exception, e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+        db.engine.dispose()
+
+    if remaining:
+        schedule_search_view_refresh()
+
+    return sorted(contract_ids)
+
 @celery.task
-def rebuild_search_view():
+def rebuild_search_view(contract_ids=None):
+    '''Delete and rebuild the search view rows for the passed contracts
+
+    Arguments:
+        contract_ids: List of contract ids whose rows should be rebuilt.
+            If None, the entire search view is rebuilt.
+    '''
+    session = db.create_scoped_session()
     try:
-        session = db.create_scoped_session()
         session.execute(
-            '''
-            REFRESH MATERIALIZED VIEW CONCURRENTLY search_view
-            '''
+            db.text('SELECT refresh_search_view_contracts(:contract_ids)'),
+            {'contract_ids': contract_ids}
         )
         session.commit()
-        db.engine.dispose()
+
+        from purchasing.scout.util import bump_search_view_generation
+        bump_search_view_generation()
     except Exception, e:
+        session.rollback()
         raise e
     finally:
-        cache.delete('refresh-lock')
+        session.close()
+        db.engine.dispose()
+
+@celery.task
+def run_nightly_job(name, date, ignore_time=False, token=None):
+    '''Run a single nightly job on a worker
+
+    See Also:
+        :py:func:`~purchasing.jobs.runner.run_job`
+    '''
+    from purchasing.jobs.runner import run_job
+    run_job(name, date, ignore_time, token)
 
 @celery.task
 def scrape_county_task(job):
     from purchasing.data.importer.scrape_county import main as scrape_county
+    from purchasing.jobs.job_base import JobStatus
+    from purchasing.jobs.runner import job_finished
 
     added, skipped = 0, 0
     job.update(status='started')
@@ -38,3 +393,9 @@ def scrape_county_task(job):
     except Exception, e:
         job.update(status='failed', info=str(e))
         raise e
+
+    finally:
+        # the runner returned as soon as this task was queued, so the
+        # job only has its final status now
+        if JobStatus.mark_finished(job.name, job.date):
+            job_finished(job.name, job.date)
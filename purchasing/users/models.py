@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from flask.ext.login import UserMixin, AnonymousUserMixin
 
-from purchasing.database import Column, db, Model, ReferenceCol, SurrogatePK
+from purchasing.database import Column, db, Model, ReferenceCol, SurrogatePK, ReferenceDataMixin
 from sqlalchemy.orm import backref
 
 class Role(SurrogatePK, Model):
@@ -65,7 +65,7 @@ class User(UserMixin, SurrogatePK, Model):
         foreign_keys=role_id, primaryjoin='User.role_id==Role.id'
     )
 
-    department_id = ReferenceCol('department', ondelete='SET NULL', nullable=True)
+    department_id = ReferenceCol('department', ondelete='SET NULL', nullable=True, index=True)
     department = db.relationship(
         'Department', backref=backref('users', lazy='dynamic'),
         foreign_keys=department_id, primaryjoin='User.department_id==Department.id'
@@ -168,7 +168,7 @@ class User(UserMixin, SurrogatePK, Model):
         return [i for i in cls.query.all() if i.is_conductor()]
 
 
-class Department(SurrogatePK, Model):
+class Department(ReferenceDataMixin, SurrogatePK, Model):
     '''Department model
 
     Attributes:
@@ -212,8 +212,15 @@ class Department(SurrogatePK, Model):
 
         Returns:
             list of (department id, department name) tuples
+
+        See Also:
+            The departments are cached in each process until the
+            department table changes, see
+            :py:class:`~purchasing.database.ReferenceDataMixin`
         '''
-        departments = [(i.id, i.name) for i in cls.query_factory().all()]
+        departments = cls.cached_reference_data(
+            'choices', lambda: [(i.id, i.name) for i in cls.query_factory().all()]
+        )
         if blank:
             departments = [(None, '-----')] + departments
         return departments
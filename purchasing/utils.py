@@ -48,16 +48,19 @@ def enable_triggers():
         '''.format(table=table, column=column)))
 
 def refresh_search_view():
-    '''Create and execute a refresh to the search view in a scoped session
+    '''Create and execute a full rebuild of the search view in a scoped session
     '''
     print 'Refreshing the search view...'
     session = db.create_scoped_session()
     session.execute(db.text('''
-        REFRESH MATERIALIZED VIEW CONCURRENTLY search_view
+        SELECT refresh_search_view_contracts(NULL)
     '''))
     session.commit()
     db.engine.dispose()
 
+    from purchasing.scout.util import bump_search_view_generation
+    bump_search_view_generation()
+
 def get_all_refresh_mixin_models():
     # import data models for turning off/on sqlalchemy events
     from purchasing.database import RefreshSearchViewMixin
@@ -8,6 +8,7 @@ from mock import Mock, patch
 from flask import session
 from werkzeug.datastructures import ImmutableMultiDict
 
+from purchasing.database import db
 from purchasing.users.models import User
 from purchasing.data.contracts import ContractBase
 from purchasing.data.contract_stages import ContractStage, ContractStageActionItem
@@ -17,6 +18,7 @@ from purchasing.data.flows import Flow
 from purchasing.opportunities.models import Opportunity
 from purchasing.extensions import mail
 from purchasing.conductor.util import assign_a_contract
+from purchasing.jobs.job_base import QueryCounter
 
 from purchasing_test.factories import ContractTypeFactory, DepartmentFactory, CategoryFactory
 
@@ -339,6 +341,79 @@ class TestConductor(TestConductorSetup):
         self.assertTrue(ContractStage.query.filter(ContractStage.stage_id == self.stage2.id).first().exited is None)
         self.assertTrue(ContractStage.query.filter(ContractStage.stage_id == self.stage3.id).first().exited is None)
 
+    def test_conductor_bulk_transition(self):
+        assign1 = self.assign_contract()
+        assign2 = self.assign_contract(flow=self.simple_flow, contract=self.contract2)
+        self.assertEquals(ContractStageActionItem.query.count(), 2)
+        assign_actions = [i.id for i in ContractStageActionItem.query]
+
+        bulk = self.client.post('/conductor/contracts/transition', data={
+            'contract_ids': [assign1.id, assign2.id]
+        })
+        self.assertEquals(bulk.status_code, 302)
+        self.assert_flashes('Successfully transitioned 2 contracts!', 'alert-success')
+
+        # one exit and enter for the first contract, one exit for the second
+        self.assertEquals(ContractStageActionItem.query.count(), 5)
+        self.assertEquals(assign1.current_stage_id, self.stage2.id)
+        self.assertTrue(assign1.get_current_stage().entered is not None)
+        self.assertTrue(assign2.completed_last_stage())
+
+        actions = assign1.filter_action_log()
+        self.assertEquals(
+            sorted(i.action_type for i in actions), ['entered', 'entered', 'exited']
+        )
+        self.assertEquals(
+            sorted(i.action_detail['stage_name'] for i in actions), ['stage1', 'stage1', 'stage2']
+        )
+
+        # the bulk writes fill in the audit columns themselves
+        bulk_actions = ContractStageActionItem.query.filter(
+            ~ContractStageActionItem.id.in_(assign_actions)
+        ).all()
+        self.assertEquals(len(bulk_actions), 3)
+        for action in bulk_actions:
+            self.assertTrue(action.created_at is not None)
+            self.assertEquals(action.created_by_id, self.conductor.id)
+
+        for contract_stage in [assign1.get_current_stage(), assign2.get_current_stage()]:
+            self.assertTrue(contract_stage.updated_at is not None)
+            self.assertEquals(contract_stage.updated_by_id, self.conductor.id)
+
+        # contracts that finished their flow are skipped
+        self.client.post('/conductor/contracts/transition', data={
+            'contract_ids': [assign1.id, assign2.id]
+        })
+        self.assertEquals(ContractStageActionItem.query.count(), 7)
+        self.assertEquals(assign1.current_stage_id, self.stage3.id)
+
+        # contracts that aren't in progress can't be chosen
+        self.client.post('/conductor/contracts/transition', data={
+            'contract_ids': [self.contract1.id]
+        })
+        self.assert_flashes('Choose one or more contracts in progress to transition.', 'alert-danger')
+        self.assertEquals(ContractStageActionItem.query.count(), 7)
+
+    def test_conductor_filter_action_log_queries(self):
+        assign = self.assign_contract()
+        transition_url = self.build_detail_view(assign) + '/transition'
+        self.client.get(transition_url)
+        self.client.get(transition_url)
+
+        contract_id = assign.id
+        db.session.expunge_all()
+        contract = ContractBase.query.get(contract_id)
+
+        with QueryCounter(db.engine) as queries:
+            actions = contract.filter_action_log()
+
+        self.assertEquals(queries.count, 1)
+        self.assertEquals(len(actions), 5)
+        self.assertEquals(
+            sorted(i.action_type for i in actions),
+            ['entered', 'entered', 'entered', 'exited', 'exited']
+        )
+
     def test_conductor_link_directions(self):
         assign = self.assign_contract()
         self.client.get(self.detail_view.format(assign.id, assign.get_current_stage().id) + '/transition')
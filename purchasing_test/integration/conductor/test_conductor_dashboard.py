@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from purchasing.database import db
+from purchasing.data.dashboard import ConductorDashboard, refresh_conductor_dashboard
+
+from purchasing_test.integration.conductor.test_conductor import TestConductorSetup
+from purchasing_test.util import insert_a_company
+
+class TestConductorDashboard(TestConductorSetup):
+    render_templates = False
+
+    def dashboard_row(self, contract):
+        return ConductorDashboard.query.get(contract.id)
+
+    def test_dashboard_rows_created(self):
+        row = self.dashboard_row(self.contract1)
+        self.assertEquals(row.description, 'scuba supplies')
+        self.assertEquals(row.spec_number, '123')
+        self.assertEquals(row.department_id, self.department.id)
+        self.assertTrue(row.managed_by_conductor)
+        self.assertTrue(row.is_visible)
+        self.assertFalse(row.has_children)
+        self.assertEquals(row.companies, [])
+
+        self.client.get('/conductor/')
+        _all = self.get_context_variable('_all')
+        self.assertEquals([i.id for i in _all], [self.contract1.id, self.contract2.id])
+        self.assertEquals(len(self.get_context_variable('in_progress')), 0)
+
+    def test_dashboard_assign_and_transition(self):
+        assigned = self.assign_contract()
+        db.session.commit()
+
+        row = self.dashboard_row(assigned)
+        self.assertEquals(row.parent_id, self.contract1.id)
+        self.assertEquals(row.parent_spec, '123')
+        self.assertEquals(row.assigned_to, self.conductor.id)
+        self.assertEquals(row.current_stage_id, self.stage1.id)
+        self.assertTrue(row.stage_entered is not None)
+        self.assertTrue(self.dashboard_row(self.contract1).has_children)
+
+        self.client.get('/conductor/')
+        in_progress = self.get_context_variable('in_progress')
+        self.assertEquals(len(in_progress), 1)
+        self.assertEquals(in_progress[0].stage_name, 'stage1')
+        self.assertEquals(in_progress[0].department, 'test department')
+        self.assertEquals(
+            [i.id for i in self.get_context_variable('_all')], [self.contract2.id]
+        )
+
+        self.client.get(self.build_detail_view(self.contract1) + '/transition')
+        db.session.refresh(row)
+        self.assertEquals(row.current_stage_id, self.stage2.id)
+
+    def test_dashboard_property_and_company_changes(self):
+        assigned = self.assign_contract()
+
+        self.contract1.properties[0].update(value='abc')
+        self.assertEquals(self.dashboard_row(self.contract1).spec_number, 'abc')
+        # the child shows its parent's spec number
+        self.assertEquals(self.dashboard_row(assigned).parent_spec, 'abc')
+
+        company = insert_a_company(name='scuba co', insert_contract=False)
+        company.update(contracts=[self.contract1])
+        self.assertEquals(self.dashboard_row(assigned).parent_companies, ['scuba co'])
+
+        company.update(company_name='scuba company')
+        self.assertEquals(self.dashboard_row(self.contract1).companies, ['scuba company'])
+
+    def test_dashboard_full_rebuild(self):
+        db.session.execute('delete from conductor_dashboard')
+        self.assertEquals(ConductorDashboard.query.count(), 0)
+
+        refresh_conductor_dashboard(db.session)
+        self.assertEquals(ConductorDashboard.query.count(), 2)
+        self.assertEquals(self.dashboard_row(self.contract2).spec_number, '456')
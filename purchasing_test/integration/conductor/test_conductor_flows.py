@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from flask_login import login_user
+
 from purchasing.data.flows import Flow
 from purchasing.data.stages import Stage
+from purchasing.data.contract_stages import ContractStage
 from purchasing_test.integration.conductor.test_conductor import TestConductorSetup
 
 class TestConductorFlows(TestConductorSetup):
@@ -57,6 +60,27 @@ class TestConductorFlows(TestConductorSetup):
         self.assertEquals(Flow.query.count(), 4)
         self.assertEquals(Stage.query.count(), 4)
 
+    def test_create_contract_stages(self):
+        with self.app.test_request_context():
+            login_user(self.conductor)
+            stage_order, contract_stages, revert = self.flow2.create_contract_stages(self.contract1)
+        self.assertFalse(revert)
+        self.assertEquals(stage_order, [self.stage1.id, self.stage3.id, self.stage2.id])
+        self.assertEquals([i.stage_id for i in contract_stages], stage_order)
+        self.assertEquals(self.contract1.flow_id, self.flow2.id)
+        self.assertEquals(ContractStage.query.count(), 3)
+
+        # the raw insert still fills in the audit columns
+        for contract_stage in contract_stages:
+            self.assertTrue(contract_stage.created_at is not None)
+            self.assertEquals(contract_stage.created_by_id, self.conductor.id)
+
+        # switching back into a flow reuses the existing stages
+        _, existing_stages, revert = self.flow2.create_contract_stages(self.contract1)
+        self.assertTrue(revert)
+        self.assertEquals([i.id for i in existing_stages], [i.id for i in contract_stages])
+        self.assertEquals(ContractStage.query.count(), 3)
+
     def test_conductor_flow_browse(self):
         browse = self.client.get('/conductor/flows')
         self.assert200(browse)
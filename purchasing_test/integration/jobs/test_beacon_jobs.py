@@ -4,11 +4,15 @@ import datetime
 
 from mock import patch, Mock
 
+from purchasing.app import celery
 from purchasing.extensions import mail
+from purchasing.tasks import send_email_batch
 
 from purchasing.public.models import AppStatus
+from purchasing.opportunities.models import Vendor
 from purchasing.jobs.beacon_nightly import BeaconNewOppotunityOpenJob, BeaconBiweeklyDigestJob
 from purchasing.jobs.job_base import JobStatus
+from purchasing.jobs.runner import run_job
 
 from purchasing_test.test_base import BaseTestCase
 from purchasing_test.factories import OpportunityFactory, VendorFactory, CategoryFactory, UserFactory
@@ -45,7 +49,7 @@ class TestBeaconJobs(BaseTestCase):
             categories=set([self.category]), created_by=self.admin, published_at=self.yesterday
         )
 
-        VendorFactory.create(opportunities=set([self.opportunity]))
+        self.opportunity_vendor = VendorFactory.create(opportunities=set([self.opportunity]))
         VendorFactory.create(categories=set([self.category]))
 
     def test_beacon_new_opportunity_nightly(self):
@@ -61,6 +65,47 @@ class TestBeaconJobs(BaseTestCase):
             )
             self.assertTrue(self.opportunity.publish_notification_sent)
 
+        job = JobStatus.query.first()
+        self.assertEquals(job.status, 'success')
+        self.assertEquals(job.chunks_total, 1)
+        self.assertEquals(job.chunks_sent, 1)
+        self.assertEquals(job.notifications_built, 1)
+        self.assertEquals(job.messages_sent, 2)
+
+    @patch('flask_mail.Connection.send')
+    def test_beacon_new_opportunity_partial_failure(self, send):
+        def fail_for_opportunity_vendor(message):
+            if message.recipients == [self.opportunity_vendor.email]:
+                raise Exception('something went wrong!')
+        send.side_effect = fail_for_opportunity_vendor
+
+        self.app.config['NOTIFICATION_BATCH_SIZE'] = 1
+        nightly = BeaconNewOppotunityOpenJob(time_override=True)
+        scheduled, existing_job = nightly.schedule_job()
+        nightly.run_job(scheduled)
+
+        job = JobStatus.query.first()
+        self.assertEquals(job.status, 'partial')
+        self.assertEquals(job.chunks_total, 2)
+        self.assertEquals(job.chunks_sent, 1)
+        self.assertEquals(job.chunks_failed, 1)
+        self.assertTrue('something went wrong!' in job.info)
+        self.assertEquals(job.messages_sent, 1)
+
+    def test_beacon_new_opportunity_subscribers(self):
+        both = VendorFactory.create(
+            opportunities=set([self.opportunity]), categories=set([self.category])
+        )
+        subscribers = Vendor.opportunity_subscribers([
+            self.opportunity.id, self.opportunity2.id, 999
+        ])
+
+        self.assertEquals(len(subscribers[self.opportunity.id]), 3)
+        self.assertTrue(both.email in subscribers[self.opportunity.id])
+        self.assertEquals(len(subscribers[self.opportunity2.id]), 2)
+        self.assertEquals(subscribers[999], set())
+        self.assertEquals(Vendor.opportunity_subscribers([]), {})
+
     def test_correct_nightly_opportunities_queried(self):
         nightly = BeaconNewOppotunityOpenJob(time_override=True)
         opportunities = nightly.get_opportunities()
@@ -75,15 +120,84 @@ class TestBeaconJobs(BaseTestCase):
         opportunities = biweekly.get_opportunities()
         self.assertEquals(len(opportunities), 1)
 
-    @patch('purchasing.jobs.job_base.EmailJobBase.run_job', side_effect=[JobStatus(status='skipped'), JobStatus(status='success')])
+    def test_beacon_biweekly_digest_cached(self):
+        AppStatus.create(last_beacon_newsletter=self.yesterday)
+        VendorFactory.create(subscribed_to_newsletter=True, email='foo@foo.com')
+        VendorFactory.create(subscribed_to_newsletter=True, email='bar@foo.com')
+        VendorFactory.create(subscribed_to_newsletter=False)
+
+        self.assertEquals(
+            sorted(Vendor.newsletter_subscriber_emails(batch_size=1)),
+            ['bar@foo.com', 'foo@foo.com']
+        )
+
+        biweekly = BeaconBiweeklyDigestJob()
+        notification = biweekly.build_notifications()[0]
+        self.assertEquals(sorted(notification.to_email), ['bar@foo.com', 'foo@foo.com'])
+        self.assertTrue(self.opportunity.title in notification.html_body)
+
+        # building the digest again uses the cached body
+        with patch('purchasing.jobs.beacon_nightly.render_template') as render_template:
+            self.assertEquals(
+                biweekly.build_notifications()[0].html_body, notification.html_body
+            )
+            self.assertFalse(render_template.called)
+
+        # editing an opportunity in the digest renders it again
+        self.opportunity.raw_update(title='a new title')
+        self.assertTrue('a new title' in biweekly.build_notifications()[0].html_body)
+
     @patch('purchasing.jobs.beacon_nightly.AppStatus')
-    def test_beacon_nightly_update(self, status, run_job):
-        status.query.first.return_value = AppStatus()
-        AppStatus.update = Mock()
+    def test_beacon_nightly_update(self, status):
+        current_status = Mock()
+        status.query.first.return_value = current_status
 
         biweekly = BeaconBiweeklyDigestJob()
-        biweekly.run_job(JobStatus(status='new'))
-        self.assertFalse(AppStatus.update.called)
+        biweekly.on_finish(JobStatus(status='failed'))
+        self.assertFalse(current_status.update.called)
+
+        biweekly.on_finish(JobStatus(status='partial'))
+        self.assertTrue(current_status.update.called)
+
+    def test_beacon_biweekly_advances_eager(self):
+        AppStatus.create(last_beacon_newsletter=self.yesterday)
+        VendorFactory.create(subscribed_to_newsletter=True)
+
+        job, _ = BeaconBiweeklyDigestJob(time_override=True).schedule_job()
+        name, date = job.name, job.date
+
+        # every chunk reports back while the job is still dispatching them
+        run_job(name, date, True)
+
+        job = JobStatus.query.get((name, date))
+        self.assertEquals(job.status, 'success')
+        self.assertTrue(job.finished_at is not None)
+        self.assertEquals(AppStatus.query.first().last_beacon_newsletter, job.started_at)
+
+    def test_beacon_biweekly_advances_once_sent(self):
+        AppStatus.create(last_beacon_newsletter=self.yesterday)
+        VendorFactory.create(subscribed_to_newsletter=True)
+
+        celery.conf.CELERY_ALWAYS_EAGER = False
+        self.addCleanup(setattr, celery.conf, 'CELERY_ALWAYS_EAGER', True)
+
+        job, _ = BeaconBiweeklyDigestJob(time_override=True).schedule_job()
+        name, date = job.name, job.date
+
+        # the chunks are queued, but no worker has sent them yet
+        with patch('purchasing.tasks.send_email_batch.delay') as delay:
+            run_job(name, date, True)
+
+        job = JobStatus.query.get((name, date))
+        self.assertEquals(job.status, 'sending')
+        self.assertTrue(job.finished_at is None)
+        self.assertEquals(AppStatus.query.first().last_beacon_newsletter, self.yesterday)
+
+        # a worker sends the chunks, and the last one finishes the job
+        for args, _ in delay.call_args_list:
+            send_email_batch.apply(args=args)
 
-        biweekly.run_job(JobStatus(status='new'))
-        self.assertTrue(AppStatus.update.called)
+        job = JobStatus.query.get((name, date))
+        self.assertEquals(job.status, 'success')
+        self.assertTrue(job.finished_at is not None)
+        self.assertEquals(AppStatus.query.first().last_beacon_newsletter, job.started_at)
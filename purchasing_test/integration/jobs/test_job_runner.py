@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import threading
+
+from mock import patch, Mock
+
+from purchasing.app import db
+from purchasing.jobs.job_base import JobBase, JobStatus, QueryCounter
+from purchasing.jobs.runner import (
+    dispatch_ready_jobs, claim_job, renew_lease, run_job, LeaseHeartbeat
+)
+
+from purchasing_test.test_base import BaseTestCase
+
+RUN_ORDER = []
+
+class FakeJob(JobBase):
+    def run_job(self, job):
+        RUN_ORDER.append(self.name)
+        job.update(status='success')
+
+class FirstJob(FakeJob):
+    pass
+
+class SecondJob(FakeJob):
+    depends_on = ['FirstJob']
+
+class BrokenJob(JobBase):
+    def run_job(self, job):
+        raise Exception('something went wrong!')
+
+class AfterBrokenJob(FakeJob):
+    depends_on = ['BrokenJob']
+
+class SendingJob(FakeJob):
+    def run_job(self, job):
+        RUN_ORDER.append(self.name)
+        job.update(status='started')
+        job.add_chunks(1)
+        job.finish_sending()
+
+class AfterSendingJob(FakeJob):
+    depends_on = ['SendingJob']
+
+FINISHED = []
+
+class FastChunkJob(FakeJob):
+    def run_job(self, job):
+        RUN_ORDER.append(self.name)
+        job.update(status='started')
+        job.add_chunks(2)
+        # the first chunk reports back before the second is dispatched
+        JobStatus.record_chunk(job.name, job.date, True)
+        JobStatus.record_chunk(job.name, job.date, True)
+        RUN_ORDER.append('dispatched')
+        job.finish_sending()
+
+    def on_finish(self, job):
+        FINISHED.append(job.status)
+
+class AfterFastChunkJob(FakeJob):
+    depends_on = ['FastChunkJob']
+
+class QueryingJob(FakeJob):
+    def run_job(self, job):
+        for _ in range(3):
+            db.session.execute('SELECT 1')
+        super(QueryingJob, self).run_job(job)
+
+class TestJobRunner(BaseTestCase):
+    def setUp(self):
+        super(TestJobRunner, self).setUp()
+        del RUN_ORDER[:]
+
+    def schedule(self, jobs):
+        for job in jobs:
+            job(time_override=True).schedule_job()
+
+    @patch.object(JobBase, 'jobs', [SecondJob, FirstJob])
+    def test_dependencies_run_in_order(self):
+        self.schedule([SecondJob, FirstJob])
+        dispatch_ready_jobs(ignore_time=True)
+
+        self.assertEquals(RUN_ORDER, ['FirstJob', 'SecondJob'])
+        for job in JobStatus.query.all():
+            self.assertEquals(job.status, 'success')
+            self.assertTrue(job.started_at <= job.finished_at)
+            self.assertTrue(job.duration >= 0)
+
+    @patch.object(JobBase, 'jobs', [SecondJob])
+    def test_unscheduled_dependencies_are_ignored(self):
+        self.schedule([SecondJob])
+        self.assertEquals(dispatch_ready_jobs(ignore_time=True), ['SecondJob'])
+        self.assertEquals(RUN_ORDER, ['SecondJob'])
+
+    @patch.object(JobBase, 'jobs', [BrokenJob, AfterBrokenJob, FirstJob])
+    def test_failed_dependencies(self):
+        self.schedule([BrokenJob, AfterBrokenJob, FirstJob])
+        dispatch_ready_jobs(ignore_time=True)
+
+        self.assertEquals(RUN_ORDER, ['FirstJob'])
+
+        broken = JobStatus.query.filter(JobStatus.name == 'BrokenJob').first()
+        self.assertEquals(broken.status, 'failed')
+        self.assertEquals(broken.info, 'something went wrong!')
+        self.assertTrue(broken.finished_at is not None)
+
+        after_broken = JobStatus.query.filter(JobStatus.name == 'AfterBrokenJob').first()
+        self.assertEquals(after_broken.status, 'failed')
+        self.assertEquals(after_broken.info, 'Dependencies failed: BrokenJob')
+
+    @patch.object(JobBase, 'jobs', [SendingJob, AfterSendingJob])
+    def test_dependencies_wait_for_sending(self):
+        self.schedule([SendingJob, AfterSendingJob])
+        dispatch_ready_jobs(ignore_time=True)
+        self.assertEquals(RUN_ORDER, ['SendingJob'])
+
+        sending = JobStatus.query.filter(JobStatus.name == 'SendingJob').first()
+        self.assertEquals(sending.status, 'sending')
+        self.assertTrue(sending.finished_at is None)
+        self.assertEquals(dispatch_ready_jobs(ignore_time=True), [])
+
+        # the last chunk finishes the job and releases the jobs waiting on it
+        JobStatus.record_chunk(sending.name, sending.date, False, 'something went wrong!')
+        sending = JobStatus.query.filter(JobStatus.name == 'SendingJob').first()
+        self.assertEquals(sending.status, 'failed')
+        self.assertTrue(sending.finished_at is not None)
+
+        after_sending = JobStatus.query.filter(JobStatus.name == 'AfterSendingJob').first()
+        self.assertEquals(after_sending.status, 'failed')
+        self.assertEquals(after_sending.info, 'Dependencies failed: SendingJob')
+        self.assertEquals(RUN_ORDER, ['SendingJob'])
+
+    @patch.object(JobBase, 'jobs', [FastChunkJob, AfterFastChunkJob])
+    def test_chunks_reporting_while_started(self):
+        del FINISHED[:]
+        self.schedule([FastChunkJob, AfterFastChunkJob])
+        dispatch_ready_jobs(ignore_time=True)
+
+        # the dependent job only ran once every chunk was dispatched
+        self.assertEquals(RUN_ORDER, ['FastChunkJob', 'dispatched', 'AfterFastChunkJob'])
+        self.assertEquals(FINISHED, ['success'])
+
+        job = JobStatus.query.filter(JobStatus.name == 'FastChunkJob').first()
+        self.assertEquals(job.status, 'success')
+        self.assertTrue(job.finished_at is not None)
+
+    @patch.object(JobBase, 'jobs', [FirstJob])
+    def test_jobs_only_run_once(self):
+        self.schedule([FirstJob])
+        dispatch_ready_jobs(ignore_time=True)
+        self.assertEquals(dispatch_ready_jobs(ignore_time=True), [])
+        self.assertEquals(RUN_ORDER, ['FirstJob'])
+
+    @patch.object(JobBase, 'jobs', [FirstJob])
+    def test_claims_are_exclusive(self):
+        self.schedule([FirstJob])
+        job = JobStatus.query.first()
+
+        self.assertTrue(claim_job(job.name, job.date, 'queued', 'first'))
+        self.assertFalse(claim_job(job.name, job.date, 'queued', 'second'))
+        self.assertEquals(dispatch_ready_jobs(ignore_time=True), [])
+
+        # a task holding a stale claim doesn't run the job
+        run_job(job.name, job.date, True, 'second')
+        self.assertEquals(RUN_ORDER, [])
+
+    @patch.object(JobBase, 'jobs', [FirstJob])
+    def test_expired_leases_are_reclaimed(self):
+        self.schedule([FirstJob])
+        job = JobStatus.query.first()
+        claim_job(job.name, job.date, 'queued', 'dead worker')
+
+        job.update(lease_expires_at=datetime.datetime.utcnow() - datetime.timedelta(minutes=1))
+        self.assertFalse(renew_lease(job.name, job.date, 'other worker'))
+
+        self.assertEquals(dispatch_ready_jobs(ignore_time=True), ['FirstJob'])
+        self.assertEquals(RUN_ORDER, ['FirstJob'])
+
+        job = JobStatus.query.first()
+        self.assertNotEquals(job.claimed_by, 'dead worker')
+        self.assertTrue(job.lease_expires_at is None)
+
+        # the dead worker's task can't run the job again
+        run_job(job.name, job.date, True, 'dead worker')
+        self.assertEquals(RUN_ORDER, ['FirstJob'])
+
+    @patch('purchasing.jobs.runner.logger')
+    def test_failed_lease_renewals_logged(self, logger):
+        engine = Mock()
+        engine.begin.side_effect = Exception('something went wrong!')
+
+        heartbeat = LeaseHeartbeat(engine, 'FirstJob', datetime.date.today(), 'token', 0.03)
+        heartbeat.start()
+        for _ in range(100):
+            if logger.exception.called:
+                break
+            heartbeat.stopped.wait(0.01)
+        heartbeat.stop()
+
+        self.assertTrue('FirstJob' in logger.exception.call_args[0][0])
+
+    def test_query_counter(self):
+        def other_thread():
+            with db.engine.connect() as conn:
+                conn.execute('SELECT 1')
+
+        with QueryCounter(db.engine) as queries:
+            db.session.execute('SELECT 1')
+            db.session.execute('SELECT 1')
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+
+        db.session.execute('SELECT 1')
+        self.assertEquals(queries.count, 2)
+        self.assertTrue(queries.time >= 0)
+
+    @patch.object(JobBase, 'jobs', [QueryingJob])
+    def test_job_queries_recorded(self):
+        self.schedule([QueryingJob])
+        dispatch_ready_jobs(ignore_time=True)
+
+        job = JobStatus.query.first()
+        # three queries from the job, plus updating its status
+        self.assertTrue(job.query_count > 3)
+        self.assertTrue(job.query_time >= 0)
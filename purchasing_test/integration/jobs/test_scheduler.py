@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import pytz
+
+from mock import patch, Mock
+
+from purchasing.jobs.job_base import JobBase, JobStatus
+from purchasing.jobs.scheduler import Scheduler, PERIODIC_TASKS
+from purchasing.tasks import dispatch_email_outbox, refresh_search_view_queue
+
+from purchasing_test.test_base import BaseTestCase
+
+RUN_ORDER = []
+
+class MorningJob(JobBase):
+    schedule = '0 7 * * *'
+
+    def run_job(self, job):
+        RUN_ORDER.append(self.name)
+        job.update(status='success')
+
+class HourlyJob(MorningJob):
+    schedule = '0 * * * *'
+
+class UnscheduledJob(MorningJob):
+    schedule = None
+
+def utc(*args):
+    return pytz.UTC.localize(datetime.datetime(*args))
+
+class TestScheduler(BaseTestCase):
+    def setUp(self):
+        super(TestScheduler, self).setUp()
+        del RUN_ORDER[:]
+
+    @patch.object(JobBase, 'jobs', [MorningJob, HourlyJob, UnscheduledJob])
+    def test_tick(self):
+        scheduler = Scheduler(tasks=[])
+        self.assertEquals(set(scheduler.jobs), set([MorningJob, HourlyJob]))
+
+        scheduler.reset(utc(2016, 1, 4, 11, 30))
+        self.assertEquals(scheduler.next_wakeup(), utc(2016, 1, 4, 12))
+
+        self.assertEquals(scheduler.tick(utc(2016, 1, 4, 11, 59)), [])
+        self.assertEquals(
+            sorted(scheduler.tick(utc(2016, 1, 4, 12))), ['HourlyJob', 'MorningJob']
+        )
+        self.assertEquals(sorted(RUN_ORDER), ['HourlyJob', 'MorningJob'])
+        self.assertEquals(JobStatus.query.count(), 2)
+
+        self.assertEquals(scheduler.next_runs[MorningJob], utc(2016, 1, 5, 12))
+        self.assertEquals(scheduler.next_runs[HourlyJob], utc(2016, 1, 4, 13))
+
+    @patch.object(JobBase, 'jobs', [HourlyJob])
+    def test_run(self):
+        scheduler = Scheduler(max_sleep=60, tasks=[])
+        times = [utc(2016, 1, 4, 11, 58)]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            times[0] += datetime.timedelta(seconds=seconds)
+            if len(sleeps) > 3:
+                raise StopIteration
+
+        with self.assertRaises(StopIteration):
+            scheduler.run(sleep=sleep, now=lambda: times[0])
+
+        self.assertEquals(sleeps[:2], [60, 60])
+        self.assertEquals(RUN_ORDER, ['HourlyJob'])
+
+    def test_periodic_tasks(self):
+        periodic = [task for _, task in PERIODIC_TASKS]
+        self.assertTrue(dispatch_email_outbox in periodic)
+        self.assertTrue(refresh_search_view_queue in periodic)
+
+        task = Mock()
+        task.name = 'purchasing.tasks.sweep'
+        scheduler = Scheduler(jobs=[], tasks=[('*/5 * * * *', task)])
+
+        scheduler.reset(utc(2016, 1, 4, 11, 31))
+        self.assertEquals(scheduler.next_wakeup(), utc(2016, 1, 4, 11, 35))
+
+        self.assertEquals(scheduler.tick(utc(2016, 1, 4, 11, 34)), [])
+        self.assertFalse(task.delay.called)
+
+        self.assertEquals(scheduler.tick(utc(2016, 1, 4, 11, 35)), ['purchasing.tasks.sweep'])
+        self.assertEquals(task.delay.call_count, 1)
+        self.assertEquals(scheduler.next_wakeup(), utc(2016, 1, 4, 11, 40))
+
+        # a broker outage doesn't stop the scheduler
+        task.delay.side_effect = Exception('something went wrong!')
+        self.assertEquals(scheduler.tick(utc(2016, 1, 4, 11, 40)), ['purchasing.tasks.sweep'])
+        self.assertEquals(scheduler.next_wakeup(), utc(2016, 1, 4, 11, 45))
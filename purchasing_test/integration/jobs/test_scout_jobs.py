@@ -54,3 +54,54 @@ class TestScoutJobs(BaseTestCase):
                 outbox[0].subject,
                 '[Pittsburgh Purchasing] ' + nightly.notification_props['subject']
             )
+
+    def test_scout_expiration_digest(self):
+        other_user = UserFactory.create()
+        ContractBaseFactory.create(
+            expiration_date=datetime.date.today(),
+            description='baz',
+            followers=[self.user, other_user]
+        )
+        ContractBaseFactory.create(
+            expiration_date=datetime.date.today(),
+            description='quux',
+            followers=[other_user]
+        )
+        third_user = UserFactory.create()
+        ContractBaseFactory.create(
+            expiration_date=datetime.date.today(),
+            description='corge',
+            followers=[other_user, third_user]
+        )
+
+        nightly = ScoutContractsExpireTodayJob(time_override=True)
+        followed = nightly.get_followed_contracts()
+        self.assertEquals(len(followed), 3)
+        for emails, contracts in followed:
+            if self.user.email in emails:
+                self.assertEquals(emails, [self.user.email])
+                self.assertEquals(set(i.description for i in contracts), set(['qux', 'baz']))
+
+        scheduled, existing_job = nightly.schedule_job()
+        with mail.record_messages() as outbox:
+            nightly.run_job(scheduled)
+            self.assertEquals(len(outbox), 3)
+            subjects = dict((i.recipients[0], i.subject) for i in outbox)
+            self.assertEquals(
+                subjects[self.user.email],
+                '[Pittsburgh Purchasing] ' + nightly.notification_props['digest_subject']
+            )
+            self.assertEquals(
+                subjects[third_user.email],
+                '[Pittsburgh Purchasing] ' + nightly.notification_props['subject']
+            )
+
+    def test_scout_expiration_no_digest(self):
+        ContractBaseFactory.create(
+            expiration_date=datetime.date.today(),
+            description='baz',
+            followers=[self.user]
+        )
+        nightly = ScoutContractsExpireTodayJob(time_override=True)
+        nightly.digest = False
+        self.assertEquals(len(nightly.build_notifications()), 2)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from mock import patch
+
+from purchasing.app import db
+from purchasing.extensions import mail
+from purchasing.notifications import Notification
+from purchasing.public.models import EmailOutbox
+from purchasing.tasks import dispatch_email_outbox
+
+from purchasing_test.test_base import BaseTestCase
+
+class TestEmailOutbox(BaseTestCase):
+    def setUp(self):
+        super(TestEmailOutbox, self).setUp()
+        self.app.config['EMAIL_OUTBOX_MAX_ATTEMPTS'] = 2
+
+    def queue(self, multi=False):
+        return Notification(
+            to_email=['foo@foo.com', 'bar@foo.com'], from_email='baz@foo.com',
+            subject='outbox'
+        ).queue(multi=multi)
+
+    def test_queue_sent_on_commit(self):
+        with mail.record_messages() as outbox:
+            self.queue(multi=True)
+            self.queue()
+            self.assertEquals(len(outbox), 0)
+
+            db.session.commit()
+            self.assertEquals(len(outbox), 3)
+            self.assertEquals(outbox[0].recipients, ['foo@foo.com'])
+            self.assertEquals(outbox[2].recipients, ['foo@foo.com', 'bar@foo.com'])
+            self.assertEquals(outbox[2].subject, '[Pittsburgh Purchasing] outbox')
+
+        for email in EmailOutbox.query.all():
+            self.assertEquals(email.status, 'sent')
+            self.assertEquals(email.attempts, 1)
+            self.assertTrue(email.sent_at is not None)
+
+        stats = EmailOutbox.stats()
+        self.assertEquals(stats['pending'], 0)
+        self.assertEquals(stats['sent_last_hour'], 2)
+
+    def test_queue_discarded_on_rollback(self):
+        with mail.record_messages() as outbox:
+            self.queue()
+            db.session.rollback()
+            db.session.commit()
+            self.assertEquals(len(outbox), 0)
+
+        self.assertEquals(EmailOutbox.query.count(), 0)
+
+    @patch('purchasing.tasks.dispatch_email_outbox.delay', side_effect=Exception('no broker'))
+    def test_queue_commits_without_broker(self, delay):
+        self.queue()
+        db.session.commit()
+        self.assertTrue(delay.called)
+
+        email = EmailOutbox.query.first()
+        self.assertEquals(email.status, 'pending')
+
+        # the periodic dispatch picks it up later
+        with mail.record_messages() as outbox:
+            self.assertEquals(dispatch_email_outbox(), (1, 0))
+            self.assertEquals(len(outbox), 1)
+
+    @patch('flask_mail.Connection.send', side_effect=Exception('something went wrong!'))
+    def test_failed_emails_retried(self, send):
+        self.queue()
+        db.session.commit()
+
+        email = EmailOutbox.query.first()
+        self.assertEquals(email.status, 'pending')
+        self.assertEquals(email.attempts, 1)
+        self.assertEquals(email.last_error, 'something went wrong!')
+        self.assertEquals(EmailOutbox.stats()['pending'], 1)
+
+        self.assertEquals(dispatch_email_outbox(), (0, 1))
+        db.session.refresh(email)
+        self.assertEquals(email.status, 'failed')
+        self.assertEquals(email.attempts, 2)
+        self.assertEquals(EmailOutbox.stats()['failed'], 1)
+
+        # failed emails are not picked up again
+        self.assertEquals(dispatch_email_outbox(), (0, 0))
+
+    def test_expired_claims_resent(self):
+        with patch('purchasing.notifications.schedule_email_outbox_dispatch'):
+            claimed = self.queue()
+            self.queue()
+            db.session.commit()
+
+        claimed.update(
+            status='sending', attempts=1,
+            locked_until=datetime.datetime.utcnow() + datetime.timedelta(minutes=5)
+        )
+
+        with mail.record_messages() as outbox:
+            self.assertEquals(dispatch_email_outbox(), (1, 0))
+            self.assertEquals(len(outbox), 1)
+
+            claimed.update(locked_until=datetime.datetime.utcnow() - datetime.timedelta(minutes=5))
+            self.assertEquals(dispatch_email_outbox(), (1, 0))
+            self.assertEquals(len(outbox), 2)
+
+        db.session.refresh(claimed)
+        self.assertEquals(claimed.status, 'sent')
+        self.assertEquals(claimed.attempts, 2)
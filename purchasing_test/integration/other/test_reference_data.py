@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import sqlalchemy
+
+from purchasing.app import db
+from purchasing.database import (
+    bump_reference_data_generation, get_reference_data_generation
+)
+from purchasing.users.models import Department
+from purchasing.data.contracts import ContractType
+from purchasing.opportunities.models import Category
+
+from purchasing_test.test_base import BaseTestCase
+from purchasing_test.factories import DepartmentFactory, ContractTypeFactory, CategoryFactory
+
+class TestReferenceData(BaseTestCase):
+    def setUp(self):
+        super(TestReferenceData, self).setUp()
+        self.queries = []
+        sqlalchemy.event.listen(db.engine, 'before_cursor_execute', self.count_query)
+
+        DepartmentFactory.create(name='Finance')
+        DepartmentFactory.create(name='New User')
+        db.session.commit()
+
+    def tearDown(self):
+        sqlalchemy.event.remove(db.engine, 'before_cursor_execute', self.count_query)
+        super(TestReferenceData, self).tearDown()
+
+    def count_query(self, conn, cursor, statement, *args):
+        self.queries.append(statement)
+
+    def test_choices_cached(self):
+        self.assertEquals([i[1] for i in Department.choices()], ['Finance'])
+
+        self.queries = []
+        self.assertEquals([i[1] for i in Department.choices()], ['Finance'])
+        self.assertEquals(
+            [i[1] for i in Department.choices(blank=True)], ['-----', 'Finance']
+        )
+        self.assertEquals(len(self.queries), 0)
+
+    def test_choices_invalidated_on_commit(self):
+        Department.choices()
+        generation = get_reference_data_generation('department')
+
+        department = DepartmentFactory.create(name='Law')
+        # uncommitted changes are visible in the same session
+        self.assertEquals(len(Department.choices()), 2)
+
+        db.session.commit()
+        self.assertNotEquals(get_reference_data_generation('department'), generation)
+        self.assertEquals(len(Department.choices()), 2)
+
+        department.name = 'Legal'
+        db.session.commit()
+        self.assertTrue('Legal' in [i[1] for i in Department.choices()])
+
+        db.session.delete(department)
+        db.session.commit()
+        self.assertEquals(len(Department.choices()), 1)
+
+    def test_rollback_keeps_generation(self):
+        Department.choices()
+        generation = get_reference_data_generation('department')
+
+        DepartmentFactory.create(name='Law')
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertEquals(get_reference_data_generation('department'), generation)
+        self.assertEquals(len(Department.choices()), 1)
+
+    def test_manual_invalidation(self):
+        Department.choices()
+        db.session.execute('''INSERT INTO department (id, name) VALUES (1000, 'Law')''')
+        db.session.commit()
+        self.assertEquals(len(Department.choices()), 1)
+
+        bump_reference_data_generation('department')
+        self.assertEquals(len(Department.choices()), 2)
+
+    def test_cached_objects(self):
+        ContractTypeFactory.create(name='b')
+        ContractTypeFactory.create(name='a')
+        CategoryFactory.create(category_friendly_name='test', category='parent')
+        db.session.commit()
+
+        self.assertEquals([i.name for i in ContractType.query_factory_all()], ['a', 'b'])
+        db.session.remove()
+
+        self.queries = []
+        contract_types = ContractType.query_factory_all()
+        categories = Category.all_categories()
+        self.assertEquals(len(self.queries), 0)
+
+        self.assertEquals([i.name for i in contract_types], ['a', 'b'])
+        self.assertEquals(categories[0].category_friendly_name, 'test')
+        for obj in contract_types + categories:
+            self.assertTrue(obj in db.session)
+            self.assertFalse(obj in db.session.dirty)
+
+        # instances already in the session are reused
+        loaded = ContractType.query.filter(ContractType.name == 'a').first()
+        self.assertTrue(ContractType.query_factory_all()[0] is loaded)
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 
+from mock import patch
+
 from purchasing.database import Model, RefreshSearchViewMixin, Column
 from purchasing.app import db
+from purchasing.extensions import cache
+from purchasing.data.searches import search_view_refresh_queue_table
+from purchasing.tasks import schedule_search_view_refresh, SEARCH_VIEW_REFRESH_SCHEDULED_KEY
 
 from purchasing_test.test_base import BaseTestCase
 
@@ -52,3 +57,66 @@ class TestEventHandler(BaseTestCase):
         self.assertFalse(FakeModel.called)
         fake_model.delete()
         self.assertTrue(FakeModel.called)
+
+class FakeContractModel(RefreshSearchViewMixin, Model):
+    __tablename__ = 'fakefakecontract'
+    __table_args__ = {'extend_existing': True}
+
+    id = Column(db.Integer, primary_key=True)
+    description = Column(db.String(255))
+
+    def get_search_view_contract_ids(self, connection):
+        return [self.id]
+
+class TestSearchViewRefreshQueue(BaseTestCase):
+    def setUp(self):
+        super(TestSearchViewRefreshQueue, self).setUp()
+        cache.delete(SEARCH_VIEW_REFRESH_SCHEDULED_KEY)
+
+    def queued_contract_ids(self):
+        return [i[0] for i in db.session.execute(
+            db.select([search_view_refresh_queue_table.c.contract_id]).
+            order_by(search_view_refresh_queue_table.c.id)
+        ).fetchall()]
+
+    @patch('purchasing.tasks.schedule_search_view_refresh')
+    def test_queue_after_commit(self, schedule):
+        fake_model = FakeContractModel.create(description='abcd')
+        self.assertEquals(schedule.call_count, 1)
+        self.assertEquals(self.queued_contract_ids(), [fake_model.id])
+
+        fake_model.update(description='efgh')
+        self.assertEquals(schedule.call_count, 2)
+        self.assertEquals(self.queued_contract_ids(), [fake_model.id, fake_model.id])
+
+    @patch('purchasing.tasks.schedule_search_view_refresh')
+    def test_no_queue_after_rollback(self, schedule):
+        db.session.add(FakeContractModel(description='abcd'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertFalse(schedule.called)
+        self.assertEquals(self.queued_contract_ids(), [])
+
+    @patch('purchasing.tasks.refresh_search_view_queue')
+    def test_schedule_debounced(self, refresh):
+        self.assertTrue(schedule_search_view_refresh())
+        self.assertFalse(schedule_search_view_refresh())
+        refresh.apply_async.assert_called_once_with(
+            countdown=self.app.config['SEARCH_VIEW_REFRESH_WINDOW']
+        )
+
+        # once the refresh starts, new writes schedule a trailing refresh
+        cache.delete(SEARCH_VIEW_REFRESH_SCHEDULED_KEY)
+        self.assertTrue(schedule_search_view_refresh())
+        self.assertEquals(refresh.apply_async.call_count, 2)
+
+    @patch('purchasing.tasks.refresh_search_view_queue.apply_async', side_effect=Exception('no broker'))
+    def test_queue_commits_without_broker(self, apply_async):
+        fake_model = FakeContractModel.create(description='abcd')
+        self.assertTrue(apply_async.called)
+        self.assertEquals(self.queued_contract_ids(), [fake_model.id])
+
+        # the flag is cleared, so the next write tries again
+        self.assertTrue(cache.get(SEARCH_VIEW_REFRESH_SCHEDULED_KEY) is None)
+        fake_model.update(description='efgh')
+        self.assertEquals(apply_async.call_count, 2)
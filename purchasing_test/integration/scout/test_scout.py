@@ -144,6 +144,33 @@ class TestScout(BaseTestCase):
         request = self.client.get('/scout/filter/FAKEFAKEFAKE')
         self.assertEquals(request.status_code, 404)
 
+    def test_department_filter_pagination(self):
+        self.contract1.followers = [self.admin_user, self.superadmin_user]
+        self.contract2.followers = [self.admin_user]
+        other_user = insert_a_user(email='baz@foo.com', department=DepartmentFactory())
+        self.contract2.followers.append(other_user)
+        self.contract2.followers.append(insert_a_user(email='qux@foo.com', department=DepartmentFactory()))
+        self.contract1.save()
+        self.contract2.save()
+
+        self.app.config['PER_PAGE'] = 1
+
+        self.client.get('/scout/filter/{}'.format(self.admin_user.department_id))
+        self.assertEquals(len(self.get_context_variable('results')), 1)
+        self.assertEquals(self.get_context_variable('results')[0].id, self.contract1.id)
+        self.assertEquals(self.get_context_variable('pagination').total_count, 2)
+
+        self.client.get('/scout/filter/{}?page=2'.format(self.admin_user.department_id))
+        self.assertEquals(len(self.get_context_variable('results')), 1)
+        self.assertEquals(self.get_context_variable('results')[0].id, self.contract2.id)
+        # only follows from the department are counted
+        self.assertEquals(self.get_context_variable('results')[0].follows, 1)
+        self.assertEquals(self.get_context_variable('pagination').total_count, 2)
+
+        self.client.get('/scout/filter/{}'.format(other_user.department_id))
+        self.assertEquals(len(self.get_context_variable('results')), 1)
+        self.assertEquals(self.get_context_variable('results')[0].id, self.contract2.id)
+
     def test_notes(self):
         # assert you can't take a note on a contract
         self.assertEquals(ContractNote.query.count(), 0)
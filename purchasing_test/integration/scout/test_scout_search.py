@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import json
 import datetime
 
 from purchasing.app import db
@@ -11,6 +12,8 @@ from purchasing_test.util import (
 from purchasing_test.factories import ContractTypeFactory, ContractBaseFactory, ContractPropertyFactory
 
 from purchasing.data.contracts import LineItem
+from purchasing.scout.util import search_cache_stats
+from purchasing.tasks import rebuild_search_view
 
 class TestScoutSearch(BaseTestCase):
     render_templates = True
@@ -56,9 +59,6 @@ class TestScoutSearch(BaseTestCase):
             contract_type=self.contract_type2
         )
 
-        # db.session.execute('''
-        #     REFRESH MATERIALIZED VIEW CONCURRENTLY search_view
-        # ''')
         db.session.commit()
 
     def tearDown(self):
@@ -71,7 +71,7 @@ class TestScoutSearch(BaseTestCase):
 
     def test_search(self):
         db.session.execute('''
-            REFRESH MATERIALIZED VIEW CONCURRENTLY search_view
+            SELECT refresh_search_view_contracts(NULL)
         ''')
         db.session.commit()
 
@@ -115,3 +115,179 @@ class TestScoutSearch(BaseTestCase):
         # make sure that contract types are properly handled
         self.assert200(self.client.get('/scout/search?archived=y&contract_type={}&q='.format(self.contract_type2.id)))
         self.assertEquals(len(self.get_context_variable('results')), 1)
+
+    def test_search_pagination(self):
+        db.session.execute('''
+            SELECT refresh_search_view_contracts(NULL)
+        ''')
+        db.session.commit()
+        self.app.config['PER_PAGE'] = 2
+
+        self.assert200(self.client.get('/scout/search?q='))
+        self.assertEquals(len(self.get_context_variable('results')), 2)
+        self.assertEquals(self.get_context_variable('pagination').total_count, 3)
+
+        self.assert200(self.client.get('/scout/search?q=&page=2'))
+        self.assertEquals(len(self.get_context_variable('results')), 1)
+        self.assertEquals(self.get_context_variable('pagination').total_count, 3)
+
+        # results are ordered stably across pages
+        self.assert200(self.client.get('/scout/search?q=sunfish'))
+        first_page = [i.contract_id for i in self.get_context_variable('results')]
+        self.assert200(self.client.get('/scout/search?q=sunfish&page=2'))
+        second_page = [i.contract_id for i in self.get_context_variable('results')]
+        self.assertEquals(len(set(first_page) & set(second_page)), 0)
+
+    def test_search_rank_functions(self):
+        db.session.execute('''
+            SELECT refresh_search_view_contracts(NULL)
+        ''')
+        db.session.commit()
+
+        for rank_function in ['ts_rank', 'ts_rank_cd']:
+            self.app.config['SEARCH_RANK_FUNCTION'] = rank_function
+            self.assert200(self.client.get('/scout/search?q=sunfish'))
+            results = self.get_context_variable('results')
+            self.assertEquals(len(results), 2)
+            self.assertTrue(all(i.rank > 0 for i in results))
+
+    def test_search_one_row_per_contract(self):
+        company_3 = insert_a_company(name='canoe', insert_contract=False)
+        ContractBaseFactory.create(
+            description='kayak', financial_id='345', companies=[self.company_1, company_3],
+            line_items=[LineItem(description='paddle'), LineItem(description='oar')],
+            properties=[
+                ContractPropertyFactory.create(key='foo', value='paddle'),
+                ContractPropertyFactory.create(key='bar', value='life jacket')
+            ],
+            expiration_date=datetime.datetime.today() + datetime.timedelta(1), is_archived=False,
+        )
+        db.session.commit()
+        db.session.execute('''
+            SELECT refresh_search_view_contracts(NULL)
+        ''')
+        db.session.commit()
+
+        self.assert200(self.client.get('/scout/search?q=paddle'))
+        results = self.get_context_variable('results')
+        self.assertEquals(len(results), 1)
+        self.assertEquals(sorted(results[0].company_names), ['canoe', 'ship'])
+        self.assertEquals(
+            sorted(results[0].company_ids), sorted([self.company_1.id, company_3.id])
+        )
+
+    def test_search_cache(self):
+        rebuild_search_view()
+        start = search_cache_stats()
+
+        self.assert200(self.client.get('/scout/search?q=vessel'))
+        self.assertEquals(len(self.get_context_variable('results')), 1)
+        self.assertEquals(search_cache_stats()['misses'], start['misses'] + 1)
+
+        self.assert200(self.client.get('/scout/search?q=vessel'))
+        self.assertEquals(len(self.get_context_variable('results')), 1)
+        self.assertEquals(self.get_context_variable('results')[0].contract_id, self.contract1.id)
+        self.assertEquals(search_cache_stats()['hits'], start['hits'] + 1)
+
+        # refreshing the search view invalidates the cached results
+        db.session.execute('''
+            UPDATE contract SET description = 'yacht' WHERE id = :id
+        ''', {'id': self.contract1.id})
+        db.session.commit()
+        rebuild_search_view([self.contract1.id])
+
+        self.assert200(self.client.get('/scout/search?q=vessel'))
+        self.assertEquals(len(self.get_context_variable('results')), 0)
+        self.assertEquals(search_cache_stats()['misses'], start['misses'] + 2)
+
+    def test_search_prefix_and_similar(self):
+        db.session.execute('''
+            SELECT refresh_search_view_contracts(NULL)
+        ''')
+        db.session.commit()
+
+        # partial words match as prefixes
+        self.assert200(self.client.get('/scout/search?q=sunf'))
+        self.assertEquals(len(self.get_context_variable('results')), 2)
+        self.assertFalse(self.get_context_variable('similar'))
+
+        # misspellings fall back to trigram similarity
+        self.assert200(self.client.get('/scout/search?q=sunfsh'))
+        self.assertEquals(len(self.get_context_variable('results')), 2)
+        self.assertTrue(self.get_context_variable('similar'))
+
+        self.assert200(self.client.get('/scout/search?q=sunfsh&company_name=y'))
+        self.assertEquals(len(self.get_context_variable('results')), 0)
+
+    def test_search_api(self):
+        db.session.execute('''
+            SELECT refresh_search_view_contracts(NULL)
+        ''')
+        db.session.commit()
+
+        response = self.client.get('/scout/api/search?q=sunfish')
+        self.assert200(response)
+        self.assertEquals(len(json.loads(response.data)['results']), 2)
+        self.assertEquals(json.loads(response.data)['next_cursor'], None)
+
+        # only the requested fields are returned
+        response = self.client.get('/scout/api/search?q=sunfish&fields=financial_id')
+        self.assertEquals(
+            sorted(json.loads(response.data)['results'][0].keys()),
+            ['contract_id', 'financial_id', 'rank']
+        )
+        self.assert400(self.client.get('/scout/api/search?q=sunfish&fields=password'))
+        self.assert400(self.client.get('/scout/api/search?q=sunfish&cursor=abcd'))
+
+        # walk through every result one page at a time
+        seen, cursor = [], ''
+        while cursor is not None:
+            response = json.loads(self.client.get(
+                '/scout/api/search?q=&limit=1&cursor={}'.format(cursor)
+            ).data)
+            self.assertTrue(len(response['results']) <= 1)
+            seen.extend([i['contract_id'] for i in response['results']])
+            cursor = response['next_cursor']
+        self.assertEquals(len(seen), 3)
+        self.assertEquals(len(set(seen)), 3)
+
+        response = self.client.get('/scout/api/search?q=sunfish&limit=1')
+        cursor = json.loads(response.data)['next_cursor']
+        self.assertTrue(cursor is not None)
+        response = json.loads(self.client.get(
+            '/scout/api/search?q=sunfish&limit=1&cursor={}'.format(cursor)
+        ).data)
+        self.assertEquals(len(response['results']), 1)
+        self.assertEquals(response['next_cursor'], None)
+
+        # stream everything as newline-delimited json
+        response = self.client.get('/scout/api/search?q=&stream=y')
+        self.assert200(response)
+        self.assertEquals(response.mimetype, 'application/x-ndjson')
+        self.assertEquals(len([json.loads(i) for i in response.data.splitlines()]), 3)
+
+    def test_search_api_tied_ranks(self):
+        # identical descriptions give identical ranks across the page boundaries
+        tied = [
+            ContractBaseFactory.create(
+                description='walrus tusks', financial_id=str(i), is_archived=False,
+                expiration_date=datetime.datetime.today() + datetime.timedelta(1)
+            ).id for i in range(5)
+        ]
+        db.session.commit()
+        db.session.execute('''
+            SELECT refresh_search_view_contracts(NULL)
+        ''')
+        db.session.commit()
+
+        ranks, seen, cursor = set(), [], ''
+        while cursor is not None:
+            response = json.loads(self.client.get(
+                '/scout/api/search?q=walrus&limit=2&cursor={}'.format(cursor)
+            ).data)
+            ranks.update([i['rank'] for i in response['results']])
+            seen.extend([i['contract_id'] for i in response['results']])
+            cursor = response['next_cursor']
+
+        self.assertEquals(len(ranks), 1)
+        self.assertEquals(seen, sorted(tied))
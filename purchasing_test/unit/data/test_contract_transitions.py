@@ -114,3 +114,21 @@ class TestContractTransition(ContractObjectTestBase):
         self.assertTrue(_get.called_once)
         self.assertEquals(self.active_contract.current_stage_id, self.stage1.id)
 
+
+    def test_flow_stage_positions(self):
+        self.assertEquals(self.flow1.stage_positions, {
+            self.stage1.id: 0, self.stage2.id: 1, self.stage3.id: 2
+        })
+
+        contract_stage = ContractStage(stage_id=self.stage2.id, flow=self.flow1)
+        self.assertTrue(contract_stage.happens_before(self.stage3.id))
+        self.assertFalse(contract_stage.happens_before(self.stage2.id))
+        self.assertTrue(contract_stage.happens_before_or_on(self.stage2.id))
+        self.assertTrue(contract_stage.happens_after(self.stage1.id))
+        self.assertFalse(contract_stage.happens_before(-1))
+
+        # setting a new stage order rebuilds the positions
+        self.flow1.stage_order = [self.stage3.id, self.stage2.id, self.stage1.id]
+        self.assertEquals(self.flow1.stage_positions[self.stage3.id], 0)
+        self.assertFalse(contract_stage.happens_before(self.stage3.id))
+        self.assertTrue(contract_stage.happens_after(self.stage3.id))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import pytz
+
+from unittest import TestCase
+
+from purchasing.jobs.cron import CronSchedule, CronParseError, parse_field
+from purchasing.jobs.job_base import EASTERN
+
+def utc(*args):
+    return pytz.UTC.localize(datetime.datetime(*args))
+
+class TestCron(TestCase):
+    def test_parse_field(self):
+        self.assertEquals(parse_field('*', 0, 5), [0, 1, 2, 3, 4, 5])
+        self.assertEquals(parse_field('*/15', 0, 59), [0, 15, 30, 45])
+        self.assertEquals(parse_field('1-3,10', 0, 59), [1, 2, 3, 10])
+        self.assertEquals(parse_field('0-30/10', 0, 59), [0, 10, 20, 30])
+        self.assertEquals(parse_field('5/20', 0, 59), [5, 25, 45])
+
+        for bad in ['60', '5-1', 'a', '*/0', '1-b']:
+            with self.assertRaises(CronParseError):
+                parse_field(bad, 0, 59)
+
+        with self.assertRaises(CronParseError):
+            CronSchedule('0 7 * *')
+
+    def test_next_after(self):
+        schedule = CronSchedule('30 7 * * *')
+        self.assertEquals(schedule.next_after(utc(2016, 1, 4, 7, 0)), utc(2016, 1, 4, 7, 30))
+        # runs are strictly after the passed time
+        self.assertEquals(schedule.next_after(utc(2016, 1, 4, 7, 30)), utc(2016, 1, 5, 7, 30))
+
+        twice_a_month = CronSchedule('0 7 1,15 * *')
+        self.assertEquals(twice_a_month.next_after(utc(2016, 1, 4)), utc(2016, 1, 15, 7))
+        self.assertEquals(twice_a_month.next_after(utc(2016, 1, 31, 8)), utc(2016, 2, 1, 7))
+
+        self.assertTrue(CronSchedule('0 0 31 2 *').next_after(utc(2016, 1, 1)) is None)
+
+    def test_weekdays(self):
+        # january 4th 2016 is a monday
+        weekdays = CronSchedule('0 9 * * 1-5')
+        self.assertEquals(weekdays.next_after(utc(2016, 1, 1, 10)), utc(2016, 1, 4, 9))
+
+        sunday = CronSchedule('0 9 * * 7')
+        self.assertEquals(sunday.next_after(utc(2016, 1, 4)), utc(2016, 1, 10, 9))
+
+        # restricting both the day of the month and week matches either
+        either = CronSchedule('0 9 15 * 1')
+        self.assertEquals(either.next_after(utc(2016, 1, 5)), utc(2016, 1, 11, 9))
+        self.assertEquals(either.next_after(utc(2016, 1, 12)), utc(2016, 1, 15, 9))
+
+    def test_timezones(self):
+        schedule = CronSchedule('0 7 * * *', EASTERN)
+        # standard time
+        self.assertEquals(schedule.next_after(utc(2016, 1, 4)), utc(2016, 1, 4, 12))
+        # daylight savings time
+        self.assertEquals(schedule.next_after(utc(2016, 7, 4)), utc(2016, 7, 4, 11))
+        # across the change
+        self.assertEquals(schedule.next_after(utc(2016, 3, 12, 13)), utc(2016, 3, 13, 11))
@@ -70,10 +70,10 @@ class TestEmailJobBase(TestCase):
         self.job = job_mock
 
         notification_mock = Mock()
-        notification_mock.send = Mock()
+        notification_mock.send_batch = Mock()
 
         notification_fail = Mock()
-        notification_fail.send = Mock(side_effect=Exception('something went wrong!'))
+        notification_fail.send_batch = Mock(side_effect=Exception('something went wrong!'))
 
         self.success_notification = notification_mock
         self.failure_notification = notification_fail
@@ -86,7 +86,11 @@ class TestEmailJobBase(TestCase):
         send_mock.return_value = [self.success_notification, self.success_notification]
         FakeEmailJob.build_notifications = send_mock
 
-        expected_updates = [call.update(status='started'), call.update(status='success')]
+        expected_updates = [
+            call.update(status='started', chunks_total=0, chunks_sent=0, chunks_failed=0),
+            call.update(notifications_built=2),
+            call.finish_sending()
+        ]
 
         FakeEmailJob().run_job(self.job)
 
@@ -98,7 +102,8 @@ class TestEmailJobBase(TestCase):
         FakeEmailJob.build_notifications = send_mock
 
         expected_updates = [
-            call.update(status='started'),
+            call.update(status='started', chunks_total=0, chunks_sent=0, chunks_failed=0),
+            call.update(notifications_built=2),
             call.update(status='failed', info='something went wrong!')
         ]
 
@@ -114,3 +114,44 @@ class TestNotification(TestCase):
         notification.send(multi=False)
         self.assertTrue(notification.build_msg.called)
         self.assertEquals(notification.build_msg.call_count, 1)
+
+    @patch('purchasing.notifications.cache')
+    @patch('purchasing.notifications.current_app')
+    @patch('purchasing.notifications.send_email_batch.delay')
+    @patch('purchasing.notifications.render_template', return_value='a test')
+    def test_notification_send_batch(self, render_template, send_email_batch, current_app, cache):
+        '''Test batch sends store the payload once and chunk the recipients
+        '''
+        current_app.config = {'NOTIFICATION_BATCH_SIZE': 2}
+        cache.get.return_value = {'subject': 'a test'}
+
+        notification = Notification(
+            to_email=['foo{}@foo.com'.format(i) for i in range(5)], from_email='foo@foo.com'
+        )
+        notification.build_msg = Mock()
+
+        batches = notification.send_batch()
+        self.assertFalse(notification.build_msg.called)
+        self.assertEquals([len(i) for i in batches], [2, 2, 1])
+
+        self.assertEquals(cache.set.call_count, 1)
+        payload_key = cache.set.call_args[0][0]
+        self.assertEquals(cache.set.call_args[0][1]['html'], 'a test')
+
+        self.assertEquals(send_email_batch.call_count, 3)
+        for args, kwargs in send_email_batch.call_args_list:
+            self.assertEquals(args[0], payload_key)
+
+    @patch('purchasing.notifications.cache')
+    @patch('purchasing.notifications.current_app')
+    @patch('purchasing.notifications.send_email_batch.delay')
+    @patch('purchasing.notifications.render_template', return_value='a test')
+    def test_notification_send_batch_no_cache(self, render_template, send_email_batch, current_app, cache):
+        '''Test batch sends pass the payload directly if the cache can't store it
+        '''
+        current_app.config = {}
+        cache.get.return_value = None
+
+        notification = Notification(to_email=['foobar@foo.com'], from_email='foo@foo.com')
+        notification.send_batch()
+        self.assertEquals(send_email_batch.call_args[0][0]['html'], 'a test')